@@ -1,5 +1,5 @@
 import streamlit as st
-import pandas as pd
+from iep.loader import load_data as read_workbook
 from functions import config_figure
 import plotly.express as px
 from css import app_css  # Import CSS as a string
@@ -10,8 +10,8 @@ st.markdown(app_css, unsafe_allow_html=True)
 ###########
 @st.cache_data
 def load_data():
-    # Load data from the Excel file
-    df = pd.read_excel("data/IEP_2017_2018_Stations.xlsx")
+    # Load data from the Excel file (via the Parquet cache)
+    df = read_workbook("data/IEP_2017_2018_Stations.xlsx")
     return df
 
 
@@ -0,0 +1,131 @@
+"""Profile import time and check that heavy dependencies stay lazy.
+
+Each entry module (what the server imports before any page runs) is
+imported in a fresh interpreter with ``python -X importtime``; the table
+lists the top-level packages with the largest import time (self time of
+all their modules). Each page is
+then run once in a fresh interpreter with Streamlit's AppTest, timing its
+first run (cold imports included) and recording which of ``LAZY_MODULES``
+it loaded.
+
+The heavy dependencies are only imported where they are used (statsmodels
+for the OLS report, scipy for regression bands, gsw for isopycnals and
+.cnv ingestion, kaleido for the atlas, plotly.express for the maps and the
+heatmap). The script exits with status 1 when an entry module imports one
+of them, or a page loads one that is not in its ``PAGE_MODULES`` entry.
+
+Usage:
+    python benchmarks/import_time.py [--top 15] [--output profile.csv]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)
+
+ENTRY_MODULES = ["iep", "iep.store", "functions"]
+PAGES = ["about.py", "data_explorer.py", "watermasses.py", "mld.py"]
+LAZY_MODULES = ["statsmodels", "scipy", "gsw", "kaleido", "plotly.express"]
+# Lazy modules each page may load on its first run with default widgets
+PAGE_MODULES = {
+    "about.py": {"plotly.express"},
+    "data_explorer.py": {"plotly.express"},
+    "watermasses.py": {"plotly.express", "gsw"},
+    "mld.py": {"plotly.express"},
+}
+
+PAGE_RUN = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file({page!r}, default_timeout=120).run()
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "exceptions": [e.value for e in at.exception],
+    "modules": [m for m in {lazy!r} if m in sys.modules],
+}}))
+"""
+
+
+def import_profile(module):
+    """(module, self ms, cumulative ms) of every import made by ``module``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((name.strip(), int(self_us) / 1e3, int(cumulative_us) / 1e3))
+    return rows
+
+
+def page_first_run(page):
+    """First-run seconds, exceptions and lazy modules loaded by ``page``."""
+    result = subprocess.run(
+        [sys.executable, "-c", PAGE_RUN.format(page=page, lazy=LAZY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15, help="Slowest packages listed per entry module")
+    parser.add_argument("--output", help="Also write every entry module's import profile to this CSV")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    failures = []
+    profiles = []
+    for module in ENTRY_MODULES:
+        profile = pd.DataFrame(import_profile(module), columns=["module", "self_ms", "cumulative_ms"])
+        profile.insert(0, "entry", module)
+        profiles.append(profile)
+        total = profile.loc[profile["module"] == module, "cumulative_ms"].iloc[-1]
+        print(f"\nimport {module}: {total:.0f} ms, {len(profile)} modules")
+        packages = profile.groupby(profile["module"].str.split(".").str[0])["self_ms"]
+        print(packages.agg(["sum", "count"]).nlargest(args.top, "sum").round(1).to_string())
+        loaded = [
+            lazy
+            for lazy in LAZY_MODULES
+            if (profile["module"] == lazy).any()
+        ]
+        if loaded:
+            failures.append(f"import {module} loads {', '.join(loaded)}")
+
+    print()
+    for page in PAGES:
+        run = page_first_run(page)
+        print(f"{page:<18} first run {run['seconds']:.2f}s, lazy modules: {', '.join(run['modules']) or '-'}")
+        if run["exceptions"]:
+            failures.append(f"{page} raised {run['exceptions']}")
+        unexpected = set(run["modules"]) - PAGE_MODULES[page]
+        if unexpected:
+            failures.append(f"{page} loads {', '.join(sorted(unexpected))} on its first run")
+
+    if args.output:
+        pd.concat(profiles).to_csv(args.output, index=False)
+    if failures:
+        print("\nImport regressions:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nHeavy dependencies are only loaded where they are used.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Load-test the dashboard with concurrent scripted sessions.
+
+Each simulated session opens main.py, then works through the pages the way
+a user does: it changes the grid, season and year multiselects one at a
+time, switches the data explorer to the regression diagram and toggles the
+trend line, colours the T-S diagram by water mass and maps the MLD at all
+stations, pausing ``--think`` seconds on average between actions.
+``--sessions`` sessions run in parallel threads of one process, sharing the
+st.cache_data/st.cache_resource caches and the figure cache as the sessions
+of one server do.
+
+Streamlit 1.36's AppTest does not run the pages of ``st.navigation``, so
+a session runs each page script directly (one AppTest per page, created on
+its first visit) with the depth resolution main.py would set. AppTest
+installs a process-wide mock runtime for each run, so runs cannot overlap:
+they take turns, and a rerun's latency is the time from the "click" until
+it finished, waiting included (``service`` is its own run time). On a
+server the script threads of concurrent sessions share one GIL as well.
+
+Reports latency percentiles per page and action, peak RSS, the hit rate of
+every cached function and of the figure cache, and the p50/p95 of the
+pages' timing spans (iep.timing). With ``--scale`` the sessions run
+against a synthetic store (iep.synthetic) in a temporary folder instead of
+the workbooks in data/, so no network or real data is needed.
+
+Usage:
+    python benchmarks/load_test.py [--sessions 8] [--rounds 2] [--scale 10x] [--output latencies.csv]
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import pandas as pd  # noqa: E402
+import streamlit  # noqa: E402
+from streamlit.runtime.caching.cache_utils import CachedFunc  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from functions import DEPTH_RESOLUTIONS  # noqa: E402
+from iep.store import STORE_DIR, add_to_store, read_catalog, update_catalog  # noqa: E402
+from iep.synthetic import SCALES, STATIONS_FILE, synthetic_ctd  # noqa: E402
+from iep.timing import RerunTimings, TimingSink  # noqa: E402
+
+PAGES = ["data_explorer.py", "watermasses.py", "mld.py", "about.py"]
+# Grids a session selects at a time
+MAX_GRIDS = 3
+# AppTest's mock runtime is process-wide: one script run at a time
+RUN_LOCK = threading.Lock()
+# Private cache handlers count_cache_calls wraps, and the version they match
+CACHE_HANDLERS = ["_handle_cache_hit", "_handle_cache_miss"]
+STREAMLIT_TESTED = "1.36"
+
+
+def count_cache_calls():
+    """Count hits and misses of every cached function, by function name.
+
+    A miss that waited for another session to compute the same value is
+    still counted as a miss. Streamlit has no public hook for cache hits,
+    so this wraps the private ``CachedFunc`` handlers of Streamlit 1.36
+    and fails when they are missing.
+    """
+    missing = [name for name in CACHE_HANDLERS if not callable(getattr(CachedFunc, name, None))]
+    if missing:
+        raise RuntimeError(
+            f"Streamlit {streamlit.__version__} has no CachedFunc.{', CachedFunc.'.join(missing)}; "
+            f"cache counting needs Streamlit {STREAMLIT_TESTED}"
+        )
+    counts = defaultdict(Counter)
+    lock = threading.Lock()
+    handle_hit, handle_miss = CachedFunc._handle_cache_hit, CachedFunc._handle_cache_miss
+
+    def hit(self, *args):
+        with lock:
+            counts[self._info.func.__qualname__]["hits"] += 1
+        return handle_hit(self, *args)
+
+    def miss(self, *args):
+        with lock:
+            counts[self._info.func.__qualname__]["misses"] += 1
+        return handle_miss(self, *args)
+
+    CachedFunc._handle_cache_hit = hit
+    CachedFunc._handle_cache_miss = miss
+    return counts
+
+
+def _figure_cache_stats():
+    # Run as an app: outside a script run st.cache_resource does not return
+    # the instance the sessions share
+    import streamlit as st
+
+    from functions import get_figure_cache
+
+    st.session_state.stats = get_figure_cache().stats()
+
+
+def synthetic_store(scale, folder):
+    """Write a synthetic store under ``folder``/data/store for the sessions."""
+    stations = pd.read_excel(STATIONS_FILE)
+    data_dir = Path(folder) / STATIONS_FILE.parent
+    data_dir.mkdir(parents=True)
+    # The about page reads the station list
+    stations.to_excel(data_dir / STATIONS_FILE.name, index=False)
+    root = Path(folder) / STORE_DIR
+    update_catalog(add_to_store(synthetic_ctd(scale, stations), "synthetic", root), root)
+
+
+class Session:
+    """One simulated browser session: an AppTest per visited page."""
+
+    def __init__(self, number, rng, options, bin_size, sink, think):
+        self.id = f"session-{number}"
+        self.rng = rng
+        self.options = options
+        self.bin_size = bin_size
+        self.sink = sink
+        self.think = think
+        self.apps = {}
+        self.latencies = []  # (page, action, seconds, service seconds)
+
+    def run(self, page, action, change=None):
+        # ``change`` (a widget edit) is made under the lock too: Streamlit
+        # warns about state changes while another session's run is active
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+        start = time.perf_counter()
+        with RUN_LOCK:
+            started = time.perf_counter()
+            if page not in self.apps:
+                self.apps[page] = AppTest.from_file(page, default_timeout=300)
+            app = self.apps[page]
+            if change is not None:
+                change(app)
+            # What main.py sets before it runs the page
+            app.session_state["bin_size"] = self.bin_size
+            app.session_state["rerun_timings"] = RerunTimings(page, self.sink, self.id)
+            app.run()
+        end = time.perf_counter()
+        self.latencies.append((page, action, end - start, end - started))
+        if app.exception:
+            raise RuntimeError(f"{self.id} {page} {action}: {app.exception[0].value}")
+
+    def open(self, page):
+        self.run(page, "revisit" if page in self.apps else "open")
+
+    def set(self, page, kind, label, value, action=None):
+        # Set the first widget of ``kind`` whose label starts with ``label``
+        widgets = [w for w in getattr(self.apps[page], kind) if w.label.startswith(label)]
+        if widgets:
+            self.run(page, action or label, lambda app: widgets[0].set_value(value))
+
+    def choose(self, name, most):
+        options = self.options[name]
+        return self.rng.sample(options, self.rng.randint(1, min(most, len(options))))
+
+    def select_casts(self, page):
+        self.set(page, "multiselect", "Select Grid(s)", self.choose("grids", MAX_GRIDS), "grids")
+        if page != "watermasses.py":
+            self.set(page, "multiselect", "Select Season(s)", self.choose("seasons", 2), "seasons")
+            self.set(page, "multiselect", "Select Year(s)", self.choose("years", 2), "years")
+
+    def round(self):
+        self.open("main.py")
+        for page in self.rng.sample(PAGES, len(PAGES)):
+            self.open(page)
+            if page == "data_explorer.py":
+                self.select_casts(page)
+                self.set(page, "radio", "Choose a Figure", "Regression Diagram", "regression diagram")
+                trend = self.rng.choice(["Yes", "No"])
+                self.set(page, "radio", "Add Trend", trend, f"trend {trend}")
+            elif page == "watermasses.py":
+                self.select_casts(page)
+                self.set(page, "radio", "Colour samples by", "Water mass", "colour by water mass")
+            elif page == "mld.py":
+                self.select_casts(page)
+                self.set(page, "checkbox", "Map MLD at all stations", True, "map all stations")
+
+
+def run_session(number, rounds, seed, options, bin_size, sink, think):
+    session = Session(number, random.Random(seed + number), options, bin_size, sink, think)
+    for _ in range(rounds):
+        session.round()
+    return session.latencies
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def percentiles(latencies):
+    """Count, p50, p95 and max in milliseconds per (page, action)."""
+    groups = (latencies[["seconds", "service"]] * 1e3).groupby(
+        [latencies["page"], latencies["action"]], sort=False
+    )
+    return pd.DataFrame(
+        {
+            "count": groups.size(),
+            "p50_ms": groups["seconds"].quantile(0.5),
+            "p95_ms": groups["seconds"].quantile(0.95),
+            "max_ms": groups["seconds"].max(),
+            "service_p50_ms": groups["service"].quantile(0.5),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions")
+    parser.add_argument("--rounds", type=int, default=2, help="Tours of all pages per session")
+    parser.add_argument("--scale", help="Run against a synthetic store, from " + ", ".join(SCALES))
+    parser.add_argument("--depth-resolution", default=list(DEPTH_RESOLUTIONS)[0], choices=list(DEPTH_RESOLUTIONS))
+    parser.add_argument("--think", type=float, default=0.5, help="Mean pause between actions [s]")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write every request's latency to this CSV file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.scale:
+            synthetic_store(SCALES[args.scale], tmp_dir)
+            # The pages find the store and the station list relative to here
+            os.chdir(tmp_dir)
+            for page in ["main.py", *PAGES]:
+                Path(page).symlink_to(ROOT / page)
+        counts = count_cache_calls()
+        sink = TimingSink()
+        # The sessions' choices come from the catalog the server would build
+        AppTest.from_file("main.py", default_timeout=600).run()
+        if not counts:
+            raise RuntimeError(
+                f"No cache calls counted on Streamlit {streamlit.__version__}; "
+                f"count_cache_calls needs Streamlit {STREAMLIT_TESTED}"
+            )
+        catalog = read_catalog()
+        options = {
+            "grids": sorted(catalog["Grid"].unique()),
+            "seasons": sorted(catalog["season"].unique()),
+            "years": sorted(int(year) for year in catalog["year"].unique()),
+        }
+        bin_size = DEPTH_RESOLUTIONS[args.depth_resolution]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.sessions) as pool:
+            results = list(
+                pool.map(
+                    lambda number: run_session(
+                        number, args.rounds, args.seed, options, bin_size, sink, args.think
+                    ),
+                    range(args.sessions),
+                )
+            )
+        elapsed = time.perf_counter() - start
+        figure_stats = AppTest.from_function(_figure_cache_stats).run().session_state.stats
+        os.chdir(ROOT)
+
+    latencies = pd.DataFrame(
+        [row for rows in results for row in rows], columns=["page", "action", "seconds", "service"]
+    )
+    total = latencies["seconds"] * 1e3
+    print(
+        f"{args.sessions} sessions x {args.rounds} rounds: {len(latencies)} reruns in "
+        f"{elapsed:.1f}s ({len(latencies) / elapsed:.1f}/s), {len(catalog)} casts"
+    )
+    print(
+        f"all reruns: p50 {total.quantile(0.5):.0f} ms, p95 {total.quantile(0.95):.0f} ms, "
+        f"max {total.max():.0f} ms; peak RSS {peak_rss_mb():.0f} MB"
+    )
+    print()
+    print(percentiles(latencies).round(1).to_string())
+
+    caches = pd.DataFrame.from_dict(counts, orient="index").reindex(columns=["hits", "misses"]).fillna(0)
+    caches["hit_rate"] = caches["hits"] / (caches["hits"] + caches["misses"])
+    print()
+    print(caches.astype({"hits": int, "misses": int}).sort_index().round(3).to_string())
+    print(
+        f"figure cache: {figure_stats['hits']} hits / {figure_stats['misses']} misses "
+        f"({figure_stats['hit_rate']:.0%}), {figure_stats['entries']} figures, "
+        f"{figure_stats['size_mb']:.1f} MB, {figure_stats['evictions']} evicted"
+    )
+    print()
+    print(sink.summary().round(1).to_string(index=False))
+
+    if args.output:
+        latencies.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
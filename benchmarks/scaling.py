@@ -0,0 +1,175 @@
+"""Time the compute stages of the dashboard on growing synthetic datasets.
+
+Generates synthetic CTD data (iep.synthetic) at each requested scale of the
+2017-2018 workbook and times, best of ``--repeat`` runs: loading (Parquet,
+and Excel with ``--excel``), reading a fixed selection from the partitioned
+store (iep.store), preparation, filtering, profile extraction, MLD,
+isopycnal grids, water mass labelling, correlation statistics and T-S
+figure serialisation. Prints one table of seconds per stage and scale plus
+the scaling exponent of each stage (1.0 = linear in rows).
+
+Usage:
+    python benchmarks/scaling.py [--scales 1x,10x,100x] [--repeat 3] [--output results.csv]
+
+1000x is about 130 million rows and needs roughly 20 GB of memory.
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import pandas as pd  # noqa: E402
+import plotly.graph_objects as go  # noqa: E402
+import plotly.io as pio  # noqa: E402
+
+from iep.classification import classify_water_masses  # noqa: E402
+from iep.correlation import CorrelationStats  # noqa: E402
+from iep.filters import select  # noqa: E402
+from iep.isopycnals import ISOPYCNAL_RESOLUTIONS, isopycnal_bounds, isopycnal_grid  # noqa: E402
+from iep.loader import memory_mb, prepare_dataset  # noqa: E402
+from iep.lod import DEFAULT_MAX_POINTS, density_bin, scatter_trace_type  # noqa: E402
+from iep.mixed_layer import MLD_METHODS, mld_table  # noqa: E402
+from iep.profiles import ProfileIndex  # noqa: E402
+from iep.store import add_to_store, read_store  # noqa: E402
+from iep.synthetic import SCALES, synthetic_ctd  # noqa: E402
+
+# Largest dataset written to Excel with --excel (openpyxl is slow)
+EXCEL_MAX_ROWS = 300_000
+
+
+def best_time(func, repeat):
+    """Fastest of ``repeat`` calls of ``func``, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def ts_figure_json(data):
+    # What the water masses page sends: binned T-S scatter, serialised to JSON
+    plot_data = density_bin(
+        data, "Salinity [psu]", "Temperature [ITS90,°C]", DEFAULT_MAX_POINTS
+    )
+    Scatter = scatter_trace_type(len(plot_data))
+    fig = go.Figure(
+        Scatter(
+            x=plot_data["Salinity [psu]"],
+            y=plot_data["Temperature [ITS90,°C]"],
+            mode="markers",
+            customdata=plot_data["count"],
+        )
+    )
+    return pio.to_json(fig)
+
+
+def run_scale(scale, repeat, excel, tmp_dir):
+    """Seconds per stage for one scale, plus the row count and memory in MB."""
+    timings = {}
+    start = time.perf_counter()
+    raw = synthetic_ctd(scale)
+    timings["generate"] = time.perf_counter() - start
+
+    parquet_file = Path(tmp_dir) / f"synthetic-{scale}x.parquet"
+    raw.to_parquet(parquet_file, index=False)
+    timings["load (Parquet)"] = best_time(lambda: pd.read_parquet(parquet_file), repeat)
+    if excel and len(raw) <= EXCEL_MAX_ROWS:
+        excel_file = Path(tmp_dir) / f"synthetic-{scale}x.xlsx"
+        raw.to_excel(excel_file, index=False)
+        timings["load (Excel)"] = best_time(lambda: pd.read_excel(excel_file), 1)
+
+    grids = raw["Grid"].unique()[:5]
+    seasons = raw["season"].unique()[:1]
+    years = raw["datetime"].dt.year.unique()[:1]
+    # Same casts at every scale, so this should not grow with the archive
+    store_dir = Path(tmp_dir) / f"store-{scale}x"
+    add_to_store(raw, "synthetic", store_dir)
+    timings["store read (5 casts)"] = best_time(
+        lambda: read_store(store_dir, grids=grids, seasons=seasons, years=years), repeat
+    )
+
+    timings["prepare"] = best_time(lambda: prepare_dataset(raw), repeat)
+    data = prepare_dataset(raw)
+
+    timings["filter"] = best_time(
+        lambda: select(data, grids=grids, seasons=seasons, years=years), repeat
+    )
+
+    def extract_profiles():
+        index = ProfileIndex(data)
+        return [index.get(grid, seasons[0], years[0]) for grid in grids]
+
+    timings["profile extraction"] = best_time(extract_profiles, repeat)
+    index = ProfileIndex(data)
+    timings["MLD (all methods)"] = best_time(
+        lambda: [mld_table(index, method) for method in MLD_METHODS], repeat
+    )
+    sal_step, temp_step = ISOPYCNAL_RESOLUTIONS["Fine"]
+    timings["isopycnal grid (Fine)"] = best_time(
+        lambda: isopycnal_grid(
+            *isopycnal_bounds(data, sal_step, temp_step), sal_step, temp_step
+        ),
+        repeat,
+    )
+    timings["water mass labels"] = best_time(lambda: classify_water_masses(data), repeat)
+    timings["correlation stats"] = best_time(
+        lambda: CorrelationStats(data).by_station(), repeat
+    )
+    timings["T-S figure JSON"] = best_time(lambda: ts_figure_json(data), repeat)
+
+    memory = {"compact": memory_mb(data), "wide": memory_mb(prepare_dataset(raw, compact=False))}
+    return timings, len(data), memory
+
+
+def scaling_exponent(rows, seconds):
+    """Slope of log(time) against log(rows) between the smallest and largest run."""
+    (r0, t0), (r1, t1) = (rows[0], seconds[0]), (rows[-1], seconds[-1])
+    if r1 <= r0 or t0 <= 0 or t1 <= 0:
+        return float("nan")
+    return math.log(t1 / t0) / math.log(r1 / r0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1x,10x,100x", help="Comma-separated, from " + ", ".join(SCALES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--excel", action="store_true", help="Also time Excel loads (small scales only)")
+    parser.add_argument("--output", help="Write the results to this CSV file")
+    args = parser.parse_args()
+
+    results, rows = {}, []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label in args.scales.split(","):
+            scale = SCALES[label.strip()]
+            timings, n_rows, memory = run_scale(scale, args.repeat, args.excel, tmp_dir)
+            results[f"{label.strip()} ({n_rows:,} rows)"] = timings
+            rows.append(n_rows)
+            print(
+                f"{label.strip()}: {n_rows:,} rows, {memory['compact']:,.0f} MB in memory "
+                f"({memory['wide']:,.0f} MB without the compact schema)",
+                flush=True,
+            )
+
+    table = pd.DataFrame(results)
+    if len(rows) > 1:
+        table["scaling exponent"] = [
+            scaling_exponent(rows, table.loc[stage].iloc[: len(rows)].to_numpy())
+            for stage in table.index
+        ]
+    table.index.name = "stage [s]"
+    print(table.to_string(float_format=lambda x: f"{x:.4f}"))
+    if args.output:
+        table.to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure memory per concurrent browser session.
+
+Simulates N sessions in one process with Streamlit's AppTest: each session
+runs a page script, which reads its default selection from the partitioned
+store (functions.get_selection), and all sessions are kept alive so their
+session state stays resident. Reports resident memory after each session,
+and how the default selection compares in size with the whole store.
+
+Usage:
+    python benchmarks/session_memory.py [--sessions 20] [--page data_explorer.py]
+"""
+
+import argparse
+import gc
+import os
+import resource
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from iep.loader import memory_mb, prepare_dataset  # noqa: E402
+from iep.store import STORE_DIR, read_store  # noqa: E402
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def open_session(page):
+    page_app = AppTest.from_file(page, default_timeout=300)
+    page_app.run()
+    if page_app.exception:
+        raise RuntimeError(page_app.exception[0].value)
+    return page_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--page", default="data_explorer.py")
+    args = parser.parse_args()
+
+    start_mb = rss_mb()
+    sessions = []
+    for i in range(args.sessions):
+        sessions.append(open_session(args.page))
+        gc.collect()
+        if i == 0:
+            first_mb = rss_mb()
+        print(f"session {i + 1:3d}: RSS {rss_mb():8.1f} MB")
+
+    end_mb = rss_mb()
+    per_session = (end_mb - first_mb) / max(args.sessions - 1, 1)
+    # The pages' sidebar defaults: first grid, season and year of the catalog
+    state = sessions[0].session_state
+    selection = {}
+    if "selected_grids" in state:
+        selection = dict(
+            grids=state["selected_grids"],
+            seasons=state["selected_season"],
+            years=state["selected_year"],
+        )
+    selection_mb = memory_mb(prepare_dataset(read_store(STORE_DIR, **selection)))
+    store = read_store(STORE_DIR)
+    store_mb = memory_mb(prepare_dataset(store))
+    wide_mb = memory_mb(prepare_dataset(store, compact=False))
+    print()
+    print(f"default selection        : {selection_mb:8.1f} MB")
+    print(f"whole store in memory    : {store_mb:8.1f} MB")
+    print(f"  without compact schema : {wide_mb:8.1f} MB ({wide_mb / store_mb:.1f}x)")
+    print(f"RSS before first session : {start_mb:8.1f} MB")
+    print(f"RSS after first session  : {first_mb:8.1f} MB")
+    print(f"RSS after {args.sessions:3d} sessions   : {end_mb:8.1f} MB")
+    print(f"memory per extra session : {per_session:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
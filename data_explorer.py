@@ -1,14 +1,26 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-import plotly.io as pio
-
-pio.kaleido.scope.default_format = "png"
-from functions import generate_correlation_heatmap, config_figure
-import statsmodels.api as sm
+from functions import (
+    generate_correlation_heatmap,
+    config_figure,
+    cast_hover_data,
+    get_cast_table,
+    get_figure,
+    get_profile_index,
+    get_regression_fits,
+    get_selection,
+    get_station_correlations,
+    show_figure,
+    span,
+    timed_fragment,
+)
+from iep.correlation import DEPTH_LAYERS, station_matrix
+from iep.filters import select
+from iep.lod import DEFAULT_MAX_POINTS, MAX_POINTS_OPTIONS, density_bin, scatter_trace_type
+from iep.regression import predict_with_band
 
 from css import app_css  # Import CSS as a string
 
@@ -30,83 +42,111 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Access the shared data from session state
-data = st.session_state.get("data")
+# One row per cast in the data store: the filter options, and the map
+casts = get_cast_table()
 
-if data is None:
+if casts.empty:
     st.error(
-        "Data not found in session state. Please load data in the main application."
+        "No CTD casts in the data store. Add the IEP workbooks to the data folder."
     )
 else:
-    # Ensure all latitude values are negative
-    data["Lat (°S)"] = data["Lat (°S)"].apply(lambda x: -abs(x))
+    bin_size = st.session_state.get("bin_size")
+    grid_options = casts["Grid"].unique()
+    season_options = casts["season"].unique()
+    year_options = casts["year"].unique()
 
     # Initialize session state for sidebar filters if not already set
     if "selected_grids" not in st.session_state:
-        st.session_state.selected_grids = [data["Grid"].unique()[0]]
+        st.session_state.selected_grids = [grid_options[0]]
     if "selected_season" not in st.session_state:
-        st.session_state.selected_season = [data["season"].unique()[0]]
+        st.session_state.selected_season = [season_options[0]]
     if "selected_year" not in st.session_state:
-        st.session_state.selected_year = [data.datetime.dt.year.dropna().unique()[0]]
+        st.session_state.selected_year = [year_options[0]]
 
     # Sidebar filters
     st.sidebar.header("Filter data")
     selected_grids = st.sidebar.multiselect(
-        "Select Grid(s)", data["Grid"].unique(), default=st.session_state.selected_grids
+        "Select Grid(s)", grid_options, default=st.session_state.selected_grids
     )
     selected_season = st.sidebar.multiselect(
         "Select Season(s)",
-        data["season"].unique(),
+        season_options,
         default=st.session_state.selected_season,
     )
     selected_year = st.sidebar.multiselect(
         "Select Year(s)",
-        data.datetime.dt.year.dropna().unique(),
+        year_options,
         default=st.session_state.selected_year,
     )
 
+    max_points = st.sidebar.select_slider(
+        "Max points per chart",
+        options=MAX_POINTS_OPTIONS,
+        value=DEFAULT_MAX_POINTS,
+        help="Larger selections are binned before plotting; regression fits always use every sample",
+    )
+
     # Update session state
     st.session_state.selected_grids = selected_grids
     st.session_state.selected_season = selected_season
     st.session_state.selected_year = selected_year
 
-    if selected_grids:
-        filtered_data = data[
-            (data["Grid"].isin(selected_grids))
-            & (data["season"].isin(selected_season))
-            & (data["datetime"].dt.year.isin(selected_year))
-        ]
-    else:
-        filtered_data = pd.DataFrame()  # Empty DataFrame if no grids are selected
+    # Only the selected casts are read from the store (no grids selected
+    # gives no rows); figures are cached across sessions under the same,
+    # normalised selection
+    selection = dict(
+        grids=selected_grids, seasons=selected_season, years=selected_year
+    )
+    with span("load selection"):
+        filtered_data = get_selection(**selection, bin_size=bin_size)
+        profile_index = get_profile_index(**selection, bin_size=bin_size)
+
+    def cached_figure(name, build, **options):
+        return get_figure("data_explorer", name, build, **selection, **options)
 
     # Layout
     col1, col2 = st.columns([7, 3])
 
     if not filtered_data.empty:
+        # The map and each analysis panel are fragments: a control inside one
+        # of them reruns only that fragment, not the filtering above
+        map_casts = select(casts, **selection)
+
+        @st.experimental_fragment
+        @timed_fragment
+        def station_map():
+            # Scatter map of sampling stations, one marker per cast
+
+            def build_map():
+                fig_map = px.scatter_mapbox(
+                    map_casts,
+                    lat="Lat (°S)",
+                    lon="Lon (°E)",
+                    hover_name="Grid",
+                    hover_data=cast_hover_data,
+                    zoom=4.5,
+                    height=600,
+                )
+                fig_map.update_layout(
+                    mapbox_style="open-street-map",
+                    mapbox_center={"lat": -33.0, "lon": 17.0},
+                    margin=dict(l=70, r=70, t=70, b=70),  # Increase margins
+                    paper_bgcolor="white",  # Add a white background
+                    plot_bgcolor="white",
+                    autosize=False,
+                    width=800,
+                    height=600,
+                )
+                fig_map.update_traces(
+                    marker=dict(size=6, symbol="circle", opacity=0.7, color="black"),
+                )
+                return fig_map
+
+            fig_map = cached_figure("map", build_map)
+            show_figure(fig_map, "map", use_container_width=True, config=config_figure)
+
         with col1:
-            # Scatter map of sampling stations
-            fig_map = px.scatter_mapbox(
-                filtered_data,
-                lat="Lat (°S)",
-                lon="Lon (°E)",
-                hover_name="Grid",
-                zoom=4.5,
-                height=600,
-            )
-            fig_map.update_layout(
-                mapbox_style="open-street-map",
-                mapbox_center={"lat": -33.0, "lon": 17.0},
-                margin=dict(l=70, r=70, t=70, b=70),  # Increase margins
-                paper_bgcolor="white",  # Add a white background
-                plot_bgcolor="white",
-                autosize=False,
-                width=800,
-                height=600,
-            )
-            fig_map.update_traces(
-                marker=dict(size=6, symbol="circle", opacity=0.7, color="black"),
-            )
-            st.plotly_chart(fig_map, use_container_width=True, config=config_figure)
+            station_map()
 
         with col2:
             st.header(" ")
@@ -121,7 +161,9 @@ else:
             )
             st.markdown("Scroll down to see " + analysis_option)
 
-        if analysis_option == "CTD Profiles":
+        @st.experimental_fragment
+        @timed_fragment
+        def profiles_panel():
             st.header("Profile Plot", anchor=None)
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -143,77 +185,86 @@ else:
                     key="oxy",
                 )
 
-            fig = make_subplots(
-                rows=1, cols=3, shared_yaxes=False, horizontal_spacing=0.15
-            )
+            def build_profiles():
+                fig = make_subplots(
+                    rows=1, cols=3, shared_yaxes=False, horizontal_spacing=0.15
+                )
 
-            for season in selected_season:
-                for station in filtered_data["Grid"].unique():
-                    for year in selected_year:
-                        station_data = filtered_data[
-                            (filtered_data["Grid"] == station)
-                            & (filtered_data["season"] == season)
-                            & (filtered_data["datetime"].dt.year == year)
-                        ]
-                        if not station_data.empty:
-                            fig.add_trace(
-                                go.Scatter(
-                                    x=station_data[var_temp],
-                                    y=station_data["Depth [m]"],
-                                    mode="lines",
-                                    name=f"{station} {season} Temp {year}",
-                                ),
-                                row=1,
-                                col=1,
-                            )
-                            fig.add_trace(
-                                go.Scatter(
-                                    x=station_data[var_sal],
-                                    y=station_data["Depth [m]"],
-                                    mode="lines",
-                                    name=f"{station} {season} Sal {year}",
-                                ),
-                                row=1,
-                                col=2,
-                            )
-                            fig.add_trace(
-                                go.Scatter(
-                                    x=station_data[var_oxy],
-                                    y=station_data["Depth [m]"],
-                                    mode="lines",
-                                    name=f"{station} {season} Oxy {year}",
-                                ),
-                                row=1,
-                                col=3,
-                            )
-
-            fig.update_xaxes(title_text=var_temp, row=1, col=1)
-            fig.update_xaxes(title_text=var_sal, row=1, col=2)
-            fig.update_xaxes(title_text=var_oxy, row=1, col=3)
-            fig.update_yaxes(title_text="Depth [m]", autorange="reversed")
-            fig.update_layout(
-                showlegend=True,  # Ensure legends are shown
-                margin=dict(
-                    l=70, r=200, t=50, b=50
-                ),  # Add margins and ensure enough space for legends
-                paper_bgcolor="white",  # Add a white background
-                plot_bgcolor="white",
-                autosize=False,
-                width=1200,  # Set the width of the scatter plot
-                height=600,
-            )
-            fig.update_layout(
-                legend=dict(
-                    orientation="h",  # Horizontal legend
-                    yanchor="bottom",
-                    y=-0.4,  # Adjust vertical position of legend
-                    xanchor="center",
-                    x=0.5,
+                for season in selected_season:
+                    for station in filtered_data["Grid"].unique():
+                        for year in selected_year:
+                            station_data = profile_index.get(station, season, year)
+                            if station_data is not None:
+                                fig.add_trace(
+                                    go.Scatter(
+                                        x=station_data[var_temp],
+                                        y=station_data["Depth [m]"],
+                                        mode="lines",
+                                        name=f"{station} {season} Temp {year}",
+                                    ),
+                                    row=1,
+                                    col=1,
+                                )
+                                fig.add_trace(
+                                    go.Scatter(
+                                        x=station_data[var_sal],
+                                        y=station_data["Depth [m]"],
+                                        mode="lines",
+                                        name=f"{station} {season} Sal {year}",
+                                    ),
+                                    row=1,
+                                    col=2,
+                                )
+                                fig.add_trace(
+                                    go.Scatter(
+                                        x=station_data[var_oxy],
+                                        y=station_data["Depth [m]"],
+                                        mode="lines",
+                                        name=f"{station} {season} Oxy {year}",
+                                    ),
+                                    row=1,
+                                    col=3,
+                                )
+
+                fig.update_xaxes(title_text=var_temp, row=1, col=1)
+                fig.update_xaxes(title_text=var_sal, row=1, col=2)
+                fig.update_xaxes(title_text=var_oxy, row=1, col=3)
+                fig.update_yaxes(title_text="Depth [m]", autorange="reversed")
+                fig.update_layout(
+                    showlegend=True,  # Ensure legends are shown
+                    margin=dict(
+                        l=70, r=200, t=50, b=50
+                    ),  # Add margins and ensure enough space for legends
+                    paper_bgcolor="white",  # Add a white background
+                    plot_bgcolor="white",
+                    autosize=False,
+                    width=1200,  # Set the width of the scatter plot
+                    height=600,
+                )
+                fig.update_layout(
+                    legend=dict(
+                        orientation="h",  # Horizontal legend
+                        yanchor="bottom",
+                        y=-0.4,  # Adjust vertical position of legend
+                        xanchor="center",
+                        x=0.5,
+                    )
                 )
+                return fig
+
+            fig = cached_figure(
+                "profiles",
+                build_profiles,
+                temperature=var_temp,
+                salinity=var_sal,
+                variable=var_oxy,
+                bin_size=bin_size,
             )
-            st.plotly_chart(fig, use_container_width=True, config=config_figure)
+            show_figure(fig, "profiles", use_container_width=True, config=config_figure)
 
-        elif analysis_option == "Regression Diagram":
+        @st.experimental_fragment
+        @timed_fragment
+        def regression_panel():
             st.header("Regression Diagram")
             col1, col2 = st.columns(2)
             with col1:
@@ -243,80 +294,144 @@ else:
                 "Add Trend (Linear Regression) Line?", ("No", "Yes")
             )
 
-            fig_ts = go.Figure()
-
-            for season in selected_season:
-                for station in filtered_data["Grid"].unique():
-                    for year in selected_year:
-                        TS_data = filtered_data[
-                            (filtered_data["Grid"] == station)
-                            & (filtered_data["season"] == season)
-                            & (filtered_data["datetime"].dt.year == year)
-                        ]
-                        if not TS_data.empty:
-                            group_name = f"{station} {season} {year}"
-
-                            fig_ts.add_trace(
-                                go.Scatter(
-                                    x=TS_data[x_var],
-                                    y=TS_data[y_var],
-                                    mode="markers",
-                                    name=group_name,
-                                    legendgroup=group_name,
-                                )
-                            )
-
-                            if add_regression == "Yes":
-                                X = TS_data[x_var]
-                                y = TS_data[y_var]
-                                X = sm.add_constant(X)
-                                model = sm.OLS(y, X).fit()
-                                X_pred = np.linspace(
-                                    X[x_var].min(), X[x_var].max(), 100
-                                )
-                                X_pred = sm.add_constant(X_pred)
-                                y_pred = model.predict(X_pred)
+            if add_regression == "Yes":
+                # Every group is fitted at once from grouped sums, cached
+                # on the selection like the figure
+                with span("regression fit"):
+                    fits = get_regression_fits(x_var, y_var, **selection, bin_size=bin_size)
+
+            def build_regression():
+                fig_ts = go.Figure()
+                fit_lookup = (
+                    dict(zip(fits.index, fits.to_dict("records")))
+                    if add_regression == "Yes"
+                    else {}
+                )
 
-                                equation = f"y = {model.params[1]:.3f}x + {model.params[0]:.3f}"
-                                r_squared = f"R² = {model.rsquared:.3f}"
+                # Share the point budget between the plotted groups; above the
+                # WebGL threshold the markers are drawn with Scattergl
+                points_per_group = max(max_points // max(len(map_casts), 1), 100)
+                Scatter = scatter_trace_type(min(len(filtered_data), max_points))
 
+                for season in selected_season:
+                    for station in filtered_data["Grid"].unique():
+                        for year in selected_year:
+                            TS_data = profile_index.get(station, season, year)
+                            if TS_data is not None:
+                                group_name = f"{station} {season} {year}"
+
+                                plot_data = density_bin(
+                                    TS_data, x_var, y_var, points_per_group
+                                )
                                 fig_ts.add_trace(
-                                    go.Scatter(
-                                        x=X_pred[:, 1],
-                                        y=y_pred,
-                                        mode="lines",
-                                        name=f"Regression {group_name}",
-                                        hovertemplate=f"{equation}<br>{r_squared}<br>Station: {station}, Season: {season}, Year: {year}",
-                                        showlegend=False,
+                                    Scatter(
+                                        x=plot_data[x_var],
+                                        y=plot_data[y_var],
+                                        mode="markers",
+                                        name=group_name,
                                         legendgroup=group_name,
                                     )
                                 )
 
-            fig_ts.update_layout(
-                title=f"Regression Plot: {x_var} vs {y_var}",
-                yaxis_title=y_var,
-                xaxis_title=x_var,
-                legend_title="Legend: Station, Season, Year",
-                margin=dict(l=70, r=200, t=50, b=50),  # Add margins
-                paper_bgcolor="white",  # Add a white background
-                plot_bgcolor="white",
-                showlegend=True,  # Ensure legends are shown
-                autosize=False,
-                width=1000,
-                height=600,
-            )
-            fig_ts.update_layout(
-                legend=dict(
-                    orientation="h",  # Horizontal legend
-                    yanchor="bottom",
-                    y=-0.3,  # Adjust vertical position of legend
-                    xanchor="center",
-                    x=0.5,
+                                fit = fit_lookup.get((station, season, year))
+                                if fit is not None:
+                                    X_pred = np.linspace(fit["x_min"], fit["x_max"], 100)
+                                    y_pred, lower, upper = predict_with_band(fit, X_pred)
+
+                                    equation = f"y = {fit['slope']:.3f}x + {fit['intercept']:.3f}"
+                                    r_squared = f"R² = {fit['r_squared']:.3f}"
+
+                                    # 95% confidence band of the fitted line
+                                    fig_ts.add_trace(
+                                        go.Scatter(
+                                            x=np.concatenate([X_pred, X_pred[::-1]]),
+                                            y=np.concatenate([upper, lower[::-1]]),
+                                            fill="toself",
+                                            line=dict(width=0),
+                                            opacity=0.2,
+                                            hoverinfo="skip",
+                                            showlegend=False,
+                                            legendgroup=group_name,
+                                        )
+                                    )
+                                    fig_ts.add_trace(
+                                        go.Scatter(
+                                            x=X_pred,
+                                            y=y_pred,
+                                            mode="lines",
+                                            name=f"Regression {group_name}",
+                                            hovertemplate=f"{equation}<br>{r_squared}<br>Station: {station}, Season: {season}, Year: {year}",
+                                            showlegend=False,
+                                            legendgroup=group_name,
+                                        )
+                                    )
+
+                fig_ts.update_layout(
+                    title=f"Regression Plot: {x_var} vs {y_var}",
+                    yaxis_title=y_var,
+                    xaxis_title=x_var,
+                    legend_title="Legend: Station, Season, Year",
+                    margin=dict(l=70, r=200, t=50, b=50),  # Add margins
+                    paper_bgcolor="white",  # Add a white background
+                    plot_bgcolor="white",
+                    showlegend=True,  # Ensure legends are shown
+                    autosize=False,
+                    width=1000,
+                    height=600,
                 )
+                fig_ts.update_layout(
+                    legend=dict(
+                        orientation="h",  # Horizontal legend
+                        yanchor="bottom",
+                        y=-0.3,  # Adjust vertical position of legend
+                        xanchor="center",
+                        x=0.5,
+                    )
+                )
+                return fig_ts
+
+            fig_ts = cached_figure(
+                "regression",
+                build_regression,
+                x=x_var,
+                y=y_var,
+                trend=add_regression,
+                max_points=max_points,
+                bin_size=bin_size,
             )
-            st.plotly_chart(fig_ts, use_container_width=True, config=config_figure)
-
-        elif analysis_option == "Box Plot":
+            show_figure(fig_ts, "regression", use_container_width=True, config=config_figure)
+
+            if add_regression == "Yes" and not fits.empty:
+                st.dataframe(
+                    fits[
+                        ["n", "slope", "slope_se", "intercept", "intercept_se", "r_squared"]
+                    ].rename(
+                        columns={
+                            "slope_se": "slope SE",
+                            "intercept_se": "intercept SE",
+                            "r_squared": "R²",
+                        }
+                    ),
+                    use_container_width=True,
+                )
+                if st.checkbox("Show detailed OLS diagnostics (statsmodels)"):
+                    # statsmodels is only imported for the detailed report
+                    import statsmodels.api as sm
+
+                    group = st.selectbox(
+                        "Group",
+                        list(fits.index),
+                        format_func=lambda key: " ".join(map(str, key)),
+                    )
+                    group_data = profile_index.get(*group)[[x_var, y_var]].dropna()
+                    model = sm.OLS(
+                        group_data[y_var], sm.add_constant(group_data[x_var])
+                    ).fit()
+                    st.text(model.summary())
+
+        @st.experimental_fragment
+        @timed_fragment
+        def box_panel():
             st.header("Box Plot")
             variable = st.selectbox(
                 "Select Variable",
@@ -328,59 +443,98 @@ else:
                 ],
                 index=0,
             )
-            fig_stats = go.Figure()
-            for season in selected_season:
-                for station in filtered_data["Grid"].unique():
-                    for year in selected_year:
-                        Stats_data = filtered_data[
-                            (filtered_data["Grid"] == station)
-                            & (filtered_data["season"] == season)
-                            & (filtered_data["datetime"].dt.year == year)
-                        ]
-                        if not Stats_data.empty:
-                            fig_stats.add_trace(
-                                go.Box(
-                                    y=Stats_data[variable],
-                                    x=[f"{station} {season} {year}"] * len(Stats_data),
-                                    name=f"{station} {season} {year}",
+            def build_box():
+                fig_stats = go.Figure()
+                for season in selected_season:
+                    for station in filtered_data["Grid"].unique():
+                        for year in selected_year:
+                            Stats_data = profile_index.get(station, season, year)
+                            if Stats_data is not None:
+                                fig_stats.add_trace(
+                                    go.Box(
+                                        y=Stats_data[variable],
+                                        x=[f"{station} {season} {year}"] * len(Stats_data),
+                                        name=f"{station} {season} {year}",
+                                    )
                                 )
-                            )
-
-            fig_stats.update_layout(
-                xaxis_title="Station, Season, Year",
-                yaxis_title=variable,
-                legend_title="Station, Season, Year",
-                boxmode="group",
-                margin=dict(l=70, r=200, t=50, b=50),  # Add margins
-                paper_bgcolor="white",  # Add a white background
-                plot_bgcolor="white",
-                showlegend=True,  # Ensure legends are shown
-                autosize=False,
-                width=1000,
-                height=600,
-            )
 
-            st.plotly_chart(fig_stats, use_container_width=True, config=config_figure)
+                fig_stats.update_layout(
+                    xaxis_title="Station, Season, Year",
+                    yaxis_title=variable,
+                    legend_title="Station, Season, Year",
+                    boxmode="group",
+                    margin=dict(l=70, r=200, t=50, b=50),  # Add margins
+                    paper_bgcolor="white",  # Add a white background
+                    plot_bgcolor="white",
+                    showlegend=True,  # Ensure legends are shown
+                    autosize=False,
+                    width=1000,
+                    height=600,
+                )
+                return fig_stats
 
-        elif analysis_option == "Correlation Heatmap":
-            st.header("Correlation Heatmap")
-            selected_station = st.selectbox(
-                "Select Station for Correlation Heatmap", data["Grid"].unique()
+            fig_stats = cached_figure(
+                "box", build_box, variable=variable, bin_size=bin_size
             )
+            show_figure(fig_stats, "box", use_container_width=True, config=config_figure)
+
+        @st.experimental_fragment
+        @timed_fragment
+        def correlation_panel():
+            st.header("Correlation Heatmap")
+            col1, col2 = st.columns(2)
+            with col1:
+                selected_station = st.selectbox(
+                    "Select Station for Correlation Heatmap",
+                    filtered_data["Grid"].unique(),
+                )
+            with col2:
+                depth_layer = st.selectbox(
+                    "Depth layer", ["All depths"] + list(DEPTH_LAYERS)
+                )
             st.write(" ")
-            fig_corr = generate_correlation_heatmap(selected_station, data)
-
-            fig_corr.update_layout(
-                margin=dict(l=70, r=200, t=50, b=50),  # Add margins
-                paper_bgcolor="white",  # Add a white background
-                plot_bgcolor="white",
-                showlegend=True,  # Ensure legends are shown
-                autosize=False,
-                width=1000,
-                height=600,
-            )
 
-            st.plotly_chart(fig_corr, config=config_figure)
+            def build_correlation():
+                # Matrices for every station in the selected seasons and years are
+                # computed together and cached; switching station is a lookup
+                stations, matrices, variables = get_station_correlations(
+                    sorted(selected_season),
+                    sorted(selected_year),
+                    None if depth_layer == "All depths" else depth_layer,
+                    bin_size=bin_size,
+                )
+                corr_matrix = station_matrix(
+                    stations, matrices, variables, selected_station
+                )
+                fig_corr = generate_correlation_heatmap(selected_station, corr_matrix)
+
+                fig_corr.update_layout(
+                    margin=dict(l=70, r=200, t=50, b=50),  # Add margins
+                    paper_bgcolor="white",  # Add a white background
+                    plot_bgcolor="white",
+                    showlegend=True,  # Ensure legends are shown
+                    autosize=False,
+                    width=1000,
+                    height=600,
+                )
+                return fig_corr
+
+            fig_corr = cached_figure(
+                "correlation",
+                build_correlation,
+                station=selected_station,
+                layer=depth_layer,
+                bin_size=bin_size,
+            )
+            show_figure(fig_corr, "correlation", config=config_figure)
+
+        panels = {
+            "CTD Profiles": profiles_panel,
+            "Regression Diagram": regression_panel,
+            "Box Plot": box_panel,
+            "Correlation Heatmap": correlation_panel,
+        }
+        panels[analysis_option]()
 
     else:
         st.warning("Please select at least one grid to visualize the data.")
@@ -1,10 +1,265 @@
-import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
-import io
+import contextlib
+import functools
+import os
+import uuid
+from pathlib import Path
+import plotly.io as pio
 import streamlit as st
 
-def generate_correlation_heatmap(Correlation_station, data):
+from iep.correlation import CorrelationStats
+from iep.figure_cache import FIGURE_CACHE_MB, FigureCache, filter_signature
+from iep.isopycnals import isopycnal_grid
+from iep.loader import prepare_dataset
+from iep.mixed_layer import mld_table
+from iep.profiles import PROFILE_KEYS, ProfileIndex
+from iep.regression import fit_groups
+from iep.shared import open_shared
+from iep.store import (
+    SOURCES_FILE,
+    STORE_DIR,
+    read_catalog,
+    read_store,
+    selection_version,
+    survey_versions,
+    sync_store,
+)
+from iep.timing import RerunTimings, TimingSink
+
+
+# Memory-mapped products shared by the server processes of this host
+# (iep.shared); with IEP_SHARED=0 every process reads the store itself
+USE_SHARED = os.environ.get("IEP_SHARED", "1") != "0"
+
+# Depth resolutions offered on every page: raw CTD scans or profiles
+# averaged onto standard depth bins (bin size in metres)
+DEPTH_RESOLUTIONS = {"Raw scans": None, "1 m bins": 1.0, "5 m bins": 5.0}
+
+
+@st.cache_resource(show_spinner="Updating the data store...")
+def get_store(root=STORE_DIR):
+    # Adds new or changed cruise workbooks and Sea-Bird casts to the
+    # partitioned store, once per server process; later casts are added with
+    # python -m iep.store while the app runs. Pages read only what they select.
+    sync_store(root=root)
+    return root
+
+
+@st.cache_data(show_spinner=False)
+def _survey_versions(root, modified):
+    return survey_versions(root)
+
+
+def store_version(seasons=None, years=None, root=STORE_DIR):
+    # Changes when casts of the selected seasons and years (None: all) are
+    # added or replaced; the caches below are keyed on it, so an ingest only
+    # invalidates the derived products of the surveys it touched
+    sources = Path(get_store(root)) / SOURCES_FILE
+    modified = sources.stat().st_mtime_ns if sources.exists() else 0
+    return selection_version(_survey_versions(root, modified), seasons, years)
+
+
+@st.cache_resource(max_entries=1, show_spinner="Mapping the shared data...")
+def _get_shared(root, version):
+    # The first process to need the products of a store version writes them,
+    # in a child process; the others map the same files
+    return open_shared(root, version=version, write=True)
+
+
+def get_shared(root=STORE_DIR):
+    # Shared products of the current store version, or None
+    if not USE_SHARED:
+        return None
+    return _get_shared(get_store(root), store_version(root=root))
+
+
+@st.cache_data(show_spinner=False)
+def _get_cast_table(root, version):
+    return read_catalog(root)
+
+
+def get_cast_table(root=STORE_DIR):
+    # One row per cast in the store; the filter options and maps use this
+    # rather than the CTD scans
+    return _get_cast_table(get_store(root), store_version(root=root))
+
+
+def _values(values):
+    # Hashable, order-independent cache key for a multiselect value
+    return None if values is None else tuple(sorted(values))
+
+
+@st.cache_resource(max_entries=64, show_spinner="Loading CTD data...")
+def _get_selection(grids, seasons, years, bin_size, root, version):
+    shared = get_shared(root)
+    if shared is not None and bin_size in shared:
+        return shared.select(grids, seasons, years, bin_size)
+    return prepare_dataset(read_store(root, grids, seasons, years), bin_size)
+
+
+def get_selection(grids=None, seasons=None, years=None, bin_size=None, root=STORE_DIR):
+    # Preprocessed samples of the selected casts, read from the store with the
+    # selection pushed down to its partitions and row groups. Shared by every
+    # session making the same selection, so pages must not modify it in place
+    # (see loader.prepare_dataset). With shared products the selection is a
+    # view of the mapped samples, or a copy of just the selected rows.
+    key = _values(grids), _values(seasons), _values(years), bin_size, get_store(root)
+    return _get_selection(*key, store_version(seasons, years, root))
+
+
+@st.cache_resource(max_entries=64)
+def _get_profile_index(grids, seasons, years, bin_size, root, version):
+    data = _get_selection(grids, seasons, years, bin_size, root, version)
+    shared = get_shared(root)
+    if shared is not None and bin_size in shared:
+        return ProfileIndex(data, shared.profile_table(grids, seasons, years, bin_size))
+    return ProfileIndex(data)
+
+
+def get_profile_index(grids=None, seasons=None, years=None, bin_size=None, root=STORE_DIR):
+    # (Grid, season, year) -> depth-sorted rows of get_selection(...)
+    key = _values(grids), _values(seasons), _values(years), bin_size, get_store(root)
+    return _get_profile_index(*key, store_version(seasons, years, root))
+
+
+@st.cache_data(show_spinner=False)
+def _get_regression_fits(x, y, grids, seasons, years, bin_size, root, version):
+    data = _get_selection(grids, seasons, years, bin_size, root, version)
+    return fit_groups(data, x, y, PROFILE_KEYS)
+
+
+def get_regression_fits(x, y, grids=None, seasons=None, years=None, bin_size=None, root=STORE_DIR):
+    # Linear fit of y on x per (Grid, season, year) of get_selection(...),
+    # cached on the selection like the figures that draw it
+    key = _values(grids), _values(seasons), _values(years), bin_size, get_store(root)
+    return _get_regression_fits(x, y, *key, store_version(seasons, years, root))
+
+
+@st.cache_data(show_spinner=False)
+def _get_mld_table(method, threshold, seasons, years, bin_size, version):
+    shared = get_shared()
+    if shared is not None and bin_size in shared:
+        with contextlib.suppress(KeyError):  # criteria that were not precomputed
+            return shared.mld_table(method, threshold, seasons, years, bin_size)
+    index = get_profile_index(seasons=seasons, years=years, bin_size=bin_size)
+    return mld_table(index, method, threshold)
+
+
+def get_mld_table(
+    method="Temperature threshold", threshold=None, seasons=None, years=None, bin_size=None
+):
+    # MLD of every profile in the selected seasons and years; the MLD page
+    # only looks values up
+    seasons, years = _values(seasons), _values(years)
+    version = store_version(seasons, years)
+    return _get_mld_table(method, threshold, seasons, years, bin_size, version)
+
+
+@st.cache_resource(max_entries=16)
+def _get_correlation_stats(seasons, years, bin_size, version):
+    return CorrelationStats(get_selection(seasons=seasons, years=years, bin_size=bin_size))
+
+
+@st.cache_data(show_spinner=False)
+def _get_station_correlations(seasons, years, layer, bin_size, version):
+    stats = _get_correlation_stats(seasons, years, bin_size, version)
+    stations, matrices = stats.by_station(seasons, years, layer)
+    return stations, matrices, stats.variables
+
+
+def get_station_correlations(seasons, years, layer=None, bin_size=None):
+    # (stations, stations x variables x variables array) for the selection.
+    # Correlation sums per (Grid, season, year, depth layer) of every station
+    # in the selected seasons and years are built in one pass and cached.
+    seasons, years = _values(seasons), _values(years)
+    version = store_version(seasons, years)
+    return _get_station_correlations(seasons, years, layer, bin_size, version)
+
+
+@st.cache_data(show_spinner=False)
+def calculate_isopycnals(s_min, s_max, t_min, t_max, sal_step=0.1, temp_step=1.0):
+    # Cached on the grid bounds and resolution only, not on the plotted data
+    return isopycnal_grid(s_min, s_max, t_min, t_max, sal_step, temp_step)
+
+
+@st.cache_resource
+def get_figure_cache(max_mb=FIGURE_CACHE_MB):
+    # Finished figures shared by every session, keyed by filter signature
+    return FigureCache(max_mb)
+
+
+def get_figure(page, name, build, **selection):
+    # Figure from the shared cache, timed as "figure: <name>"; figures of
+    # surveys that received new casts are rebuilt
+    cache = get_figure_cache()
+    version = store_version(selection.get("seasons"), selection.get("years"))
+    key = filter_signature(page, name, store=version, **selection)
+    with span(f"figure: {name}", cached=key in cache):
+        return cache.get_or_build(key, build)
+
+
+def show_figure(fig, name, **kwargs):
+    # st.plotly_chart timed as "chart: <name>"; with the timing panel open the
+    # size of the figure's JSON payload is recorded as well
+    info = {}
+    if st.session_state.get("show_timings"):
+        info["bytes"] = len(pio.to_json(fig, validate=False))
+    with span(f"chart: {name}", **info):
+        st.plotly_chart(fig, **kwargs)
+
+
+@st.cache_resource
+def get_timing_sink(log_file=os.environ.get("IEP_TIMING_LOG")):
+    # Span durations of every session; one JSON line per run goes to
+    # $IEP_TIMING_LOG when it is set
+    return TimingSink(log_file=log_file)
+
+
+def start_rerun_timings(page, fragment=None):
+    # Span recorder for this run of ``page``; span() below records into it
+    session = st.session_state.setdefault("session_id", uuid.uuid4().hex[:8])
+    timings = RerunTimings(page, get_timing_sink(), session, fragment)
+    st.session_state.rerun_timings = timings
+    return timings
+
+
+def timed_fragment(func):
+    # Put under @st.experimental_fragment: a fragment rerun skips main.py,
+    # so it gets its own RerunTimings, logged when the fragment returns
+    @functools.wraps(func)
+    def run_fragment(*args, **kwargs):
+        timings = st.session_state.get("rerun_timings")
+        if timings is None or not timings.finished:
+            return func(*args, **kwargs)
+        timings = start_rerun_timings(timings.page, fragment=func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            get_timing_sink().finish(timings)
+
+    return run_fragment
+
+
+def span(name, **info):
+    # Timing span of the current run; a no-op when no run is being timed
+    timings = st.session_state.get("rerun_timings")
+    if timings is None:
+        return contextlib.nullcontext(info)
+    return timings.span(name, **info)
+
+
+def timings_panel(timings):
+    # Debug sidebar panel: this run's spans and the page's p50/p95 across
+    # all sessions since the server started
+    with st.sidebar.expander("Timings", expanded=True):
+        st.dataframe(timings.table().round(1), hide_index=True)
+        st.caption(f"{timings.page}, all sessions [ms]")
+        summary = get_timing_sink().summary(timings.page)
+        st.dataframe(summary.drop(columns="page").round(1), hide_index=True)
+
+
+def generate_correlation_heatmap(Correlation_station, corr_matrix):
     if not Correlation_station:
         # Create an empty heatmap figure
         fig = go.Figure()
@@ -18,28 +273,7 @@ def generate_correlation_heatmap(Correlation_station, data):
         else Correlation_station
     )
 
-    # Filter data for the selected station
-    station_filter = data["Grid"] == station
-    filtered_data = data[station_filter]
-
-    # Define the list of specific variables to include
-    variables = [
-        "Pressure [db]",
-        "Temperature [ITS90,°C]",
-        "Salinity [psu]",
-        "Oxygen [ml/l]",
-        "Flourescence [mg/m^3]"
-    ]
-
-    # Ensure the variables exist in the filtered data
-    available_variables = [var for var in variables if var in filtered_data.columns]
-    
-    # Select only the numeric data for the available variables
-    numeric_data = filtered_data[available_variables].select_dtypes(include=[np.number])
-    
-    # Calculate the correlation matrix
-    corr_matrix = numeric_data.corr()
-    
+    # corr_matrix is precomputed (see iep.correlation.CorrelationStats)
     # Create a mask for the upper triangle
     mask = np.triu(np.ones_like(corr_matrix, dtype=bool))
     
@@ -48,8 +282,15 @@ def generate_correlation_heatmap(Correlation_station, data):
     
     # Drop rows and columns where all values are NaN
     masked_corr_matrix = masked_corr_matrix.dropna(axis=0, how='all').dropna(axis=1, how='all')
+    if masked_corr_matrix.empty:
+        fig = go.Figure()
+        fig.update_layout(title=f"No data for {station}")
+        return fig
+
+    # Generate a heatmap from the masked correlation matrix (plotly.express
+    # is only imported for it)
+    import plotly.express as px
 
-    # Generate a heatmap from the masked correlation matrix
     fig = px.imshow(
         masked_corr_matrix,
         labels=dict(color="Correlation"),
@@ -76,6 +317,17 @@ def generate_correlation_heatmap(Correlation_station, data):
     return fig
 
 
+# Hover details for the cast markers on the maps
+cast_hover_data = {
+    "season": True,
+    "year": True,
+    "date": "|%Y-%m-%d",
+    "samples": True,
+    "Max depth [m]": ":.0f",
+    "Lat (°S)": ":.3f",
+    "Lon (°E)": ":.3f",
+}
+
 #Configuration for high-resolution plot export
 config_figure = {
     'toImageButtonOptions': {
@@ -0,0 +1,60 @@
+"""Headless compute core of the IEP dashboard.
+
+Pure functions and classes over numpy arrays and DataFrames, importable
+without Streamlit so the same engines run in the pages, batch jobs,
+benchmarks and worker processes:
+
+* ``iep.loader``: workbook loading through the Parquet cache, preparation
+* ``iep.cnv``: Sea-Bird .cnv casts in the workbook columns
+* ``iep.store``: partitioned multi-cruise Parquet store with pushdown reads
+* ``iep.shared``: memory-mapped products shared by the server processes
+* ``iep.profiles``: contiguous (Grid, season, year) profiles and casts
+* ``iep.filters``: grid/season/year/water mass selection
+* ``iep.classification``: water mass labels and summaries
+* ``iep.mixed_layer``: MLD of every profile by several methods
+* ``iep.isopycnals``: sigma-0 grids for T-S diagrams
+* ``iep.regression``: grouped closed-form linear fits
+* ``iep.correlation``: additive correlation statistics
+* ``iep.lod``: level of detail for large scatter plots
+* ``iep.figure_cache``: LRU cache of finished Plotly figures
+* ``iep.atlas``: parallel static figure export of every cast (kaleido)
+* ``iep.products``: batch export of MLD, water mass and profile tables
+* ``iep.parallel``: process pools shared by the batch CLIs
+* ``iep.synthetic``: synthetic CTD data for benchmarks and tests
+"""
+
+import importlib
+
+# Public names and the submodule that defines them. They are imported on
+# first use, so ``import iep.<module>`` and ``python -m iep.<module>`` load
+# only that module and what it imports.
+_EXPORTS = {
+    "CorrelationStats": "correlation",
+    "ProfileIndex": "profiles",
+    "bin_profiles": "profiles",
+    "cast_table": "profiles",
+    "classify_water_masses": "classification",
+    "fit_groups": "regression",
+    "isopycnal_bounds": "isopycnals",
+    "isopycnal_grid": "isopycnals",
+    "load_data": "loader",
+    "mld_comparison": "mixed_layer",
+    "mld_table": "mixed_layer",
+    "predict_with_band": "regression",
+    "prepare_dataset": "loader",
+    "read_catalog": "store",
+    "read_cnv": "cnv",
+    "read_store": "store",
+    "select": "filters",
+    "sort_profiles": "profiles",
+    "sync_store": "store",
+    "water_mass_summary": "classification",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
@@ -0,0 +1,253 @@
+"""Cruise atlas: static figures of every selected cast, rendered in parallel.
+
+The pages only export a figure through the browser's toImage button. For
+cruise reports ``render_atlas`` renders, for every cast (Grid, season,
+year) in the selection, its CTD profiles, T-S diagram and MLD profile
+(``ATLAS_FIGURES``) with kaleido, to image files or one PDF.
+
+Casts are spread over a process pool. Each worker reads its casts from the
+store (``iep.store``, only that cast's row groups) and keeps one kaleido
+process for all the figures it renders, so Chromium starts once per worker
+rather than once per figure.
+
+Run ``python -m iep.atlas --output atlas/`` (see ``--help`` for the
+selection, formats and ``--pdf``).
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+from .classification import LABEL_COL, SAL_COL, TEMP_COL, WATER_MASSES
+from .filters import select
+from .isopycnals import ISOPYCNAL_RESOLUTIONS, isopycnal_bounds, isopycnal_grid
+from .loader import prepare_dataset
+from .mixed_layer import MLD_COL, MLD_THRESHOLDS, MLD_UNITS, mld_table
+from .parallel import process_pool, split_option, worker
+from .profiles import DEPTH_COL, ProfileIndex
+from .store import STORE_DIR, read_catalog, read_store, sync_store
+
+FORMATS = ["png", "svg", "pdf", "jpeg", "webp"]
+OXY_COL = "Oxygen [ml/l]"
+FLUO_COL = "Flourescence [mg/m^3]"
+# Figure size in pixels; ``scale`` multiplies it for raster formats
+WIDTH, HEIGHT = 1000, 600
+
+
+def profiles_figure(cast, title):
+    """Temperature, salinity, oxygen and fluorescence against depth."""
+    variables = [TEMP_COL, SAL_COL, OXY_COL, FLUO_COL]
+    fig = make_subplots(rows=1, cols=len(variables), shared_yaxes=True, horizontal_spacing=0.04)
+    for col, variable in enumerate(variables, start=1):
+        fig.add_trace(
+            go.Scatter(x=cast[variable], y=cast[DEPTH_COL], mode="lines", name=variable),
+            row=1,
+            col=col,
+        )
+        fig.update_xaxes(title_text=variable, row=1, col=col)
+    fig.update_yaxes(title_text=DEPTH_COL, autorange="reversed", row=1, col=1)
+    fig.update_layout(title=title, showlegend=False, paper_bgcolor="white", plot_bgcolor="white")
+    return fig
+
+
+def ts_figure(cast, title, resolution="Medium"):
+    """T-S diagram over sigma-0 isopycnals, samples coloured by water mass."""
+    sal_step, temp_step = ISOPYCNAL_RESOLUTIONS[resolution]
+    si, ti, dens = isopycnal_grid(*isopycnal_bounds(cast, sal_step, temp_step), sal_step, temp_step)
+    fig = go.Figure(
+        go.Contour(
+            x=si,
+            y=ti,
+            z=dens,
+            contours_coloring="lines",
+            showscale=False,
+            contours=dict(
+                start=dens.min(),
+                end=dens.max(),
+                size=0.5,
+                showlabels=True,
+                labelfont=dict(size=12, color="black"),
+            ),
+            name="Isopycnals",
+        )
+    )
+    labels = cast[LABEL_COL].astype(object).fillna("Unclassified")
+    # One trace per water mass, so each gets its own colour and legend entry
+    for abbrev in [wm["abbreviation"] for wm in WATER_MASSES] + ["Unclassified"]:
+        samples = cast[(labels == abbrev).to_numpy()]
+        if samples.empty:
+            continue
+        fig.add_trace(
+            go.Scatter(
+                x=samples[SAL_COL],
+                y=samples[TEMP_COL],
+                mode="markers",
+                marker=dict(size=4),
+                name=abbrev,
+            )
+        )
+    fig.update_layout(title=title, xaxis_title=SAL_COL, yaxis_title=TEMP_COL)
+    return fig
+
+
+def mld_figure(cast, title, method="Temperature threshold", threshold=None):
+    """Temperature profile with its mixed layer depth."""
+    if threshold is None and MLD_THRESHOLDS[method]:
+        threshold = MLD_THRESHOLDS[method][0]
+    mld = mld_table(ProfileIndex(cast), method, threshold)[MLD_COL].iloc[0]
+    label = method if threshold is None else f"{method}, {threshold} {MLD_UNITS[method]}"
+    fig = go.Figure(go.Scatter(x=cast[TEMP_COL], y=cast[DEPTH_COL], mode="lines", name="Temperature"))
+    fig.add_hline(
+        y=mld, line_dash="dash", annotation_text=f"MLD {mld:.1f} m", annotation_position="bottom right"
+    )
+    fig.update_layout(
+        title=f"{title}: Mixed Layer Depth ({label})",
+        xaxis_title=TEMP_COL,
+        yaxis_title=DEPTH_COL,
+        yaxis=dict(autorange="reversed"),
+        showlegend=False,
+    )
+    return fig
+
+
+ATLAS_FIGURES = {"profiles": profiles_figure, "ts": ts_figure, "mld": mld_figure}
+
+
+def atlas_casts(catalog, grids=None, seasons=None, years=None):
+    """(Grid, season, year) of the selected casts, by survey then grid."""
+    casts = select(catalog, grids=grids, seasons=seasons, years=years)
+    casts = casts.sort_values(["year", "season", "Grid"], kind="stable")
+    return [
+        (grid, season, int(year))
+        for grid, season, year in zip(casts["Grid"], casts["season"], casts["year"])
+    ]
+
+
+def _start_kaleido():
+    # Start this worker's kaleido process now rather than in its first cast
+    pio.to_image(go.Figure(), format="png", width=10, height=10)
+
+
+def _render_cast(cast_key):
+    # Images (figure name, bytes) of one cast, rendered by this worker
+    grid, season, year = cast_key
+    data = prepare_dataset(
+        read_store(worker["root"], grids=[grid], seasons=[season], years=[year]),
+        worker["bin_size"],
+    )
+    cast = ProfileIndex(data).get(grid, season, year)
+    if cast is None:
+        return cast_key, []
+    title = f"{grid} {season} {year}"
+    images = []
+    for name in worker["figures"]:
+        fig = ATLAS_FIGURES[name](cast, title)
+        image = pio.to_image(
+            fig, format=worker["format"], width=WIDTH, height=HEIGHT, scale=worker["scale"]
+        )
+        images.append((name, image))
+    return cast_key, images
+
+
+def _append_pdf_page(page, path, append, scale):
+    # Add one PNG image as a page at the figure's size in points; only this
+    # page is decoded, so the atlas size does not bound memory
+    from PIL import Image
+
+    with Image.open(io.BytesIO(page)) as image:
+        image.convert("RGB").save(path, append=append, resolution=72.0 * scale)
+
+
+def render_atlas(
+    output=None,
+    pdf=None,
+    grids=None,
+    seasons=None,
+    years=None,
+    figures=tuple(ATLAS_FIGURES),
+    image_format="png",
+    scale=2,
+    bin_size=None,
+    workers=None,
+    root=STORE_DIR,
+):
+    """Render ``figures`` of every selected cast to ``output`` and/or ``pdf``.
+
+    Files go to ``output/<year>_<season>/<Grid>_<figure>.<format>``; with
+    ``pdf`` every figure also becomes one page of that file (rendered as
+    PNG). Returns the number of casts rendered.
+    """
+    if pdf is not None and image_format != "png":
+        raise ValueError("The PDF atlas is assembled from PNG images")
+    casts = atlas_casts(read_catalog(root), grids, seasons, years)
+    n_pages = 0
+    with process_pool(
+        len(casts),
+        workers,
+        warm_up=_start_kaleido,
+        root=root,
+        bin_size=bin_size,
+        figures=list(figures),
+        format=image_format,
+        scale=scale,
+    ) as pool:
+        # Results come back in cast order, so the PDF follows the catalog
+        for (grid, season, year), images in pool.map(_render_cast, casts, chunksize=4):
+            for name, image in images:
+                if output is not None:
+                    folder = Path(output) / f"{year}_{season}"
+                    folder.mkdir(parents=True, exist_ok=True)
+                    (folder / f"{grid}_{name}.{image_format}").write_bytes(image)
+                if pdf is not None:
+                    _append_pdf_page(image, pdf, n_pages > 0, scale)
+                    n_pages += 1
+    return len(casts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Folder for the image files")
+    parser.add_argument("--pdf", help="Also (or only) write every figure to this PDF")
+    parser.add_argument("--grids", help="Comma-separated grid stations (default: all)")
+    parser.add_argument("--seasons", help="Comma-separated seasons (default: all)")
+    parser.add_argument("--years", help="Comma-separated years (default: all)")
+    parser.add_argument("--figures", default=",".join(ATLAS_FIGURES), help="From " + ", ".join(ATLAS_FIGURES))
+    parser.add_argument("--format", default="png", choices=FORMATS)
+    parser.add_argument("--scale", type=float, default=2)
+    parser.add_argument("--bin-size", type=float, help="Average profiles onto depth bins [m]")
+    parser.add_argument("--workers", type=int, help="Processes (default: one per CPU)")
+    args = parser.parse_args()
+    if args.output is None and args.pdf is None:
+        parser.error("give --output and/or --pdf")
+    if args.pdf is not None and args.format != "png":
+        parser.error("--pdf needs --format png")
+    figures = split_option(args.figures)
+    unknown = set(figures) - set(ATLAS_FIGURES)
+    if unknown:
+        parser.error(f"unknown figures: {', '.join(sorted(unknown))}")
+
+    years = split_option(args.years)
+    start = time.perf_counter()
+    sync_store()
+    n_casts = render_atlas(
+        output=args.output,
+        pdf=args.pdf,
+        grids=split_option(args.grids),
+        seasons=split_option(args.seasons),
+        years=None if years is None else [int(year) for year in years],
+        figures=figures,
+        image_format=args.format,
+        scale=args.scale,
+        bin_size=args.bin_size,
+        workers=args.workers,
+    )
+    print(f"{n_casts} casts rendered in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
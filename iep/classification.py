@@ -0,0 +1,155 @@
+"""Water mass classification of CTD samples.
+
+Each water mass is a box in temperature, salinity and sigma-theta space
+(edges inclusive). ``classify_water_masses`` labels every sample in one
+vectorised pass; the label is stored as the categorical "Water Mass" column
+when the dataset is loaded (see loader.prepare_dataset).
+"""
+
+import numpy as np
+import pandas as pd
+
+TEMP_COL = "Temperature [ITS90,°C]"
+SAL_COL = "Salinity [psu]"
+DENS_COL = "Density Derived [sigma-theta, kg/m^3]"
+LABEL_COL = "Water Mass"
+
+WATER_MASSES = [
+    {
+        "name": "Antarctic Bottom Water",
+        "abbreviation": "ABW",
+        "temp_min": -2,
+        "temp_max": 2,
+        "sal_min": 34.6,
+        "sal_max": 34.8,
+        "dens_min": 27.9,
+        "dens_max": np.inf,
+        "color": "Black",
+    },
+    {
+        "name": "North Atlantic Deep Water",
+        "abbreviation": "NADW",
+        "temp_min": 2,
+        "temp_max": 4,
+        "sal_min": 34.9,
+        "sal_max": 35.0,
+        "dens_min": 27.8,
+        "dens_max": np.inf,
+        "color": "Black",
+    },
+    {
+        "name": "Low Salinity Antarctic Intermediate Water",
+        "abbreviation": "LSAIW",
+        "temp_min": 3,
+        "temp_max": 6,
+        "sal_min": 34.3,
+        "sal_max": 34.6,
+        "dens_min": 27.2,
+        "dens_max": 27.5,
+        "color": "Black",
+    },
+    {
+        "name": "High Salinity Antarctic Intermediate Water",
+        "abbreviation": "HSAIW",
+        "temp_min": 5,
+        "temp_max": 10,
+        "sal_min": 34.5,
+        "sal_max": 35.0,
+        "dens_min": 27.3,
+        "dens_max": 27.6,
+        "color": "Black",
+    },
+    {
+        "name": "Low Salinity Central Water",
+        "abbreviation": "LSCW",
+        "temp_min": 8,
+        "temp_max": 15,
+        "sal_min": 34.3,
+        "sal_max": 34.8,
+        "dens_min": 26.5,
+        "dens_max": 27.0,
+        "color": "Black",
+    },
+    {
+        "name": "High Salinity Central Water",
+        "abbreviation": "HSCW",
+        "temp_min": 8,
+        "temp_max": 15,
+        "sal_min": 34.8,
+        "sal_max": 35.5,
+        "dens_min": 26.8,
+        "dens_max": 27.4,
+        "color": "Black",
+    },
+    {
+        "name": "Modified Upwelled Water",
+        "abbreviation": "MUW",
+        "temp_min": 15,
+        "temp_max": 20,
+        "sal_min": 35.0,
+        "sal_max": 36.0,
+        "dens_min": 25.8,
+        "dens_max": 26.5,
+        "color": "Black",
+    },
+    {
+        "name": "Oceanic Surface Water",
+        "abbreviation": "OSW",
+        "temp_min": 20,
+        "temp_max": 30,
+        "sal_min": 34.5,
+        "sal_max": 36.5,
+        "dens_min": 24.0,
+        "dens_max": 25.5,
+        "color": "Black",
+    },
+]
+
+# Where boxes overlap (e.g. LSCW/HSCW at 34.8 psu, LSAIW/HSAIW between 5 and
+# 6 °C) the water mass listed first wins
+WATER_MASS_PRECEDENCE = [wm["abbreviation"] for wm in WATER_MASSES]
+
+
+def classify_water_masses(
+    data, water_masses=WATER_MASSES, precedence=WATER_MASS_PRECEDENCE
+):
+    """Label each row of ``data`` with the abbreviation of its water mass.
+
+    Returns a categorical Series (categories in ``precedence`` order) aligned
+    with ``data``; samples outside every box, or with missing values, are NaN.
+    """
+    boxes = {wm["abbreviation"]: wm for wm in water_masses}
+    temp = data[TEMP_COL].to_numpy(dtype=float)
+    sal = data[SAL_COL].to_numpy(dtype=float)
+    dens = data[DENS_COL].to_numpy(dtype=float)
+
+    in_box = [
+        (temp >= boxes[abbrev]["temp_min"])
+        & (temp <= boxes[abbrev]["temp_max"])
+        & (sal >= boxes[abbrev]["sal_min"])
+        & (sal <= boxes[abbrev]["sal_max"])
+        & (dens >= boxes[abbrev]["dens_min"])
+        & (dens <= boxes[abbrev]["dens_max"])
+        for abbrev in precedence
+    ]
+    # np.select takes the first matching box, which applies the precedence
+    codes = np.select(in_box, np.arange(len(precedence)), default=-1)
+    labels = pd.Categorical.from_codes(codes, categories=list(precedence))
+    return pd.Series(labels, index=data.index, name=LABEL_COL)
+
+
+def water_mass_summary(data, water_masses=WATER_MASSES):
+    """Sample count, share of samples and mean T-S position per water mass.
+
+    ``data`` must carry the "Water Mass" label column. Water masses with no
+    samples are dropped.
+    """
+    names = {wm["abbreviation"]: wm["name"] for wm in water_masses}
+    summary = data.groupby(LABEL_COL, observed=True).agg(
+        samples=(TEMP_COL, "size"),
+        mean_sal=(SAL_COL, "mean"),
+        mean_temp=(TEMP_COL, "mean"),
+    )
+    summary.insert(0, "name", summary.index.map(names))
+    summary.insert(2, "share", 100 * summary["samples"] / max(len(data), 1))
+    return summary
@@ -0,0 +1,165 @@
+"""Read Sea-Bird ``.cnv`` casts into the columns of the IEP workbooks.
+
+A ``.cnv`` file holds one processed CTD cast: a header (``*`` lines from
+the instrument and deck unit, ``**`` lines typed in at the deck unit, ``#``
+lines written by SBE Data Processing) ending in ``*END*``, then one row of
+whitespace-separated values per scan. The header names the columns by their
+Sea-Bird short names (``prDM``, ``t090C``, ...), which ``CNV_COLUMNS`` maps
+to the workbook columns; values equal to ``bad_flag`` become NaN.
+
+The cast's metadata comes from the header: position and time from the NMEA
+lines (or ``** Latitude:``/``** Longitude:``), the grid station from
+``** Grid:`` or ``** Station:``, the cruise from ``** Cruise:`` (default: the
+file's folder) and the season from ``** Season:`` or the month. The cast id
+(``Station``) is the file name. Depth and sigma-theta are derived with
+TEOS-10 when the file does not have them. Files should be processed
+downcasts (SBE Data Processing's Split or Bin Average).
+"""
+
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .loader import WORKBOOK_COLUMNS
+
+# Sea-Bird short name -> workbook column, primary sensors only. When a file
+# has several names for one column, the first one listed here is used.
+CNV_COLUMNS = {
+    "prDM": "Pressure [db]",
+    "prdM": "Pressure [db]",
+    "prSM": "Pressure [db]",
+    "depSM": "Depth [m]",
+    "depFM": "Depth [m]",
+    "t090C": "Temperature [ITS90,°C]",
+    "tv290C": "Temperature [ITS90,°C]",
+    "sal00": "Salinity [psu]",
+    "sbeox0ML/L": "Oxygen [ml/l]",
+    "sbox0ML/L": "Oxygen [ml/l]",
+    "flECO-AFL": "Flourescence [mg/m^3]",
+    "wetStar": "Flourescence [mg/m^3]",
+    "flC": "Flourescence [mg/m^3]",
+    "flS": "Flourescence [mg/m^3]",
+    "sigma-é00": "Density Derived [sigma-theta, kg/m^3]",
+}
+# Austral seasons by month, as in the IEP workbooks (July is Winter)
+SEASONS = {
+    12: "Summer", 1: "Summer", 2: "Summer",
+    3: "Autumn", 4: "Autumn", 5: "Autumn",
+    6: "Winter", 7: "Winter", 8: "Winter",
+    9: "Spring", 10: "Spring", 11: "Spring",
+}
+
+
+def _position(text):
+    # "34 08.50 S", "-34.1417" or "17 53.4 E" -> signed decimal degrees
+    match = re.match(r"\s*([-+\d.]+)(?:\s+([\d.]+))?\s*([NSEW])?", text)
+    if match is None:
+        raise ValueError(f"Cannot read a position from {text!r}")
+    degrees, minutes, hemisphere = match.groups()
+    value = abs(float(degrees)) + (float(minutes) / 60 if minutes else 0.0)
+    negative = degrees.startswith("-") or hemisphere in ("S", "W")
+    return -value if negative else value
+
+
+def read_cnv_header(fh):
+    """Parse the header of an open ``.cnv`` file, leaving ``fh`` at the data.
+
+    Returns the column short names, the bad flag value and a dict of the
+    metadata lines (NMEA, ``start_time`` and the ``**`` fields, with
+    lower-case keys).
+    """
+    names, bad_flag, meta = [], None, {}
+    for line in fh:
+        if line.startswith("*END*"):
+            return names, bad_flag, meta
+        if line.startswith("# name "):
+            names.append(line.split("=", 1)[1].split(":", 1)[0].strip())
+        elif line.startswith("# bad_flag"):
+            bad_flag = float(line.split("=", 1)[1])
+        elif line.startswith("# start_time"):
+            meta["start_time"] = line.split("=", 1)[1].split("[", 1)[0].strip()
+        elif line.startswith("* NMEA") and "=" in line:
+            key, value = line[len("* NMEA") :].split("=", 1)
+            meta["nmea " + key.strip().lower()] = value.strip()
+        elif line.startswith("**") and ":" in line:
+            key, value = line[2:].split(":", 1)
+            meta[key.strip().lower()] = value.strip()
+    raise ValueError("No *END* line; not a Sea-Bird .cnv file")
+
+
+def _cast_metadata(path, meta):
+    # Workbook metadata columns of the cast described by the header
+    grid = meta.get("grid") or meta.get("station")
+    if not grid:
+        raise ValueError(f"{path}: no '** Grid:' or '** Station:' header line")
+    latitude = meta.get("nmea latitude") or meta.get("latitude") or meta.get("lat")
+    longitude = meta.get("nmea longitude") or meta.get("longitude") or meta.get("lon")
+    if latitude is None or longitude is None:
+        raise ValueError(f"{path}: no position in the header")
+    time = meta.get("nmea utc (time)") or meta.get("start_time") or meta.get("date")
+    if time is None:
+        raise ValueError(f"{path}: no cast time in the header")
+    when = pd.Timestamp(time)
+    return {
+        "Cruise": meta.get("cruise") or path.parent.name,
+        "Station": path.stem,
+        "Grid": grid,
+        "Lat (°S)": -_position(latitude),
+        "Lon (°E)": _position(longitude),
+        "datetime": when,
+        "season": meta.get("season") or SEASONS[when.month],
+    }
+
+
+def read_cnv(path):
+    """One cast as a frame with the workbook's columns (``loader.WORKBOOK_COLUMNS``).
+
+    Only the mapped columns of the data rows are parsed.
+    """
+    path = Path(path)
+    with open(path, encoding="latin-1") as fh:
+        names, bad_flag, meta = read_cnv_header(fh)
+        cast = _cast_metadata(path, meta)
+        # First short name found for each workbook column
+        use = {}
+        for short, column in CNV_COLUMNS.items():
+            if short in names and column not in use.values():
+                use[short] = column
+        usecols = [names.index(short) for short in use]
+        values = pd.read_csv(
+            fh,
+            sep=r"\s+",
+            header=None,
+            names=range(len(names)),
+            usecols=usecols,
+            dtype=float,
+        )
+    values.columns = [use[names[i]] for i in values.columns]
+    if bad_flag is not None:
+        values = values.mask(np.isclose(values, bad_flag, rtol=1e-6, atol=0))
+
+    if "Pressure [db]" not in values.columns:
+        raise ValueError(f"{path}: no pressure column")
+    # gsw is only needed for casts without depth or sigma-theta
+    import gsw
+
+    lat, lon = -cast["Lat (°S)"], cast["Lon (°E)"]
+    pressure = values["Pressure [db]"].to_numpy()
+    if "Depth [m]" not in values.columns:
+        values["Depth [m]"] = -gsw.z_from_p(pressure, lat)
+    dens_col = "Density Derived [sigma-theta, kg/m^3]"
+    if dens_col not in values.columns and {
+        "Temperature [ITS90,°C]",
+        "Salinity [psu]",
+    }.issubset(values.columns):
+        absolute_salinity = gsw.SA_from_SP(values["Salinity [psu]"], pressure, lon, lat)
+        conservative_temp = gsw.CT_from_t(
+            absolute_salinity, values["Temperature [ITS90,°C]"], pressure
+        )
+        values[dens_col] = gsw.sigma0(absolute_salinity, conservative_temp)
+
+    data = values.assign(**cast)
+    data["datetime"] = data["datetime"].astype("datetime64[ns]")
+    return data.reindex(columns=WORKBOOK_COLUMNS)
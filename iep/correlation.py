@@ -0,0 +1,145 @@
+"""Pairwise correlation matrices for every station, season/year and depth layer.
+
+The dataset is scanned once to collect, for every (Grid, season, year, depth
+layer) group and every pair of variables, the sums needed for a Pearson
+correlation (count, sums, sums of squares and cross products over the rows
+where both variables are present, like ``DataFrame.corr``). Those sums add up
+across groups, so the correlation matrix of any selection of stations,
+seasons, years and layers is a sum over a few hundred small arrays rather
+than a new pass over the data.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .profiles import profile_years
+
+CORRELATION_VARIABLES = [
+    "Pressure [db]",
+    "Temperature [ITS90,°C]",
+    "Salinity [psu]",
+    "Oxygen [ml/l]",
+    "Flourescence [mg/m^3]",
+]
+
+# Depth layers (top, bottom] in metres for layer-resolved correlations
+DEPTH_LAYERS = {
+    "0-50 m": (-np.inf, 50),
+    "50-200 m": (50, 200),
+    "Below 200 m": (200, np.inf),
+}
+GROUP_KEYS = ["Grid", "season", "year", "layer"]
+
+
+def _depth_layer(depth):
+    edges = [bounds[1] for bounds in DEPTH_LAYERS.values()][:-1]
+    layer = np.searchsorted(edges, depth, side="left")
+    labels = np.array(list(DEPTH_LAYERS), dtype=object)[layer]
+    return np.where(np.isnan(depth), None, labels)
+
+
+class CorrelationStats:
+    """Additive correlation statistics per (Grid, season, year, layer) group.
+
+    ``keys`` lists the groups; the sums are (groups, variables, variables)
+    arrays where element [g, i, j] only uses the rows of group g in which
+    variables i and j are both present.
+    """
+
+    def __init__(self, data, variables=CORRELATION_VARIABLES, depth_col="Depth [m]"):
+        self.variables = [var for var in variables if var in data.columns]
+        grouping = pd.DataFrame(
+            {
+                "Grid": data["Grid"].to_numpy(),
+                "season": data["season"].to_numpy(),
+                "year": profile_years(data).to_numpy(),
+                "layer": _depth_layer(data[depth_col].to_numpy(dtype=float)),
+            }
+        )
+        grouped = grouping.groupby(GROUP_KEYS, sort=False, dropna=False)
+        group = grouped.ngroup().to_numpy()
+        self.keys = grouped.size().index.to_frame(index=False)
+        n_groups, n_vars = len(self.keys), len(self.variables)
+
+        # Shifting by the column mean keeps the sums well conditioned and
+        # does not change the correlations
+        values = data[self.variables].to_numpy(dtype=float)
+        values = values - np.nanmean(values, axis=0)
+        present = ~np.isnan(values)
+        values = np.where(present, values, 0.0)
+
+        def group_sum(weights):
+            return np.bincount(group, weights=weights, minlength=n_groups)
+
+        shape = (n_groups, n_vars, n_vars)
+        self._n = np.zeros(shape)
+        self._sx = np.zeros(shape)
+        self._sxx = np.zeros(shape)
+        self._sxy = np.zeros(shape)
+        for i in range(n_vars):
+            for j in range(i, n_vars):
+                both = present[:, i] & present[:, j]
+                xi = np.where(both, values[:, i], 0.0)
+                xj = np.where(both, values[:, j], 0.0)
+                n = group_sum(both.astype(float))
+                self._n[:, i, j] = self._n[:, j, i] = n
+                self._sx[:, i, j] = group_sum(xi)
+                self._sx[:, j, i] = group_sum(xj)
+                self._sxx[:, i, j] = group_sum(xi * xi)
+                self._sxx[:, j, i] = group_sum(xj * xj)
+                self._sxy[:, i, j] = self._sxy[:, j, i] = group_sum(xi * xj)
+
+    def _select(self, grids=None, seasons=None, years=None, layer=None):
+        mask = np.ones(len(self.keys), dtype=bool)
+        for col, values in (("Grid", grids), ("season", seasons), ("year", years)):
+            if values is not None:
+                mask &= self.keys[col].isin(values).to_numpy()
+        if layer is not None:
+            mask &= (self.keys["layer"] == layer).to_numpy()
+        return mask
+
+    @staticmethod
+    def _correlation(n, sx, sxx, sxy):
+        # Pearson correlation from pairwise sums; axes (..., i, j)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = sxy - sx * np.swapaxes(sx, -1, -2) / n
+            var = sxx - sx**2 / n
+            corr = cov / np.sqrt(var * np.swapaxes(var, -1, -2))
+        return np.clip(corr, -1, 1)
+
+    def correlation(self, grids=None, seasons=None, years=None, layer=None):
+        """Correlation matrix (DataFrame) of all rows in the selection."""
+        mask = self._select(grids, seasons, years, layer)
+        sums = [arr[mask].sum(axis=0) for arr in (self._n, self._sx, self._sxx, self._sxy)]
+        return pd.DataFrame(
+            self._correlation(*sums), index=self.variables, columns=self.variables
+        )
+
+    def by_station(self, seasons=None, years=None, layer=None):
+        """Correlation matrix of every station for the selection.
+
+        Returns (stations, matrices) where ``matrices`` is a compact
+        (stations, variables, variables) float32 array, so switching station
+        is an index lookup.
+        """
+        mask = self._select(seasons=seasons, years=years, layer=layer)
+        codes, stations = pd.factorize(self.keys.loc[mask, "Grid"])
+        sums = []
+        for arr in (self._n, self._sx, self._sxx, self._sxy):
+            total = np.zeros((len(stations),) + arr.shape[1:])
+            np.add.at(total, codes, arr[mask])
+            sums.append(total)
+        return pd.Index(stations), self._correlation(*sums).astype(np.float32)
+
+
+def station_matrix(stations, matrices, variables, station):
+    """Correlation DataFrame of ``station`` from ``by_station`` output.
+
+    Stations without rows in the selection (e.g. not sampled in a depth
+    layer) get an all-NaN matrix.
+    """
+    if station in stations:
+        values = matrices[stations.get_loc(station)]
+    else:
+        values = np.full((len(variables), len(variables)), np.nan)
+    return pd.DataFrame(values, index=variables, columns=variables)
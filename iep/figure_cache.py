@@ -0,0 +1,134 @@
+"""Process-wide LRU cache of finished Plotly figures.
+
+Figures are keyed on a normalised filter signature (page, figure name and
+the sorted selections/options that went into them), so a repeat view skips
+the data work and the figure construction. Entries are sized by the arrays
+and strings they hold (``figure_nbytes``) and evicted least-recently-used
+once the memory budget is exceeded.
+
+Cached figures are shared between sessions: callers must build the complete
+figure inside ``build`` and must not modify the returned figure.
+
+The cache keeps the figure objects rather than their JSON: st.plotly_chart
+re-serialises whatever it is given, and rebuilding a figure from JSON costs
+as much as building it from the data (Plotly validates every trace), while
+serialising a finished figure is cheap.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Memory budget in MB, configurable per deployment
+FIGURE_CACHE_MB = float(os.environ.get("IEP_FIGURE_CACHE_MB", 128))
+
+
+def _normalise(value):
+    # Widget values come back as numpy scalars, floats for integer years and
+    # lists in click order; map equal selections to equal keys
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+        items = [_normalise(item) for item in value]
+        return tuple(sorted(items, key=lambda item: (type(item).__name__, str(item))))
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _normalise(v)) for k, v in value.items()))
+    return value
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return sum(_nbytes(item) for item in value)
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, str):
+        return len(value)
+    return 8
+
+
+def figure_nbytes(figure):
+    """Approximate memory of a figure: the bytes of its arrays and strings.
+
+    Cheaper than measuring its JSON, which would serialise every new figure
+    once more on the critical path.
+    """
+    parts = [trace.to_plotly_json() for trace in figure.data]
+    parts.append(figure.layout.to_plotly_json())
+    return _nbytes(parts)
+
+
+def filter_signature(page, figure, **selection):
+    """Hashable key for ``figure`` on ``page`` given the selection/options."""
+    return (page, figure) + tuple(
+        (name, _normalise(value)) for name, value in sorted(selection.items())
+    )
+
+
+class FigureCache:
+    """Thread-safe LRU of figures with a byte budget and hit/miss counters."""
+
+    def __init__(self, max_mb=FIGURE_CACHE_MB):
+        self.max_bytes = int(max_mb * 1e6)
+        self._entries = OrderedDict()  # key -> (figure, size in bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get_or_build(self, key, build):
+        """Return the cached figure for ``key``, calling ``build()`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Build outside the lock so other sessions are not blocked
+        figure = build()
+        size = figure_nbytes(figure)
+        with self._lock:
+            if size > self.max_bytes:
+                return figure  # larger than the whole budget; do not cache
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (figure, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Counters for monitoring: hits, misses, hit rate, entries and size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_mb": self.bytes / 1e6,
+                "budget_mb": self.max_bytes / 1e6,
+            }
@@ -0,0 +1,31 @@
+"""Row selection shared by the pages, batch jobs and benchmarks.
+
+Every page narrows a frame to the grids, seasons and years picked in the
+sidebar. ``select`` does that for the dataset and for the per-profile tables
+(casts, MLD), using their integer ``year`` column (or ``datetime`` for frames
+that were not prepared).
+"""
+
+import numpy as np
+
+from .classification import LABEL_COL
+from .profiles import profile_years
+
+
+def select(frame, grids=None, seasons=None, years=None, water_masses=None):
+    """Rows of ``frame`` in the given grids, seasons, years and water masses.
+
+    ``None`` keeps every value of that column; an empty list keeps none.
+    """
+    mask = np.ones(len(frame), dtype=bool)
+    if grids is not None:
+        mask &= frame["Grid"].isin(grids).to_numpy()
+    if seasons is not None:
+        mask &= frame["season"].isin(seasons).to_numpy()
+    if years is not None:
+        mask &= profile_years(frame).isin(years).to_numpy()
+    if water_masses is not None:
+        mask &= frame[LABEL_COL].isin(water_masses).to_numpy()
+    if mask.all():
+        return frame
+    return frame[mask]
@@ -0,0 +1,50 @@
+"""Potential density (sigma-0) grids for the isopycnals of T-S diagrams."""
+
+import numpy as np
+
+from .classification import SAL_COL, TEMP_COL
+
+# Isopycnal grid resolutions: (salinity step [psu], temperature step [°C])
+ISOPYCNAL_RESOLUTIONS = {
+    "Coarse": (0.1, 1.0),
+    "Medium": (0.05, 0.5),
+    "Fine": (0.01, 0.1),
+}
+
+
+def isopycnal_grid(s_min, s_max, t_min, t_max, sal_step=0.1, temp_step=1.0):
+    """Salinity axis, temperature axis and sigma-0 on their grid."""
+    xdim = int(np.ceil((s_max - s_min) / sal_step))
+    ydim = int(np.ceil((t_max - t_min) / temp_step))
+
+    ti = np.linspace(t_min, t_max, ydim)
+    si = np.linspace(s_min, s_max, xdim)
+
+    # One broadcast TEOS-10 call over the whole (T, S) grid; gsw is only
+    # imported when a T-S diagram is first drawn
+    import gsw
+
+    sal_grid, temp_grid = np.meshgrid(si, ti)
+    dens = gsw.rho(sal_grid, temp_grid, 0) - 1000
+
+    return si, ti, dens
+
+
+def isopycnal_bounds(data, sal_step=0.1, temp_step=1.0):
+    """Grid bounds covering ``data``, snapped so nearby selections match.
+
+    The data range is padded by 1 unit and snapped outwards to the grid
+    steps, so a cached grid is shared by selections with similar ranges.
+    """
+
+    def snap(value, step, pad, round_fn):
+        return float(round(round_fn((value + pad) / step) * step, 6))
+
+    sal = data[SAL_COL]
+    temp = data[TEMP_COL]
+    return (
+        snap(sal.min(), sal_step, -1, np.floor),
+        snap(sal.max(), sal_step, 1, np.ceil),
+        snap(temp.min(), temp_step, -1, np.floor),
+        snap(temp.max(), temp_step, 1, np.ceil),
+    )
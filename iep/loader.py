@@ -0,0 +1,218 @@
+"""Load the IEP Excel workbooks through a columnar on-disk cache.
+
+Parsing the workbooks with openpyxl takes seconds, so the first load converts
+the sheet to a typed Parquet file named after the SHA-256 of the source file.
+Later loads (new server processes, evicted caches) read that file instead.
+
+Run ``python -m iep.loader [workbook]`` to report cold vs warm load timings
+and the memory saved by the compact schema.
+"""
+
+import hashlib
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .classification import (
+    DENS_COL,
+    LABEL_COL,
+    SAL_COL,
+    TEMP_COL,
+    classify_water_masses,
+)
+from .profiles import bin_profiles, sort_profiles
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = Path("data/IEP_2017_2018.xlsx")
+CACHE_DIR = Path("data/.cache")
+# Columns of the IEP workbooks, which .cnv casts and synthetic data follow
+WORKBOOK_COLUMNS = [
+    "Cruise",
+    "Station",
+    "Grid",
+    "Lat (°S)",
+    "Lon (°E)",
+    "datetime",
+    "season",
+    "Pressure [db]",
+    "Depth [m]",
+    "Temperature [ITS90,°C]",
+    "Salinity [psu]",
+    "Oxygen [ml/l]",
+    "Flourescence [mg/m^3]",
+    "Density Derived [sigma-theta, kg/m^3]",
+]
+# Text columns with at most this share of distinct values become categoricals
+CATEGORICAL_MAX_RATIO = 0.5
+# float64 columns become float32 when no value moves by more than this, well
+# below the resolution of the CTD sensors (0.0002 °C, 0.0003 psu)
+FLOAT32_TOLERANCE = 1e-4
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of ``path``, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path_for(source, cache_dir=CACHE_DIR):
+    """Parquet cache location for ``source``, keyed on its content hash."""
+    source = Path(source)
+    return Path(cache_dir) / f"{source.stem}-{file_digest(source)[:16]}.parquet"
+
+
+def _to_arrow_table(df):
+    # Excel columns can mix numbers and text (e.g. station codes); Arrow needs
+    # one type per column, so mixed object columns are stored as strings.
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if not values.map(type).eq(str).all():
+            df[col] = df[col].map(lambda x: x if pd.isna(x) else str(x))
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _write_cache(df, cache_file):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # Drop caches built from older versions of the same workbook
+    stem = cache_file.name.rsplit("-", 1)[0]
+    for stale in cache_file.parent.glob(f"{stem}-*.parquet"):
+        if stale != cache_file:
+            stale.unlink(missing_ok=True)
+    tmp_file = cache_file.with_suffix(".parquet.tmp")
+    pq.write_table(_to_arrow_table(df), tmp_file)
+    tmp_file.replace(cache_file)  # atomic, so concurrent workers never see half a file
+
+
+def load_data(source=DATA_FILE, cache_dir=CACHE_DIR, cache=True):
+    """Load an Excel workbook, converting it to Parquet on first use.
+
+    With ``cache=False`` the workbook is read without the Parquet cache,
+    for callers that keep their own copy (``store.add_workbook``).
+    """
+    start = time.perf_counter()
+    if not cache:
+        df = pd.read_excel(source)
+        logger.info("Loaded %s from Excel in %.3fs", source, time.perf_counter() - start)
+        return df
+    cache_file = cache_path_for(source, cache_dir)
+    if cache_file.exists():
+        df = pq.read_table(cache_file).to_pandas()
+        logger.info(
+            "Loaded %s from cache in %.3fs", source, time.perf_counter() - start
+        )
+        return df
+
+    df = pd.read_excel(source)
+    try:
+        _write_cache(df, cache_file)
+    except OSError as exc:  # read-only deploys still work, just without a cache
+        logger.warning("Could not write Parquet cache %s: %s", cache_file, exc)
+    logger.info("Loaded %s from Excel in %.3fs", source, time.perf_counter() - start)
+    return df
+
+
+def memory_mb(df):
+    """In-memory size of ``df`` in MB, including the strings it holds."""
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def compact_schema(df):
+    """Return ``df`` with a smaller in-memory schema.
+
+    Repeated text columns (Grid, season, Cruise, Station) become
+    categoricals, float64 columns become float32 where that changes no value
+    by more than ``FLOAT32_TOLERANCE``, and ``year`` becomes int16.
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            if values.nunique() <= CATEGORICAL_MAX_RATIO * len(values):
+                columns[col] = values.astype("category")
+        elif values.dtype == np.float64:
+            narrow = values.to_numpy(dtype=np.float32)
+            error = np.abs(narrow - values.to_numpy())
+            if not (error > FLOAT32_TOLERANCE).any():
+                columns[col] = narrow
+    if "year" in df.columns and df["year"].notna().all():
+        columns["year"] = df["year"].astype(np.int16)
+    return df.assign(**columns)
+
+
+def prepare_dataset(df, bin_size=None, compact=True):
+    """Apply the one-off preprocessing every page relies on.
+
+    Adds an integer ``year`` column and negative latitudes, and with
+    ``bin_size`` (metres) averages each profile onto standard depth bins.
+    With ``compact`` the result gets the smaller schema of
+    ``compact_schema``. Returns a new frame; the pages treat the result as
+    read-only and share it across sessions, so nothing downstream should
+    modify it in place.
+    """
+    df = df.copy()
+    if "Lat (°S)" in df.columns:
+        # Ensure all latitude values are negative
+        df["Lat (°S)"] = -df["Lat (°S)"].abs()
+    if "datetime" in df.columns:
+        # Survey year, so filters and indexes need not call .dt.year
+        df["year"] = df["datetime"].dt.year.astype("Int16")
+    if {"Grid", "season", "datetime"}.issubset(df.columns):
+        # Contiguous, depth-sorted profiles for profiles.ProfileIndex
+        df = sort_profiles(df)
+        if bin_size:
+            df = bin_profiles(df, bin_size)
+    if {TEMP_COL, SAL_COL, DENS_COL}.issubset(df.columns):
+        df[LABEL_COL] = classify_water_masses(df)
+    if compact:
+        df = compact_schema(df)
+    return df
+
+
+def time_load(source=DATA_FILE, cache_dir=CACHE_DIR):
+    """Time a cold (Excel) load followed by a warm (Parquet) load."""
+    cache_file = cache_path_for(source, cache_dir)
+    cache_file.unlink(missing_ok=True)
+
+    start = time.perf_counter()
+    cold = load_data(source, cache_dir)
+    cold_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm = load_data(source, cache_dir)
+    warm_s = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(cold, warm, check_dtype=False)
+    return {
+        "rows": len(warm),
+        "cold_s": cold_s,
+        "warm_s": warm_s,
+        "wide_mb": memory_mb(prepare_dataset(warm, compact=False)),
+        "compact_mb": memory_mb(prepare_dataset(warm)),
+    }
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    timings = time_load(source)
+    print(
+        f"{source}: {timings['rows']} rows | "
+        f"cold (Excel) {timings['cold_s']:.3f}s | "
+        f"warm (Parquet) {timings['warm_s']:.3f}s | "
+        f"speedup {timings['cold_s'] / timings['warm_s']:.0f}x"
+    )
+    print(
+        f"prepared in memory: {timings['wide_mb']:.1f} MB as loaded, "
+        f"{timings['compact_mb']:.1f} MB compact "
+        f"({timings['wide_mb'] / timings['compact_mb']:.1f}x smaller)"
+    )
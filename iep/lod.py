@@ -0,0 +1,74 @@
+"""Level of detail for large scatter plots.
+
+SVG scatter traces stall the browser beyond roughly 100k points, so large
+scatters are (1) drawn with WebGL (``go.Scattergl``) above ``WEBGL_THRESHOLD``
+points and (2) reduced on the server before serialisation by binning the
+points on a 2-D histogram and plotting one marker per occupied bin.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+WEBGL_THRESHOLD = 10_000
+DEFAULT_MAX_POINTS = 20_000
+# Choices offered by the "Max points per chart" sidebar setting
+MAX_POINTS_OPTIONS = [5_000, 20_000, 50_000, 200_000]
+COUNT_COL = "count"
+
+
+def scatter_trace_type(n_points, threshold=WEBGL_THRESHOLD):
+    """``go.Scattergl`` for large point counts, ``go.Scatter`` otherwise."""
+    return go.Scattergl if n_points > threshold else go.Scatter
+
+
+def density_bin(data, x, y, max_points=DEFAULT_MAX_POINTS, mean_cols=(), by=None):
+    """Reduce ``data`` to at most about ``max_points`` markers.
+
+    Points are binned on a square grid over the x/y range (sqrt(max_points)
+    bins per axis) and each occupied bin becomes one row at the mean x/y of
+    its points, with the mean of every column in ``mean_cols`` and the number
+    of points in ``count``. With ``by`` bins are kept separate per group, so
+    e.g. water masses are never merged. Data that already fits is returned
+    unchanged with a count of 1.
+    """
+    columns = [x, y, *mean_cols] + ([by] if by else [])
+    data = data[columns].dropna(subset=[x, y])
+    if len(data) <= max_points:
+        return data.assign(**{COUNT_COL: 1})
+
+    n_bins = max(int(np.sqrt(max_points)), 1)
+    xs = data[x].to_numpy(dtype=float)
+    ys = data[y].to_numpy(dtype=float)
+    ix = _bin_index(xs, n_bins)
+    iy = _bin_index(ys, n_bins)
+    key = ix * n_bins + iy
+    if by:
+        key = key + pd.factorize(data[by])[0] * n_bins * n_bins
+
+    _, first, bin_of_row, counts = np.unique(
+        key, return_index=True, return_inverse=True, return_counts=True
+    )
+    binned = {
+        x: np.bincount(bin_of_row, weights=xs) / counts,
+        y: np.bincount(bin_of_row, weights=ys) / counts,
+    }
+    for col in mean_cols:
+        values = data[col].to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        totals = np.bincount(bin_of_row[present], weights=values[present], minlength=len(counts))
+        n_present = np.bincount(bin_of_row[present], minlength=len(counts))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            binned[col] = totals / n_present
+    if by:
+        binned[by] = data[by].to_numpy()[first]
+    binned[COUNT_COL] = counts
+    return pd.DataFrame(binned)
+
+
+def _bin_index(values, n_bins):
+    low, high = values.min(), values.max()
+    if high <= low:
+        return np.zeros(len(values), dtype=np.int64)
+    index = ((values - low) / (high - low) * n_bins).astype(np.int64)
+    return np.minimum(index, n_bins - 1)
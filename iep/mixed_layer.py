@@ -0,0 +1,284 @@
+"""Mixed layer depth (MLD) for every profile in the dataset at once.
+
+The dataset is sorted so each profile is a contiguous, depth-sorted block of
+rows (see profiles.ProfileIndex). The MLD methods below work on the whole
+column arrays at once: profiles are told apart by a per-row profile id, the
+reference value at 10 m is found with one ``searchsorted`` over all profiles,
+and threshold crossings are linearly interpolated between samples. Computing
+MLD for every profile therefore costs a handful of numpy passes.
+
+Methods (``MLD_METHODS``):
+
+* Temperature threshold: temperature drops ``threshold`` °C below its value
+  at the reference depth.
+* Density threshold: sigma-theta rises ``threshold`` kg/m³ above its value at
+  the reference depth (0.03 and 0.125 kg/m³ are the usual criteria).
+* Maximum gradient: depth of the strongest sigma-theta gradient below the
+  reference depth.
+* Hybrid: the density threshold MLD, moved up to the maximum-gradient depth
+  when a sharp pycnocline sits above it.
+
+Profiles that never meet a threshold are mixed to the bottom, so their
+deepest sample is returned.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .profiles import PROFILE_KEYS
+
+DEPTH_COL = "Depth [m]"
+TEMP_COL = "Temperature [ITS90,°C]"
+DENS_COL = "Density Derived [sigma-theta, kg/m^3]"
+MLD_COL = "MLD [m]"
+
+REFERENCE_DEPTH = 10.0
+# Density gradient [kg/m^4] above which the hybrid method trusts the gradient
+SHARP_GRADIENT = 0.01
+
+
+def _profile_ids(starts, n_rows):
+    # Profile number of every row, given the first row of each profile
+    lengths = np.diff(np.append(starts, n_rows))
+    return np.repeat(np.arange(len(starts)), lengths)
+
+
+def _profile_arrays(data, starts, column):
+    # Profile id, depth and value of the rows where both are present
+    pid = _profile_ids(starts, len(data))
+    depth = data[DEPTH_COL].to_numpy(dtype=float)
+    value = data[column].to_numpy(dtype=float)
+    valid = np.isfinite(depth) & np.isfinite(value)
+    return pid[valid], depth[valid], value[valid]
+
+
+def _profile_bounds(pid, n_profiles):
+    # [first, end) rows of each profile; first == end for empty profiles
+    profiles = np.arange(n_profiles)
+    return np.searchsorted(pid, profiles), np.searchsorted(pid, profiles, "right")
+
+
+def _value_at_depth(pid, depth, value, n_profiles, ref_depth):
+    """Interpolate each profile at ``ref_depth``.
+
+    Profiles starting below ``ref_depth`` use their shallowest sample and
+    profiles ending above it their deepest. Returns (reference depth,
+    reference value) per profile, NaN for empty profiles.
+    """
+    first, end = _profile_bounds(pid, n_profiles)
+    ref_d = np.full(n_profiles, np.nan)
+    ref_v = np.full(n_profiles, np.nan)
+    if len(depth) == 0:
+        return ref_d, ref_v
+
+    # Depth increases within each profile, so offsetting every profile by a
+    # span larger than any depth range gives one sorted key for searchsorted
+    d_min = depth.min()
+    span = depth.max() - d_min + 1
+    key = pid * span + (depth - d_min)
+    target = np.arange(n_profiles) * span + max(ref_depth - d_min, 0)
+    below = np.clip(np.searchsorted(key, target), first, end)
+
+    has_rows = end > first
+    starts_deep = has_rows & (below == first)
+    ends_shallow = has_rows & (below == end)
+    between = has_rows & ~starts_deep & ~ends_shallow
+
+    ref_d[starts_deep] = depth[first[starts_deep]]
+    ref_v[starts_deep] = value[first[starts_deep]]
+    ref_d[ends_shallow] = depth[end[ends_shallow] - 1]
+    ref_v[ends_shallow] = value[end[ends_shallow] - 1]
+
+    lo, hi = below[between] - 1, below[between]
+    weight = (ref_depth - depth[lo]) / (depth[hi] - depth[lo])
+    ref_d[between] = ref_depth
+    ref_v[between] = value[lo] + weight * (value[hi] - value[lo])
+    return ref_d, ref_v
+
+
+def _first_per_profile(rows, pid, n_profiles):
+    # First of ``rows`` (sorted row numbers) in each profile, -1 where none
+    first = np.full(n_profiles, -1)
+    profiles, pos = np.unique(pid[rows], return_index=True)
+    first[profiles] = rows[pos]
+    return first
+
+
+def _threshold_mld(data, starts, column, delta, ref_depth):
+    """Depth where ``column`` first moves ``delta`` away from its reference.
+
+    ``delta`` is signed: negative for a temperature drop, positive for a
+    density increase. The crossing is interpolated between the last sample
+    that has not crossed (or the reference point) and the first that has.
+    """
+    n_profiles = len(starts)
+    pid, depth, value = _profile_arrays(data, starts, column)
+    first, end = _profile_bounds(pid, n_profiles)
+    ref_d, ref_v = _value_at_depth(pid, depth, value, n_profiles, ref_depth)
+    target = ref_v + delta
+
+    crossed = (depth >= ref_d[pid]) & (np.sign(delta) * (value - target[pid]) >= 0)
+    cross = _first_per_profile(np.flatnonzero(crossed), pid, n_profiles)
+
+    mld = np.full(n_profiles, np.nan)
+    no_cross = (cross < 0) & (end > first)
+    mld[no_cross] = depth[end[no_cross] - 1]  # mixed to the bottom
+
+    has_cross = cross >= 0
+    hi = cross[has_cross]
+    prev = hi - 1
+    # Interpolate from the previous sample if it lies below the reference
+    # depth in the same profile, otherwise from the reference point itself
+    use_prev = (prev >= first[has_cross]) & (depth[np.maximum(prev, 0)] >= ref_d[has_cross])
+    d0 = np.where(use_prev, depth[np.maximum(prev, 0)], ref_d[has_cross])
+    v0 = np.where(use_prev, value[np.maximum(prev, 0)], ref_v[has_cross])
+    d1, v1 = depth[hi], value[hi]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac = (target[has_cross] - v0) / (v1 - v0)
+    mld[has_cross] = np.where(np.isfinite(frac), d0 + frac * (d1 - d0), d1)
+    return mld
+
+
+def _max_gradient(data, starts, column, ref_depth):
+    # (depth, gradient) of the strongest positive d(column)/dz per profile,
+    # taken at the midpoint between samples below the reference depth
+    n_profiles = len(starts)
+    pid, depth, value = _profile_arrays(data, starts, column)
+    depth_at = np.full(n_profiles, np.nan)
+    strength = np.full(n_profiles, np.nan)
+    if len(depth) < 2:
+        return depth_at, strength
+
+    dz = np.diff(depth)
+    usable = (pid[1:] == pid[:-1]) & (dz > 0) & (depth[:-1] >= ref_depth)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gradient = np.where(usable, np.diff(value) / dz, -np.inf)
+    mid_depth = depth[:-1] + dz / 2
+
+    # Strongest gradient first within each profile
+    order = np.lexsort((-gradient, pid[:-1]))
+    order = order[usable[order]]
+    profiles, pos = np.unique(pid[:-1][order], return_index=True)
+    best = order[pos]
+    depth_at[profiles] = mid_depth[best]
+    strength[profiles] = gradient[best]
+    return depth_at, strength
+
+
+def temperature_threshold_mld(data, starts, threshold=0.5, ref_depth=REFERENCE_DEPTH):
+    """Depth where temperature is ``threshold`` °C below its reference value."""
+    return _threshold_mld(data, starts, TEMP_COL, -threshold, ref_depth)
+
+
+def density_threshold_mld(data, starts, threshold=0.03, ref_depth=REFERENCE_DEPTH):
+    """Depth where sigma-theta is ``threshold`` kg/m³ above its reference value."""
+    return _threshold_mld(data, starts, DENS_COL, threshold, ref_depth)
+
+
+def max_gradient_mld(data, starts, threshold=None, ref_depth=REFERENCE_DEPTH):
+    """Depth of the strongest sigma-theta gradient (``threshold`` is unused)."""
+    depth_at, _ = _max_gradient(data, starts, DENS_COL, ref_depth)
+    return depth_at
+
+
+def hybrid_mld(data, starts, threshold=0.03, ref_depth=REFERENCE_DEPTH):
+    """Density threshold MLD, capped by a sharp pycnocline above it.
+
+    Where the strongest density gradient exceeds ``SHARP_GRADIENT`` kg/m⁴ and
+    lies above the threshold MLD, its depth is used instead; weak or noisy
+    gradients fall back to the threshold estimate.
+    """
+    mld = density_threshold_mld(data, starts, threshold, ref_depth)
+    depth_at, strength = _max_gradient(data, starts, DENS_COL, ref_depth)
+    sharp = (strength >= SHARP_GRADIENT) & (depth_at < mld)
+    return np.where(sharp, depth_at, mld)
+
+
+MLD_METHODS = {
+    "Temperature threshold": temperature_threshold_mld,
+    "Density threshold": density_threshold_mld,
+    "Maximum gradient": max_gradient_mld,
+    "Hybrid": hybrid_mld,
+}
+
+# Threshold choices offered for each method; the first is the default
+MLD_THRESHOLDS = {
+    "Temperature threshold": [0.5, 0.2],
+    "Density threshold": [0.03, 0.125],
+    "Maximum gradient": [],
+    "Hybrid": [0.03, 0.125],
+}
+
+MLD_UNITS = {
+    "Temperature threshold": "°C",
+    "Density threshold": "kg/m³",
+    "Hybrid": "kg/m³",
+}
+
+
+def mld_criteria():
+    """(method, threshold, label) for every method and threshold choice."""
+    criteria = []
+    for method, thresholds in MLD_THRESHOLDS.items():
+        for threshold in thresholds or [None]:
+            label = (
+                f"{method} ({threshold} {MLD_UNITS[method]})"
+                if threshold is not None
+                else method
+            )
+            criteria.append((method, threshold, label))
+    return criteria
+
+
+def mld_comparison(profiles, tables):
+    """MLD of the given profiles under several methods.
+
+    ``profiles`` has Grid, season and year columns; ``tables`` maps a column
+    label to an ``mld_table``. Returns the profile keys with one MLD column
+    per label.
+    """
+    comparison = profiles[PROFILE_KEYS].reset_index(drop=True)
+    for label, table in tables.items():
+        comparison[label] = comparison.merge(
+            table[PROFILE_KEYS + [MLD_COL]], on=PROFILE_KEYS, how="left"
+        )[MLD_COL].to_numpy()
+    return comparison
+
+
+def mld_table(profile_index, method="Temperature threshold", threshold=None):
+    """Tidy table of MLD for every profile in ``profile_index``.
+
+    Columns: Grid, season, year, Lat (°S), Lon (°E), MLD [m], method.
+    ``threshold`` defaults to the method's first entry in ``MLD_THRESHOLDS``.
+    """
+    table = profile_index.table()
+    columns = ["Grid", "season", "year", "Lat (°S)", "Lon (°E)", MLD_COL, "method"]
+    if table.empty:
+        return pd.DataFrame(columns=columns)
+    if threshold is None and MLD_THRESHOLDS[method]:
+        threshold = MLD_THRESHOLDS[method][0]
+
+    # Profiles are in row order and undated rows come last, so the profiles
+    # tile the first table.stop.max() rows
+    data = profile_index.data.iloc[: table["stop"].max()]
+    starts = table["start"].to_numpy()
+
+    table["Lat (°S)"] = data["Lat (°S)"].to_numpy()[starts]
+    table["Lon (°E)"] = data["Lon (°E)"].to_numpy()[starts]
+    table[MLD_COL] = MLD_METHODS[method](data, starts, threshold)
+    table["method"] = method
+    return table[columns]
+
+
+def mld_criteria_table(profile_index):
+    """``mld_table`` of every method and threshold in ``mld_criteria``.
+
+    Adds a ``threshold`` column, NaN for methods without one.
+    """
+    tables = [
+        mld_table(profile_index, method, threshold).assign(
+            threshold=np.nan if threshold is None else threshold
+        )
+        for method, threshold, _ in mld_criteria()
+    ]
+    return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,33 @@
+"""Process pools and option parsing shared by the batch CLIs.
+
+``iep.atlas`` and ``iep.products`` spread casts or surveys over a process
+pool whose workers read their settings from ``worker``.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Settings of this worker process (set by the pool's initializer)
+worker = {}
+
+
+def _init_worker(settings, warm_up):
+    worker.update(settings)
+    if warm_up is not None:
+        warm_up()
+
+
+def process_pool(n_tasks, workers=None, warm_up=None, **settings):
+    """ProcessPoolExecutor whose workers find ``settings`` in ``worker``.
+
+    Starts ``workers`` processes (default: one per CPU), but no more than
+    there are tasks. ``warm_up``, a module-level function, runs once in
+    each worker after its settings are set.
+    """
+    workers = min(workers or os.cpu_count() or 1, max(n_tasks, 1))
+    return ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(settings, warm_up))
+
+
+def split_option(values):
+    """Values of a comma-separated command line option; None when not given."""
+    return None if values is None else [value.strip() for value in values.split(",")]
@@ -0,0 +1,194 @@
+"""Batch export of derived products as tidy Parquet or CSV tables.
+
+The pages compute their analyses for one selection at a time. ``export_products``
+computes them for every cast in a selection (default: the whole store) and
+writes one table per product (``PRODUCTS``):
+
+* ``mld``: one row per profile and MLD criterion (``mld_criteria_table``);
+* ``water_masses``: one row per sample with its position, depth, T-S values
+  and water mass label;
+* ``profile_stats``: one row per profile and variable with the count, mean,
+  standard deviation, minimum and maximum of its samples.
+
+Surveys (year, season) are spread over a process pool; each worker reads only
+its survey's row groups from the store (``iep.store``). ``_products.json``
+records the store version and settings the tables were computed from, so a
+reader can tell when they are out of date.
+
+Run ``python -m iep.products --output products/`` (see ``--help`` for the
+selection, depth resolution and format).
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .classification import DENS_COL, LABEL_COL, SAL_COL, TEMP_COL
+from .filters import select
+from .loader import prepare_dataset
+from .mixed_layer import mld_criteria_table
+from .parallel import process_pool, split_option, worker
+from .profiles import DEPTH_COL, PROFILE_KEYS, ProfileIndex
+from .store import STORE_DIR, read_catalog, read_store, selection_version, survey_versions, sync_store
+
+PRODUCTS = ["mld", "water_masses", "profile_stats"]
+FORMATS = ["parquet", "csv"]
+MANIFEST_FILE = "_products.json"
+SAMPLE_COLUMNS = PROFILE_KEYS + [
+    "datetime", "Lat (°S)", "Lon (°E)", DEPTH_COL, TEMP_COL, SAL_COL, DENS_COL, LABEL_COL
+]
+STAT_VARIABLES = [TEMP_COL, SAL_COL, DENS_COL, "Oxygen [ml/l]", "Flourescence [mg/m^3]"]
+
+
+def water_mass_table(profile_index):
+    """Samples of every profile in ``profile_index`` with their water mass."""
+    table = profile_index.table()
+    data = profile_index.data.iloc[: table["stop"].max() if len(table) else 0]
+    return data[[col for col in SAMPLE_COLUMNS if col in data.columns]].reset_index(drop=True)
+
+
+def profile_stats(profile_index, variables=STAT_VARIABLES):
+    """Count, mean, std, min and max of each variable in every profile.
+
+    Long format: Grid, season, year, variable and one column per statistic.
+    """
+    table = profile_index.table()
+    columns = PROFILE_KEYS + ["variable", "count", "mean", "std", "min", "max"]
+    if table.empty:
+        return pd.DataFrame(columns=columns)
+    data = profile_index.data.iloc[: table["stop"].max()]
+    profile = np.repeat(np.arange(len(table)), (table["stop"] - table["start"]).to_numpy())
+    variables = [var for var in variables if var in data.columns]
+    stats = (
+        data[variables]
+        .astype(float)
+        .groupby(profile)
+        .agg(["count", "mean", "std", "min", "max"])
+        .stack(level=0, future_stack=True)
+        .rename_axis(["profile", "variable"])
+        .reset_index()
+    )
+    keys = table[PROFILE_KEYS].iloc[stats["profile"]].reset_index(drop=True)
+    return pd.concat([keys, stats.drop(columns="profile")], axis=1)[columns]
+
+
+PRODUCT_TABLES = {"mld": mld_criteria_table, "water_masses": water_mass_table, "profile_stats": profile_stats}
+
+
+def product_surveys(catalog, grids=None, seasons=None, years=None):
+    """(year, season) of every survey with a selected cast, in time order."""
+    casts = select(catalog, grids=grids, seasons=seasons, years=years)
+    surveys = casts[["year", "season"]].drop_duplicates().sort_values(["year", "season"])
+    return [(int(year), season) for year, season in zip(surveys["year"], surveys["season"])]
+
+
+def _survey_products(survey):
+    # Tables (product name, frame) of one survey, computed by this worker
+    year, season = survey
+    data = prepare_dataset(
+        read_store(worker["root"], grids=worker["grids"], seasons=[season], years=[year]),
+        worker["bin_size"],
+    )
+    index = ProfileIndex(data)
+    return [(name, PRODUCT_TABLES[name](index)) for name in worker["products"]]
+
+
+def _write_table(table, path, file_format):
+    if file_format == "csv":
+        table.to_csv(path, index=False)
+    else:
+        table.to_parquet(path, index=False)
+
+
+def export_products(
+    output,
+    grids=None,
+    seasons=None,
+    years=None,
+    products=tuple(PRODUCTS),
+    file_format="parquet",
+    bin_size=None,
+    workers=None,
+    root=STORE_DIR,
+):
+    """Write ``products`` of every selected cast to ``output/<product>.<format>``.
+
+    Returns the number of surveys processed.
+    """
+    surveys = product_surveys(read_catalog(root), grids, seasons, years)
+    tables = {name: [] for name in products}
+    with process_pool(
+        len(surveys), workers, root=root, grids=grids, bin_size=bin_size, products=list(products)
+    ) as pool:
+        # Results come back in survey order, so the tables are in time order
+        for survey_tables in pool.map(_survey_products, surveys):
+            for name, table in survey_tables:
+                tables[name].append(table)
+
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    for name, parts in tables.items():
+        parts = [part for part in parts if not part.empty]
+        if parts:
+            table = pd.concat(parts, ignore_index=True)
+        else:
+            table = PRODUCT_TABLES[name](ProfileIndex(pd.DataFrame()))
+        _write_table(table, output / f"{name}.{file_format}", file_format)
+    manifest = {
+        "store_version": selection_version(survey_versions(root), seasons, years),
+        "grids": grids,
+        "seasons": seasons,
+        "years": years,
+        "bin_size": bin_size,
+        "products": list(products),
+        "format": file_format,
+    }
+    (output / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    return len(surveys)
+
+
+def read_product(name, folder):
+    """A table written by ``export_products``."""
+    manifest = json.loads((Path(folder) / MANIFEST_FILE).read_text())
+    path = Path(folder) / f"{name}.{manifest['format']}"
+    return pd.read_csv(path) if manifest["format"] == "csv" else pd.read_parquet(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", required=True, help="Folder for the tables")
+    parser.add_argument("--grids", help="Comma-separated grid stations (default: all)")
+    parser.add_argument("--seasons", help="Comma-separated seasons (default: all)")
+    parser.add_argument("--years", help="Comma-separated years (default: all)")
+    parser.add_argument("--products", default=",".join(PRODUCTS), help="From " + ", ".join(PRODUCTS))
+    parser.add_argument("--format", default="parquet", choices=FORMATS)
+    parser.add_argument("--bin-size", type=float, help="Average profiles onto depth bins [m]")
+    parser.add_argument("--workers", type=int, help="Processes (default: one per CPU)")
+    args = parser.parse_args()
+    products = split_option(args.products)
+    unknown = set(products) - set(PRODUCTS)
+    if unknown:
+        parser.error(f"unknown products: {', '.join(sorted(unknown))}")
+
+    years = split_option(args.years)
+    start = time.perf_counter()
+    sync_store()
+    n_surveys = export_products(
+        args.output,
+        grids=split_option(args.grids),
+        seasons=split_option(args.seasons),
+        years=None if years is None else [int(year) for year in years],
+        products=products,
+        file_format=args.format,
+        bin_size=args.bin_size,
+        workers=args.workers,
+    )
+    print(f"{len(products)} products of {n_surveys} surveys written in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Index of CTD profiles, one per (Grid, season, year).
+
+The pages used to rebuild a boolean mask over the whole frame for every
+station/season/year combination. Instead the dataset is sorted once so that
+each profile occupies a contiguous block of rows ordered by depth, and
+``ProfileIndex`` maps every key to that block.
+"""
+
+import numpy as np
+import pandas as pd
+
+PROFILE_KEYS = ["Grid", "season", "year"]
+DEPTH_COL = "Depth [m]"
+CAST_COLUMNS = PROFILE_KEYS + ["date", "Lat (°S)", "Lon (°E)", "samples", "Max depth [m]"]
+
+
+def profile_years(df):
+    """Year of every row: the ``year`` column if present, else from ``datetime``."""
+    if "year" in df.columns:
+        return df["year"]
+    return df["datetime"].dt.year
+
+
+def _profile_codes(df):
+    # Integer codes that keep the order of first appearance, so sorting by them
+    # does not change what data["Grid"].unique() returns.
+    year = profile_years(df)
+    return [pd.factorize(values)[0] for values in (df["Grid"], df["season"], year)]
+
+
+def sort_profiles(df, depth_col=DEPTH_COL):
+    """Return ``df`` reordered so each profile is contiguous and depth-sorted."""
+    if df.empty:
+        return df.reset_index(drop=True)
+    grid, season, year = _profile_codes(df)
+    # np.lexsort sorts on its last key first: rows without a date go last,
+    # so indexed profiles tile the start of the frame
+    sort_keys = [year, season, grid, year < 0]
+    if depth_col in df.columns:
+        sort_keys.insert(0, df[depth_col].to_numpy())
+    order = np.lexsort(sort_keys)
+    return df.take(order).reset_index(drop=True)
+
+
+class ProfileIndex:
+    """Map (Grid, season, year) to the rows of that profile in ``data``.
+
+    ``data`` must be sorted with ``sort_profiles``; lookups then return a slice
+    of it without scanning or copying the frame. Profiles are kept in row
+    order and cover every row up to the first undated one. A ``table`` of
+    ``data`` saved earlier (see ``table()``) is used instead of a scan.
+    """
+
+    def __init__(self, data, table=None):
+        self.data = data
+        self._slices = {}
+        if table is not None:
+            for grid, season, year, start, stop in zip(*(table[col] for col in [*PROFILE_KEYS, "start", "stop"])):
+                self._slices[(grid, season, int(year))] = (int(start), int(stop))
+            return
+        n_rows = len(data)
+        if n_rows == 0:
+            return
+
+        # A profile starts wherever any key differs from the previous row
+        same_profile = np.ones(n_rows - 1, dtype=bool)
+        for code in _profile_codes(data):
+            same_profile &= code[1:] == code[:-1]
+        starts = np.flatnonzero(np.append(True, ~same_profile))
+        stops = np.append(starts[1:], n_rows)
+
+        grids = data["Grid"].to_numpy()[starts]
+        seasons = data["season"].to_numpy()[starts]
+        years = profile_years(data).to_numpy()[starts]
+        for grid, season, year, start, stop in zip(grids, seasons, years, starts, stops):
+            if pd.isna(year):
+                continue  # casts without a date cannot be selected by year
+            key = (grid, season, int(year))
+            if key in self._slices:
+                raise ValueError(
+                    f"Profile {key} is not contiguous; sort the data with sort_profiles"
+                )
+            self._slices[key] = (start, stop)
+
+    def __len__(self):
+        return len(self._slices)
+
+    def __contains__(self, key):
+        return key in self._slices
+
+    def keys(self):
+        return self._slices.keys()
+
+    def table(self):
+        """One row per profile: its key and the [start, stop) rows in ``data``."""
+        keys = list(self._slices)
+        bounds = np.array(list(self._slices.values()), dtype=np.int64).reshape(-1, 2)
+        table = pd.DataFrame(keys, columns=PROFILE_KEYS)
+        table["start"] = bounds[:, 0]
+        table["stop"] = bounds[:, 1]
+        return table
+
+    def get(self, grid, season, year):
+        """Rows of one profile sorted by depth, or None if it was not sampled."""
+        bounds = self._slices.get((grid, season, year))
+        if bounds is None:
+            return None
+        return self.data.iloc[bounds[0] : bounds[1]]
+
+
+def bin_profiles(data, bin_size=1.0, depth_col=DEPTH_COL):
+    """Average every profile onto standard depths every ``bin_size`` metres.
+
+    ``data`` must be sorted with ``sort_profiles``. Samples are assigned to
+    the nearest multiple of ``bin_size`` and numeric columns are averaged per
+    (profile, depth bin), ignoring missing values; other columns (Grid,
+    season, datetime, ...) keep the value of the bin's first sample. Undated
+    rows and rows without a depth are dropped. The result is sorted the same
+    way as ``data``, so it can be indexed with ``ProfileIndex``.
+    """
+    table = ProfileIndex(data).table()
+    if table.empty:
+        return data.iloc[:0]
+    data = data.iloc[: table["stop"].max()]
+    lengths = (table["stop"] - table["start"]).to_numpy()
+    pid = np.repeat(np.arange(len(table)), lengths)
+
+    depth = data[depth_col].to_numpy(dtype=float)
+    has_depth = np.isfinite(depth)
+    data, pid = data[has_depth], pid[has_depth]
+    depth_bin = np.rint(depth[has_depth] / bin_size).astype(np.int64)
+
+    # Depth bins increase within each profile, so (profile, bin) groups are
+    # runs of equal keys and every column reduces with one reduceat. Bins
+    # above the surface are negative, so runs split on each key separately
+    new_group = (pid[1:] != pid[:-1]) | (depth_bin[1:] != depth_bin[:-1])
+    starts = np.flatnonzero(np.append(True, new_group))
+
+    binned = data.iloc[starts].reset_index(drop=True)
+    numeric = [
+        col
+        for col in data.select_dtypes(include=np.number).columns
+        if col != depth_col and col not in PROFILE_KEYS
+    ]
+    for col in numeric:
+        values = data[col].to_numpy(dtype=float)
+        present = np.isfinite(values)
+        totals = np.add.reduceat(np.where(present, values, 0.0), starts)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            binned[col] = totals / counts
+    binned[depth_col] = depth_bin[starts] * bin_size
+    return binned
+
+
+def cast_table(profile_index):
+    """One row per cast (profile) with its position, date and sample count.
+
+    The maps plot this instead of every CTD scan, so each cast is a single
+    marker. Position and date are taken from the cast's shallowest sample.
+    """
+    table = profile_index.table()
+    if table.empty:
+        return pd.DataFrame(columns=CAST_COLUMNS)
+
+    data = profile_index.data
+    starts = table["start"].to_numpy()
+    table["date"] = data["datetime"].to_numpy()[starts]
+    table["Lat (°S)"] = data["Lat (°S)"].to_numpy()[starts]
+    table["Lon (°E)"] = data["Lon (°E)"].to_numpy()[starts]
+    table["samples"] = table["stop"] - table["start"]
+    # Rows are depth-sorted with missing depths last, so fmax skips them
+    depth = data[DEPTH_COL].to_numpy(dtype=float)[: table["stop"].max()]
+    table["Max depth [m]"] = np.fmax.reduceat(depth, starts)
+    return table[CAST_COLUMNS]
@@ -0,0 +1,265 @@
+"""Memory-mapped products shared by every server process on a host.
+
+Each Streamlit replica used to read and prepare its own copy of the CTD
+samples and derive its own products from them. ``write_shared`` instead
+writes them once per store version as uncompressed Arrow IPC files, one set
+per depth resolution (``raw``, ``1m``, ``5m``):
+
+* ``samples-<resolution>.arrow``: the prepared samples of every cast
+  (``loader.prepare_dataset``, water mass labels included), with the
+  profiles ordered by year, season and Grid;
+* ``profiles-<resolution>.arrow``: the ``ProfileIndex`` table of those rows;
+* ``mld-<resolution>.arrow``: ``mld_table`` of every profile for every MLD
+  method and threshold.
+
+``SharedProducts`` maps them with ``pyarrow.memory_map``. The numeric and
+date columns of its frames are views of the mapped files, so the operating
+system keeps one copy in its page cache for all replicas; only the codes of
+the categorical columns are copied. A selection of adjacent profiles (one
+survey, or all of them) is a view as well, others copy the selected rows.
+
+Products live in ``SHARED_DIR/<store version>/``. They are written to a
+temporary folder that is then renamed, so readers never see partial files,
+and the folders of older versions are removed, as are temporary folders
+left by writers that crashed. Run ``python -m iep.shared`` to sync the store
+and write the products of its current version.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .loader import prepare_dataset
+from .mixed_layer import mld_criteria_table
+from .profiles import PROFILE_KEYS, ProfileIndex
+from .store import DATA_DIR, STORE_DIR, read_store, selection_version, survey_versions, sync_store
+
+SHARED_DIR = DATA_DIR / "shared"
+# The pages' depth resolutions: raw scans and 1 m and 5 m bins
+BIN_SIZES = (None, 1.0, 5.0)
+# Temporary folders older than this are removed even if their pid runs
+STALE_TMP_SECONDS = 24 * 3600
+
+
+def resolution(bin_size):
+    """File name part of a depth resolution: ``raw`` or e.g. ``5m``."""
+    return "raw" if not bin_size else f"{bin_size:g}m"
+
+
+def store_token(root=STORE_DIR):
+    """Version of the whole store; products are written per version."""
+    return selection_version(survey_versions(root))
+
+
+def _column(values):
+    # Floats keep NaN and dates keep NaT as values rather than Arrow nulls,
+    # so both convert back to numpy without a copy
+    if values.dtype.kind == "f":
+        return pa.array(values.to_numpy())
+    if values.dtype.kind == "M":
+        return pa.array(values.to_numpy().view(np.int64)).view(pa.timestamp("ns"))
+    return pa.Array.from_pandas(values)
+
+
+def _write_arrow(df, path):
+    table = pa.Table.from_arrays([_column(df[col]) for col in df.columns], names=list(df.columns))
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow(path):
+    # split_blocks keeps each column its own array, so no column is copied
+    # into a consolidated block
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def _by_survey(data):
+    # The profiles of ``data`` ordered by year, season and Grid
+    table = ProfileIndex(data).table().sort_values(["year", "season", "Grid"], kind="stable")
+    lengths = (table["stop"] - table["start"]).to_numpy()
+    first = np.repeat(table["start"].to_numpy() - (np.cumsum(lengths) - lengths), lengths)
+    return data.take(first + np.arange(lengths.sum())).reset_index(drop=True)
+
+
+def _pid_running(pid):
+    if os.name == "nt":
+        return True  # os.kill(pid, 0) would signal it; rely on the age
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _stale_tmp(folder):
+    # A ``_<version>-<pid>`` folder left by a writer that crashed
+    pid = folder.name.rpartition("-")[2]
+    if not pid.isdigit():
+        return False
+    age = time.time() - folder.stat().st_mtime
+    return not _pid_running(int(pid)) or age > STALE_TMP_SECONDS
+
+
+def write_shared(root=STORE_DIR, shared_dir=SHARED_DIR, bin_sizes=BIN_SIZES):
+    """Write the products of the store's current version; returns their folder.
+
+    Does nothing when they already exist.
+    """
+    shared_dir = Path(shared_dir)
+    version = store_token(root)
+    folder = shared_dir / version
+    if not folder.exists():
+        tmp = shared_dir / f"_{version}-{os.getpid()}"
+        tmp.mkdir(parents=True, exist_ok=True)
+        raw = read_store(root)
+        for bin_size in bin_sizes:
+            name = resolution(bin_size)
+            data = _by_survey(prepare_dataset(raw, bin_size))
+            index = ProfileIndex(data)
+            _write_arrow(data, tmp / f"samples-{name}.arrow")
+            _write_arrow(index.table(), tmp / f"profiles-{name}.arrow")
+            _write_arrow(mld_criteria_table(index), tmp / f"mld-{name}.arrow")
+        try:
+            tmp.rename(folder)
+        except OSError:  # another process wrote this version first
+            shutil.rmtree(tmp, ignore_errors=True)
+    # Replicas still mapping an older version keep their mapping
+    for old in shared_dir.iterdir():
+        if not old.is_dir():
+            continue
+        stale = _stale_tmp(old) if old.name.startswith("_") else old.name != version
+        if stale:
+            shutil.rmtree(old, ignore_errors=True)
+    return folder
+
+
+def write_shared_process(root=STORE_DIR, shared_dir=SHARED_DIR):
+    """Run ``write_shared`` in a child process.
+
+    Preparing the whole store takes memory a server process would keep;
+    a child returns it to the system when it exits.
+    """
+    package_root = str(Path(__file__).resolve().parent.parent)
+    path = os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")]))
+    subprocess.run(
+        [sys.executable, "-m", "iep.shared", "--root", str(root), "--output", str(shared_dir), "--no-sync"],
+        check=True,
+        env={**os.environ, "PYTHONPATH": path},
+    )
+
+
+class SharedProducts:
+    """The memory-mapped products of one store version (see ``write_shared``).
+
+    Lookups take a grid/season/year selection (None keeps all) and a depth
+    resolution; resolutions that were not written raise KeyError.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.version = self.folder.name
+        self._frames = {}
+
+    def _frame(self, kind, bin_size):
+        key = (kind, resolution(bin_size))
+        if key not in self._frames:
+            path = self.folder / f"{kind}-{key[1]}.arrow"
+            if not path.exists():
+                raise KeyError(f"No shared {kind} at {key[1]} resolution in {self.folder}")
+            self._frames[key] = _read_arrow(path)
+        return self._frames[key]
+
+    def __contains__(self, bin_size):
+        return (self.folder / f"samples-{resolution(bin_size)}.arrow").exists()
+
+    def _profiles(self, grids, seasons, years, bin_size):
+        table = self._frame("profiles", bin_size)
+        keep = np.ones(len(table), dtype=bool)
+        for col, values in zip(PROFILE_KEYS, (grids, seasons, years)):
+            if values is not None:
+                keep &= table[col].isin(list(values)).to_numpy()
+        return table[keep]
+
+    def select(self, grids=None, seasons=None, years=None, bin_size=None):
+        """Prepared samples of the selected casts, as ``prepare_dataset`` returns them."""
+        samples = self._frame("samples", bin_size)
+        table = self._profiles(grids, seasons, years, bin_size)
+        starts, stops = table["start"].to_numpy(), table["stop"].to_numpy()
+        if len(table) and (starts[1:] == stops[:-1]).all():
+            # Adjacent profiles: a view of the mapped file (reset_index
+            # would copy it without copy-on-write)
+            view = samples.iloc[starts[0] : stops[-1]]
+            view.index = pd.RangeIndex(len(view))
+            return view
+        lengths = stops - starts
+        rows = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        return samples.take(rows).reset_index(drop=True)
+
+    def profile_table(self, grids=None, seasons=None, years=None, bin_size=None):
+        """``ProfileIndex.table()`` of the frame ``select`` returns."""
+        table = self._profiles(grids, seasons, years, bin_size)
+        lengths = (table["stop"] - table["start"]).to_numpy()
+        start = np.cumsum(lengths) - lengths
+        return table.assign(start=start, stop=start + lengths).reset_index(drop=True)
+
+    def mld_table(self, method, threshold=None, seasons=None, years=None, bin_size=None):
+        """``mld_table`` of every profile in the selected seasons and years.
+
+        Raises KeyError for a method and threshold that were not written.
+        """
+        table = self._frame("mld", bin_size)
+        if threshold is None:
+            criterion = table["threshold"].isna()
+        else:
+            criterion = table["threshold"] == threshold
+        keep = ((table["method"] == method) & criterion).to_numpy()
+        if not keep.any():
+            raise KeyError(f"No shared MLD for {method!r} at threshold {threshold}")
+        if seasons is not None:
+            keep = keep & table["season"].isin(list(seasons)).to_numpy()
+        if years is not None:
+            keep = keep & table["year"].isin(list(years)).to_numpy()
+        return table[keep].drop(columns="threshold").reset_index(drop=True)
+
+
+def open_shared(root=STORE_DIR, shared_dir=SHARED_DIR, version=None, write=False):
+    """Map the products of the store version ``version`` (default: current).
+
+    With ``write`` missing products are written first, in a child process.
+    Returns None when they do not exist (or no longer match the store).
+    """
+    version = version or store_token(root)
+    folder = Path(shared_dir) / version
+    if not folder.exists() and write:
+        write_shared_process(root, shared_dir)
+    return SharedProducts(folder) if folder.exists() else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=str(STORE_DIR), help="Store folder")
+    parser.add_argument("--output", default=str(SHARED_DIR), help="Folder of the shared products")
+    parser.add_argument("--no-sync", action="store_true", help="Do not add new files to the store first")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if not args.no_sync:
+        sync_store(root=args.root)
+    folder = write_shared(args.root, args.output)
+    size_mb = sum(path.stat().st_size for path in folder.iterdir()) / 1e6
+    print(f"Shared products in {folder} ({size_mb:.1f} MB) after {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""Partitioned Parquet store of every ingested IEP cruise.
+
+Loading whole workbooks makes memory and load time grow with the archive.
+The store instead keeps the samples as a Parquet dataset partitioned by
+survey, ``year=<year>/season=<season>/part-<source>.parquet``, with the rows
+of each file sorted by Grid so every row group covers a narrow range of
+grids. ``read_store`` turns a grid/season/year selection into a partition
+and row-group filter, so only the selected casts are read from disk.
+
+Sources are cruise workbooks and Sea-Bird ``.cnv`` casts (``iep.cnv``).
+Each writes one file per survey, named after the source's content hash:
+re-adding an unchanged file does nothing and a changed one replaces its
+files. ``_sources.json`` records what was ingested and ``_casts.parquet``
+holds one row per cast (``profiles.cast_table``), which the pages use for
+their filter options and maps without reading samples. Ingesting new casts
+rebuilds only their catalog rows, and ``survey_versions`` lets caches of
+derived products drop just the surveys that changed. Files starting with
+``_`` are not part of the dataset.
+
+Run ``python -m iep.store [paths]`` to add new workbooks and casts (files or
+folders; default: the workbooks in ``data/`` and the casts in ``data/cnv``).
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import operator
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .cnv import read_cnv
+from .loader import _to_arrow_table, file_digest, load_data, prepare_dataset
+from .profiles import CAST_COLUMNS, DEPTH_COL, ProfileIndex, cast_table
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path("data")
+STORE_DIR = DATA_DIR / "store"
+# Cruise workbooks in DATA_DIR; the station list workbook is not one
+WORKBOOK_PATTERN = "IEP_*.xlsx"
+# Sea-Bird casts (iep.cnv), in any folder layout
+CNV_DIR = DATA_DIR / "cnv"
+PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int32()), ("season", pa.string())]), flavor="hive"
+)
+# Row groups hold whole grids and are cut once they reach this many rows
+ROW_GROUP_ROWS = 5_000
+SOURCES_FILE = "_sources.json"
+CATALOG_FILE = "_casts.parquet"
+
+
+def cruise_workbooks(data_dir=DATA_DIR):
+    """Cruise workbooks in ``data_dir``, oldest name first."""
+    return sorted(
+        path
+        for path in Path(data_dir).glob(WORKBOOK_PATTERN)
+        if not path.stem.endswith("_Stations")
+    )
+
+
+def _replace(path, write):
+    # Write through a temporary file so readers never see half a file
+    tmp_path = path.with_name(path.name + ".tmp")
+    write(tmp_path)
+    tmp_path.replace(path)
+
+
+def _partition_dir(root, year, season):
+    return Path(root) / f"year={int(year)}" / f"season={season}"
+
+
+def _write_partition(frame, path):
+    # Sorted by Grid, each cast's samples by time and depth; a row group is
+    # closed at the first grid boundary after ROW_GROUP_ROWS rows
+    frame = frame.sort_values(["Grid", "datetime", DEPTH_COL], kind="stable")
+    table = _to_arrow_table(frame.drop(columns=["year", "season"]))
+    grids = frame["Grid"].to_numpy()
+    boundaries = [0] + [i for i in range(1, len(grids)) if grids[i] != grids[i - 1]]
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(tmp_path):
+        with pq.ParquetWriter(tmp_path, table.schema) as writer:
+            start = 0
+            for boundary in boundaries[1:] + [len(grids)]:
+                if boundary - start >= ROW_GROUP_ROWS or boundary == len(grids):
+                    writer.write_table(table.slice(start, boundary - start))
+                    start = boundary
+
+    _replace(path, write)
+
+
+def read_sources(root=STORE_DIR):
+    """Ingested files: path (see ``source_key``) -> digest, file tag and surveys written."""
+    path = Path(root) / SOURCES_FILE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _write_sources(sources, root):
+    path = Path(root) / SOURCES_FILE
+    _replace(path, lambda tmp: tmp.write_text(json.dumps(sources, indent=1), encoding="utf-8"))
+
+
+def add_to_store(data, tag, root=STORE_DIR):
+    """Write ``data`` as the ``part-<tag>.parquet`` file of each of its surveys.
+
+    Rows without a date cannot be assigned to a survey and are dropped.
+    Returns the grids written to each (year, season) survey.
+    """
+    data = data[data["datetime"].notna()]
+    data = data.assign(year=data["datetime"].dt.year.astype("int32"))
+    surveys = {}
+    for (year, season), frame in data.groupby(["year", "season"], sort=True):
+        _write_partition(frame, _partition_dir(root, year, season) / f"part-{tag}.parquet")
+        surveys[(int(year), season)] = set(frame["Grid"].unique())
+    return surveys
+
+
+def remove_from_store(tag, surveys, root=STORE_DIR):
+    """Delete the files written by ``add_to_store(..., tag)``."""
+    for year, season in surveys:
+        (_partition_dir(root, year, season) / f"part-{tag}.parquet").unlink(missing_ok=True)
+
+
+def source_key(path):
+    """Key of a file in ``_sources.json``: its path.
+
+    Relative to the working directory when inside it. Keyed by path, casts
+    with the same file name in two cruise folders are two sources.
+    """
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(Path.cwd().resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def _add_source(sources, path, load, root):
+    # Store load(path) unless this version of the file is in ``sources``.
+    # Returns the changed grids per survey (None: the whole survey).
+    digest = file_digest(path)
+    key = source_key(path)
+    if key not in sources and path.name in sources:
+        # Stores written before sources were keyed by path used the file name
+        sources[key] = sources.pop(path.name)
+    previous = sources.get(key)
+    if previous is not None and previous["digest"] == digest:
+        return {}
+
+    tag = digest[:16]
+    changed = add_to_store(load(path), tag, root)
+    surveys = list(changed)
+    if previous is not None:
+        old_surveys = [tuple(survey) for survey in previous["surveys"]]
+        remove_from_store(previous["tag"], old_surveys, root)
+        changed.update(dict.fromkeys(old_surveys))
+    sources[key] = {"digest": digest, "tag": tag, "surveys": surveys}
+    logger.info("Ingested %s (%d surveys)", path, len(surveys))
+    return changed
+
+
+def add_workbook(path, sources, root=STORE_DIR):
+    """Ingest a workbook unless this version of it is already in ``sources``.
+
+    The store is the workbook's columnar copy, so it bypasses the loader's
+    Parquet cache.
+    """
+    return _add_source(sources, Path(path), functools.partial(load_data, cache=False), root)
+
+
+def add_cnv(path, sources, profiles, root=STORE_DIR):
+    """Ingest a Sea-Bird cast unless it is already in the store.
+
+    ``profiles`` holds the (Grid, season, year) profiles in the store; a cast
+    of one of them that came from another file is skipped.
+    """
+    path = Path(path)
+
+    def load(path):
+        cast = read_cnv(path)
+        key = (cast["Grid"].iat[0], cast["season"].iat[0], cast["datetime"].iat[0].year)
+        if key in profiles and source_key(path) not in sources:
+            logger.warning("Skipped %s: profile %s is already in the store", path, key)
+            return cast.iloc[:0]
+        profiles.add(key)
+        return cast
+
+    return _add_source(sources, path, load, root)
+
+
+def cnv_files(paths):
+    """The ``.cnv`` files among ``paths``, searching folders recursively."""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.rglob("*.cnv")) if path.is_dir() else [path])
+    return [path for path in files if path.suffix.lower() == ".cnv"]
+
+
+def sync_store(workbooks=None, casts=None, root=STORE_DIR):
+    """Add new or changed workbooks and casts to the store.
+
+    ``workbooks`` defaults to ``cruise_workbooks()`` and ``casts`` to the
+    ``.cnv`` files under ``CNV_DIR``. Only the catalog rows of the changed
+    profiles are rebuilt. Returns the changed grids per (year, season)
+    survey, None meaning the whole survey.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    if workbooks is None:
+        workbooks = cruise_workbooks()
+    if casts is None:
+        casts = cnv_files([CNV_DIR])
+    sources = read_sources(root)
+    ingested = dict(sources)
+    changed = {}
+
+    def merge(update):
+        for survey, grids in update.items():
+            if survey not in changed:
+                changed[survey] = grids
+            elif changed[survey] is None or grids is None:
+                changed[survey] = None
+            else:
+                changed[survey] |= grids
+
+    for path in workbooks:
+        merge(add_workbook(path, sources, root))
+    if casts:
+        catalog = read_catalog(root)
+        profiles = set(zip(catalog["Grid"], catalog["season"], catalog["year"]))
+        for path in casts:
+            try:
+                merge(add_cnv(path, sources, profiles, root))
+            except ValueError as exc:  # one bad file should not stop the others
+                logger.warning("Skipped %s: %s", path, exc)
+    if sources != ingested:
+        _write_sources(sources, root)
+    if changed or not (root / CATALOG_FILE).exists():
+        update_catalog(changed, root)
+    return changed
+
+
+def survey_versions(root=STORE_DIR):
+    """Token per (year, season) survey that changes whenever its files do."""
+    tags = defaultdict(list)
+    for source in read_sources(root).values():
+        for year, season in source["surveys"]:
+            tags[(year, season)].append(source["tag"])
+    return {
+        survey: hashlib.sha1(",".join(sorted(survey_tags)).encode()).hexdigest()[:12]
+        for survey, survey_tags in tags.items()
+    }
+
+
+def selection_version(versions, seasons=None, years=None):
+    """Token of the selected surveys' ``survey_versions`` (None keeps all).
+
+    Caches of derived products keyed on it are invalidated only when casts
+    of the selected seasons and years change.
+    """
+    tokens = sorted(
+        f"{year}/{season}/{version}"
+        for (year, season), version in versions.items()
+        if (seasons is None or season in seasons) and (years is None or year in years)
+    )
+    return hashlib.sha1(";".join(tokens).encode()).hexdigest()[:12]
+
+
+def _any_of(field, values):
+    # isin() does not prune Parquet row groups by their statistics; an OR of
+    # equalities does
+    terms = [pc.field(field) == value for value in values]
+    if not terms:
+        return pc.scalar(False)
+    return functools.reduce(operator.or_, terms)
+
+
+def selection_filter(grids=None, seasons=None, years=None):
+    """Dataset filter for the selection, or None to read everything.
+
+    As in ``filters.select``, ``None`` keeps every value and an empty list
+    keeps none.
+    """
+    terms = []
+    if years is not None:
+        terms.append(_any_of("year", [int(year) for year in years]))
+    if seasons is not None:
+        terms.append(_any_of("season", [str(season) for season in seasons]))
+    if grids is not None:
+        terms.append(_any_of("Grid", [str(grid) for grid in grids]))
+    if not terms:
+        return None
+    return functools.reduce(operator.and_, terms)
+
+
+def store_dataset(root=STORE_DIR):
+    """The store as a pyarrow dataset (partition columns ``year`` and ``season``)."""
+    return ds.dataset(Path(root), format="parquet", partitioning=PARTITIONING)
+
+
+def read_store(root=STORE_DIR, grids=None, seasons=None, years=None, columns=None):
+    """Samples of the selected casts; only matching partitions and row groups are read."""
+    table = store_dataset(root).to_table(
+        columns=columns, filter=selection_filter(grids, seasons, years)
+    )
+    return table.to_pandas()
+
+
+def update_catalog(changed, root=STORE_DIR):
+    """Rebuild the cast catalog rows of the changed profiles.
+
+    ``changed`` maps (year, season) surveys to the grids to rebuild, or to
+    None for every grid of the survey (see ``sync_store``).
+    """
+    root = Path(root)
+    catalog = read_catalog(root)
+    stale = np.zeros(len(catalog), dtype=bool)
+    # Only the columns cast_table needs, of the changed profiles only
+    columns = ["Grid", "datetime", "Lat (°S)", "Lon (°E)", DEPTH_COL, "season"]
+    parts = []
+    for (year, season), grids in changed.items():
+        in_survey = (catalog["year"] == year) & (catalog["season"] == season)
+        if grids is not None:
+            in_survey &= catalog["Grid"].isin(grids)
+            grids = sorted(grids)
+        stale |= in_survey.to_numpy()
+        part = read_store(root, grids, [season], [year], columns)
+        if not part.empty:
+            parts.append(part)
+    catalog = catalog[~stale]
+    if parts:
+        frame = prepare_dataset(pd.concat(parts, ignore_index=True), compact=False)
+        casts = cast_table(ProfileIndex(frame))
+        catalog = pd.concat([catalog, casts], ignore_index=True) if len(catalog) else casts
+    catalog = catalog.sort_values(["date", "Grid"], kind="stable").reset_index(drop=True)
+    _replace(
+        root / CATALOG_FILE,
+        lambda tmp: pq.write_table(pa.Table.from_pandas(catalog, preserve_index=False), tmp),
+    )
+    return catalog
+
+
+def read_catalog(root=STORE_DIR):
+    """One row per cast in the store (columns of ``profiles.cast_table``)."""
+    path = Path(root) / CATALOG_FILE
+    if not path.exists():
+        return pd.DataFrame(columns=CAST_COLUMNS)
+    return pq.read_table(path).to_pandas()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    paths = [Path(arg) for arg in sys.argv[1:]]
+    if paths:
+        changed = sync_store(
+            workbooks=[path for path in paths if path.suffix == ".xlsx"],
+            casts=cnv_files(path for path in paths if path.suffix != ".xlsx"),
+        )
+    else:
+        changed = sync_store()
+    for (year, season), grids in sorted(changed.items()):
+        print(f"{year} {season}: {'all grids' if grids is None else ', '.join(sorted(grids))}")
+    print(f"{len(read_catalog())} casts in {STORE_DIR}")
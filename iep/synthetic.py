@@ -0,0 +1,175 @@
+"""Synthetic CTD casts with the columns of the IEP workbooks.
+
+The production workbook is not shipped with the repository, so benchmarks
+and tests generate stand-in data: one cast per (station, season, year) at
+the stations of ``data/IEP_2017_2018_Stations.xlsx``, sampled every half
+metre to a station-dependent bottom depth, with a Benguela-like vertical
+structure (warm mixed layer over a thermocline, SACW salinity, an oxygen
+minimum and a subsurface chlorophyll maximum) and TEOS-10 sigma-theta.
+
+``scale=1`` has the layout of the 2017-2018 workbook (45 stations, three
+surveys; about 130,000 samples). Larger scales first add surveys (two per
+year, as if cruises kept being added) and, beyond ``MAX_SURVEYS``, station
+replicates with jittered positions, so rows grow linearly with ``scale``.
+
+Run ``python -m iep.synthetic 10x data/synthetic-10x.parquet`` to write a
+dataset (.xlsx or .parquet).
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .loader import WORKBOOK_COLUMNS
+
+STATIONS_FILE = Path("data/IEP_2017_2018_Stations.xlsx")
+
+SCALES = {"1x": 1, "10x": 10, "100x": 100, "1000x": 1000}
+# The 2017-2018 workbook: (year, season, month) of each survey
+BASE_SURVEYS = [(2017, "Winter", 7), (2018, "Summer", 1), (2018, "Winter", 8)]
+# Two surveys a year for 50 years; larger scales replicate stations instead
+MAX_SURVEYS = 100
+SAMPLE_SPACING = 0.5  # metres between CTD samples
+
+def survey_plan(n_surveys):
+    """(year, season, month) of ``n_surveys`` surveys, continuing the base ones."""
+    surveys = list(BASE_SURVEYS[:n_surveys])
+    year = BASE_SURVEYS[-1][0]
+    while len(surveys) < n_surveys:
+        year += 1
+        surveys.append((year, "Summer", 1))
+        if len(surveys) < n_surveys:
+            surveys.append((year, "Winter", 7))
+    return surveys
+
+
+def _casts(stations, scale, rng):
+    # One row per cast: station, survey and the parameters of its profile
+    n_base = len(BASE_SURVEYS)
+    n_surveys = min(n_base * scale, MAX_SURVEYS)
+    replicas = -(-n_base * scale // n_surveys)  # ceil
+    surveys = pd.DataFrame(survey_plan(n_surveys), columns=["year", "season", "month"])
+
+    sites = stations.loc[np.tile(np.arange(len(stations)), replicas)].reset_index(drop=True)
+    replica = np.repeat(np.arange(replicas), len(stations))
+    suffix = np.where(replica > 0, "-" + replica.astype(str), "")
+    sites["Grid"] = sites["Grid"].astype(str) + suffix
+    sites["Lat (°S)"] = sites["Lat (°S)"].abs() + (replica > 0) * rng.normal(0, 0.05, len(sites))
+    sites["Lon (°E)"] = sites["Lon (°E)"] + (replica > 0) * rng.normal(0, 0.05, len(sites))
+    # Shelf stations near the coast are shallow, offshore ones deep
+    offshore = (sites["Lon (°E)"].max() - sites["Lon (°E)"]).to_numpy()
+    sites["bottom"] = np.clip(60 + 300 * offshore + rng.normal(0, 20, len(sites)), 40, 1000)
+
+    casts = sites.merge(surveys, how="cross")
+    # Cap the number of casts at scale x the base workbook
+    casts = casts.iloc[: n_base * scale * len(stations)].reset_index(drop=True)
+    n = len(casts)
+    summer = (casts["season"] == "Summer").to_numpy()
+    casts["sst"] = np.where(summer, 19.0, 15.5) + rng.normal(0, 1.0, n)
+    casts["mld"] = np.where(summer, 15.0, 45.0) * rng.uniform(0.6, 1.5, n)
+    casts["thermocline"] = rng.uniform(8, 20, n)
+    casts["chl_max"] = rng.uniform(8, 30, n)
+    casts["chl_depth"] = casts["mld"] * rng.uniform(0.6, 1.1, n)
+    casts["bottom"] = casts["bottom"] + rng.normal(0, 5, n)
+    casts["datetime"] = pd.to_datetime(
+        dict(year=casts["year"], month=casts["month"], day=rng.integers(1, 28, n))
+    )
+    survey_no = casts.groupby(["year", "season"], sort=False).ngroup()
+    casts["Cruise"] = "Alg" + (235 + survey_no).astype(str)
+    casts["Station"] = "C" + (11987 + np.arange(n)).astype(str)
+    return casts
+
+
+def synthetic_ctd(scale=1, stations=None, seed=0):
+    """Synthetic CTD samples, ``scale`` times the size of the 2017-2018 workbook.
+
+    ``stations`` is a frame with Grid, Lat (°S) and Lon (°E) columns and
+    defaults to ``STATIONS_FILE``. Rows are in cast order and depth-sorted,
+    as the CTD exports are.
+    """
+    rng = np.random.default_rng(seed)
+    if stations is None:
+        stations = pd.read_excel(STATIONS_FILE)
+    casts = _casts(stations[["Grid", "Lat (°S)", "Lon (°E)"]], scale, rng)
+
+    n_samples = np.maximum((casts["bottom"].to_numpy() / SAMPLE_SPACING).astype(int), 2)
+    cast = np.repeat(np.arange(len(casts)), n_samples)
+    first = np.cumsum(n_samples) - n_samples
+    depth = (np.arange(len(cast)) - first[cast] + 2) * SAMPLE_SPACING
+    n = len(depth)
+
+    def per_sample(col):
+        return casts[col].to_numpy()[cast]
+
+    mld, thermocline = per_sample("mld"), per_sample("thermocline")
+    sst = per_sample("sst")
+    # Warm mixed layer over a smooth thermocline towards ~5 °C at depth
+    deep_temp = 5.0 + 4.0 * np.exp(-depth / 250)
+    step = 1 / (1 + np.exp(-(depth - mld) / thermocline))
+    temperature = sst - (sst - deep_temp) * step + rng.normal(0, 0.02, n)
+    # Fresher surface, SACW salinity maximum, AAIW freshening below ~600 m
+    salinity = (
+        34.75
+        + 0.35 * np.exp(-(((depth - 150) / 250) ** 2))
+        - 0.2 * np.exp(-depth / 20)
+        - 0.3 * np.clip((depth - 600) / 400, 0, 1)
+        + rng.normal(0, 0.005, n)
+    )
+    # Oxygen minimum over the shelf at 100-300 m
+    oxygen = 5.5 * (1 - 0.8 * np.exp(-(((depth - 200) / 120) ** 2))) + rng.normal(0, 0.05, n)
+    chl_depth = per_sample("chl_depth")
+    fluorescence = np.maximum(
+        per_sample("chl_max") * np.exp(-(((depth - chl_depth) / 10) ** 2))
+        + 0.5 * np.exp(-depth / 50)
+        + rng.normal(0, 0.05, n),
+        0,
+    )
+
+    # Imported here: only generating the data needs gsw
+    import gsw
+
+    lat = -per_sample("Lat (°S)")
+    lon = per_sample("Lon (°E)")
+    pressure = gsw.p_from_z(-depth, lat)
+    absolute_salinity = gsw.SA_from_SP(salinity, pressure, lon, lat)
+    conservative_temp = gsw.CT_from_t(absolute_salinity, temperature, pressure)
+    sigma_theta = gsw.sigma0(absolute_salinity, conservative_temp)
+
+    data = {
+        "Cruise": per_sample("Cruise"),
+        "Station": per_sample("Station"),
+        "Grid": per_sample("Grid"),
+        "Lat (°S)": -lat,
+        "Lon (°E)": lon,
+        "datetime": per_sample("datetime"),
+        "season": per_sample("season"),
+        "Pressure [db]": pressure,
+        "Depth [m]": depth,
+        "Temperature [ITS90,°C]": temperature,
+        "Salinity [psu]": salinity,
+        "Oxygen [ml/l]": oxygen,
+        "Flourescence [mg/m^3]": fluorescence,
+        "Density Derived [sigma-theta, kg/m^3]": sigma_theta,
+    }
+    return pd.DataFrame(data, columns=WORKBOOK_COLUMNS)
+
+
+def write_synthetic(path, scale=1, seed=0):
+    """Write ``synthetic_ctd(scale)`` to an .xlsx workbook or a .parquet file."""
+    path = Path(path)
+    data = synthetic_ctd(scale, seed=seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".xlsx":
+        data.to_excel(path, index=False)
+    else:
+        data.to_parquet(path, index=False)
+    return data
+
+
+if __name__ == "__main__":
+    scale_label = sys.argv[1] if len(sys.argv) > 1 else "1x"
+    target = sys.argv[2] if len(sys.argv) > 2 else f"data/synthetic-{scale_label}.parquet"
+    written = write_synthetic(target, SCALES[scale_label])
+    print(f"{target}: {len(written):,} rows")
@@ -0,0 +1,110 @@
+"""Named timing spans for each rerun and their percentiles across sessions.
+
+A ``RerunTimings`` records the spans of one script run of one page (data
+load, filtering, figure construction, chart serialisation, ...). Each span
+is also reported to a process-wide ``TimingSink``, which keeps the most
+recent durations per (page, span) for p50/p95 summaries and can append one
+JSON line per run to a log file for offline analysis. A rerun of only one
+fragment is a run of its own, with the fragment's name.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Most recent durations kept per (page, span) for the percentiles
+WINDOW = 1000
+
+
+class RerunTimings:
+    """Spans of one run of a page, in the order they finished."""
+
+    def __init__(self, page, sink=None, session=None, fragment=None):
+        self.page = page
+        self.sink = sink
+        self.session = session
+        # Name of the fragment when only a fragment reran
+        self.fragment = fragment
+        self.finished = False
+        self.spans = []  # (name, seconds, info)
+
+    @contextmanager
+    def span(self, name, **info):
+        """Time the block; yields ``info``, a dict the block may add details to."""
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start
+            self.spans.append((name, seconds, info))
+            if self.sink is not None:
+                self.sink.add(self.page, name, seconds)
+
+    def table(self):
+        """One row per span: name, milliseconds and any recorded details."""
+        rows = [{"span": name, "ms": seconds * 1e3, **info} for name, seconds, info in self.spans]
+        return pd.DataFrame(rows) if rows else pd.DataFrame(columns=["span", "ms"])
+
+    def record(self):
+        """JSON-serialisable summary of the run for the log sink."""
+        return {
+            "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "page": self.page,
+            "session": self.session,
+            "fragment": self.fragment,
+            "spans": [
+                {"span": name, "ms": round(seconds * 1e3, 3), **info}
+                for name, seconds, info in self.spans
+            ],
+        }
+
+
+class TimingSink:
+    """Thread-safe rolling span durations per page, shared by all sessions.
+
+    With ``log_file`` every finished run is appended to it as one JSON line.
+    """
+
+    def __init__(self, window=WINDOW, log_file=None):
+        self.log_file = log_file
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def add(self, page, span, seconds):
+        with self._lock:
+            self._durations[(page, span)].append(seconds)
+
+    def finish(self, timings):
+        """Log a finished run (spans were already added as they ended)."""
+        timings.finished = True
+        if self.log_file is None:
+            return
+        line = json.dumps(timings.record(), ensure_ascii=False, default=str)
+        with self._lock, open(self.log_file, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+    def summary(self, page=None):
+        """Count, p50 and p95 in milliseconds per (page, span)."""
+        with self._lock:
+            items = [
+                (key, np.array(values))
+                for key, values in self._durations.items()
+                if page is None or key[0] == page
+            ]
+        rows = [
+            {
+                "page": key[0],
+                "span": key[1],
+                "count": len(values),
+                "p50_ms": np.percentile(values, 50) * 1e3,
+                "p95_ms": np.percentile(values, 95) * 1e3,
+            }
+            for key, values in items
+        ]
+        return pd.DataFrame(rows, columns=["page", "span", "count", "p50_ms", "p95_ms"])
@@ -1,6 +1,17 @@
 import streamlit as st
 import pandas as pd
 
+from functions import (
+    DEPTH_RESOLUTIONS,
+    get_shared,
+    get_store,
+    get_figure_cache,
+    get_timing_sink,
+    span,
+    start_rerun_timings,
+    timings_panel,
+)
+
 # Page setup
 apptitle = "IEP Analysis 🌊"
 st.set_page_config(page_title=apptitle, page_icon="🌊", layout='wide')
@@ -44,14 +55,18 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Load data once and store it in session state
-if 'data' not in st.session_state:
-    @st.cache_data
-    def load_data():
-        df = pd.read_excel('data/IEP_2017_2018.xlsx')
-        return df
-    
-    st.session_state.data = load_data()
+# Filtering in the pages returns new frames instead of views, so the shared
+# selections (functions.get_selection) are never written through
+pd.set_option("mode.copy_on_write", True)
+
+# Raw CTD scans or depth-binned profiles, shared by every page
+depth_resolution = st.sidebar.radio(
+    "Depth resolution",
+    list(DEPTH_RESOLUTIONS),
+    key="depth_resolution",
+    help="Binned profiles average the CTD scans onto standard depths",
+)
+st.session_state.bin_size = DEPTH_RESOLUTIONS[depth_resolution]
 
 # Define the available pages
 pages = {
@@ -72,8 +87,32 @@ pages = {
 # Create the navigation
 pg = st.navigation(pages)
 
-# Run the selected page
-pg.run()
+# Named timing spans for this run (see iep.timing)
+timings = start_rerun_timings(pg.title)
+with span("rerun"):
+    # New cruise workbooks are added to the partitioned store once per server
+    # process; the pages then load only the casts selected in their sidebar,
+    # from products memory-mapped by every server process (iep.shared)
+    with span("data store"):
+        get_store()
+        get_shared()
+
+    # Run the selected page
+    pg.run()
+get_timing_sink().finish(timings)
+
+# Hit/miss counters of the figure cache shared by all sessions
+with st.sidebar.expander("Figure cache"):
+    stats = get_figure_cache().stats()
+    st.caption(
+        f"{stats['hits']} hits / {stats['misses']} misses "
+        f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} figures, "
+        f"{stats['size_mb']:.1f} of {stats['budget_mb']:.0f} MB, "
+        f"{stats['evictions']} evicted"
+    )
+
+if st.sidebar.checkbox("Show timings", key="show_timings"):
+    timings_panel(timings)
 
 # Add a footer
 st.markdown(
@@ -2,150 +2,243 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import numpy as np
-import plotly.io as pio
-import gsw
-
-pio.kaleido.scope.default_format = "svg"
-from functions import config_figure
+from functions import (
+    cast_hover_data,
+    config_figure,
+    get_cast_table,
+    get_figure,
+    get_mld_table,
+    get_profile_index,
+    get_selection,
+    show_figure,
+    span,
+)
+from iep.filters import select
+from iep.mixed_layer import (
+    MLD_COL,
+    MLD_METHODS,
+    MLD_THRESHOLDS,
+    MLD_UNITS,
+    mld_comparison,
+    mld_criteria,
+)
 
 from css import app_css  # Import CSS as a string
 
 st.markdown(app_css, unsafe_allow_html=True)
 
 
-# Functions for MLD Calculation
-def calculate_mld(
-    df, temp_col="Temperature [ITS90,°C]", depth_col="Depth [m]", threshold=0.5
-):
-    surface_temp = df[temp_col].iloc[0]
-    mld = df[df[temp_col] <= surface_temp - threshold][depth_col].min()
-    return mld if not np.isnan(mld) else df[depth_col].max()
-
-
 # Centered Page layout
 st.markdown(
     "<h1 style='text-align: center;'>Mixed Layer Depth Analysis from CTD Profiles 📏🌊</h1>",
     unsafe_allow_html=True,
 )
 
-# Access the shared data from session state
-data = st.session_state.get("data")
+# One row per cast in the data store: the filter options, and the map
+casts = get_cast_table()
 
-if data is None:
+if casts.empty:
     st.error(
-        "Data not found in session state. Please load data in the main application."
+        "No CTD casts in the data store. Add the IEP workbooks to the data folder."
     )
 else:
-    data["Lat (°S)"] = data["Lat (°S)"].apply(lambda x: -abs(x))
+    bin_size = st.session_state.get("bin_size")
 
     # Sidebar filters
     st.sidebar.header("Filter data")
-    grid_options = list(data["Grid"].unique())
+    grid_options = list(casts["Grid"].unique())
     selected_grids = st.sidebar.multiselect(
         "Select Grid(s)", grid_options, default=[grid_options[1]]
     )
 
     # Season and Year filters
     selected_season = st.sidebar.multiselect(
-        "Select Season(s)", data["season"].unique(), default=data["season"].unique()[0]
+        "Select Season(s)", casts["season"].unique(), default=casts["season"].unique()[0]
     )
     selected_year = st.sidebar.multiselect(
         "Select Year(s)",
-        data.datetime.dt.year.dropna().unique(),
-        default=data.datetime.dt.year.dropna().unique()[0],
+        casts["year"].unique(),
+        default=casts["year"].unique()[0],
+    )
+
+    # MLD criterion
+    st.sidebar.header("MLD method")
+    mld_method = st.sidebar.selectbox("Method", list(MLD_METHODS))
+    if MLD_THRESHOLDS[mld_method]:
+        mld_threshold = st.sidebar.select_slider(
+            f"Threshold [{MLD_UNITS[mld_method]}]",
+            options=MLD_THRESHOLDS[mld_method],
+        )
+        method_label = f"{mld_method}, {mld_threshold} {MLD_UNITS[mld_method]}"
+    else:
+        mld_threshold = None
+        method_label = mld_method
+
+    map_all_stations = st.sidebar.checkbox(
+        "Map MLD at all stations",
+        help="Colour every station sampled in the selected season(s) and year(s) by its MLD",
     )
 
-    # Filter data based on selection
-    filtered_data = data[
-        (data["Grid"].isin(selected_grids))
-        & (data["season"].isin(selected_season))
-        & (data["datetime"].dt.year.isin(selected_year))
-    ]
+    # MLD of every profile in the selected seasons and years is computed in
+    # one batch and cached; the loop below only looks values up
+    with span("MLD table"):
+        all_mld = get_mld_table(
+            mld_method, mld_threshold, selected_season, selected_year, bin_size
+        )
+    mld_lookup = dict(
+        zip(zip(all_mld["Grid"], all_mld["season"], all_mld["year"]), all_mld[MLD_COL])
+    )
+
+    # Only the selected casts are read from the store; figures are cached
+    # across sessions under the same (normalised) selection
+    selection = dict(grids=selected_grids, seasons=selected_season, years=selected_year)
+    with span("load selection"):
+        filtered_data = get_selection(**selection, bin_size=bin_size)
+        profile_index = get_profile_index(**selection, bin_size=bin_size)
 
     # Layout
     col1, col2 = st.columns([3, 7])
 
     if not filtered_data.empty:
         with col1:
-            fig_map = px.scatter_mapbox(
-                filtered_data,
-                lat="Lat (°S)",
-                lon="Lon (°E)",
-                hover_name="Grid",
-                zoom=4.5,
-                height=600,
-            )
-            fig_map.update_layout(
-                mapbox_style="open-street-map",
-                mapbox_center={"lat": -33.0, "lon": 17.0},
-            )
-            fig_map.update_traces(
-                marker=dict(size=6, symbol="circle", opacity=0.7, color="black")
-            )
-            st.plotly_chart(fig_map, use_container_width=True, config=config_figure)
+            if map_all_stations:
+                map_mld = select(all_mld, seasons=selected_season, years=selected_year)
+            else:
+                # One marker per cast rather than per CTD scan
+                map_casts = select(casts, **selection)
+
+            def build_map():
+                if map_all_stations:
+                    fig_map = px.scatter_mapbox(
+                        map_mld,
+                        lat="Lat (°S)",
+                        lon="Lon (°E)",
+                        color=MLD_COL,
+                        color_continuous_scale="viridis_r",
+                        hover_name="Grid",
+                        hover_data={"season": True, "year": True, MLD_COL: ":.1f"},
+                        zoom=4.5,
+                        height=600,
+                    )
+                    fig_map.update_traces(marker=dict(size=9, opacity=0.9))
+                else:
+                    fig_map = px.scatter_mapbox(
+                        map_casts,
+                        lat="Lat (°S)",
+                        lon="Lon (°E)",
+                        hover_name="Grid",
+                        hover_data=cast_hover_data,
+                        zoom=4.5,
+                        height=600,
+                    )
+                    fig_map.update_traces(
+                        marker=dict(size=6, symbol="circle", opacity=0.7, color="black")
+                    )
+                fig_map.update_layout(
+                    mapbox_style="open-street-map",
+                    mapbox_center={"lat": -33.0, "lon": 17.0},
+                )
+                return fig_map
+
+            if map_all_stations:
+                # The grid selection does not change the all-stations map
+                fig_map = get_figure(
+                    "mld",
+                    "mld_map",
+                    build_map,
+                    seasons=selected_season,
+                    years=selected_year,
+                    method=mld_method,
+                    threshold=mld_threshold,
+                    bin_size=bin_size,
+                )
+            else:
+                fig_map = get_figure("mld", "map", build_map, **selection)
+            show_figure(fig_map, "map", use_container_width=True, config=config_figure)
 
         with col2:
-            fig_mld = go.Figure()
-            mld_values = []
-            for season in selected_season:
-                for station in filtered_data["Grid"].unique():
-                    for year in selected_year:
-                        station_data = filtered_data[
-                            (filtered_data["Grid"] == station)
-                            & (filtered_data["season"] == season)
-                            & (filtered_data["datetime"].dt.year == year)
-                        ]
-                        if not station_data.empty:
-                            station_data = station_data.sort_values("Depth [m]")
-                            mld = calculate_mld(station_data)
-                            mld_values.append((station, season, year, mld))
-
-                            color = px.colors.qualitative.Plotly[
-                                len(mld_values) % len(px.colors.qualitative.Plotly)
-                            ]
-
-                            fig_mld.add_trace(
-                                go.Scatter(
-                                    x=station_data["Temperature [ITS90,°C]"],
-                                    y=station_data["Depth [m]"],
-                                    mode="lines",
-                                    name=f"{station} {season} {year}",
-                                    line=dict(color=color),
-                                )
-                            )
-
-                            fig_mld.add_trace(
-                                go.Scatter(
-                                    x=[
-                                        station_data["Temperature [ITS90,°C]"].min(),
-                                        station_data["Temperature [ITS90,°C]"].max(),
-                                    ],
-                                    y=[mld, mld],
-                                    mode="lines",
-                                    line=dict(color=color, dash="dash"),
-                                    name="",  # Empty name to exclude from legend
-                                    hovertemplate=f"MLD: {mld:.2f} m",
-                                    showlegend=False,  # Do not show MLD in legend
-                                )
-                            )
-
-            mld_text = "; ".join(
-                [
-                    f"{station} {season} {year}: {mld:.2f} m"
-                    for station, season, year, mld in mld_values
-                ]
+            # MLD of the selected profiles, in plotting order
+            mld_values = [
+                (station, season, year, mld_lookup[(station, season, year)])
+                for season in selected_season
+                for station in filtered_data["Grid"].unique()
+                for year in selected_year
+                if (station, season, year) in profile_index
+            ]
+
+            def build_mld():
+                fig_mld = go.Figure()
+                for i, (station, season, year, mld) in enumerate(mld_values, start=1):
+                    # Profiles are already sorted by depth
+                    station_data = profile_index.get(station, season, year)
+                    color = px.colors.qualitative.Plotly[
+                        i % len(px.colors.qualitative.Plotly)
+                    ]
+
+                    fig_mld.add_trace(
+                        go.Scatter(
+                            x=station_data["Temperature [ITS90,°C]"],
+                            y=station_data["Depth [m]"],
+                            mode="lines",
+                            name=f"{station} {season} {year}",
+                            line=dict(color=color),
+                        )
+                    )
+
+                    fig_mld.add_trace(
+                        go.Scatter(
+                            x=[
+                                station_data["Temperature [ITS90,°C]"].min(),
+                                station_data["Temperature [ITS90,°C]"].max(),
+                            ],
+                            y=[mld, mld],
+                            mode="lines",
+                            line=dict(color=color, dash="dash"),
+                            name="",  # Empty name to exclude from legend
+                            hovertemplate=f"MLD: {mld:.2f} m",
+                            showlegend=False,  # Do not show MLD in legend
+                        )
+                    )
+
+                fig_mld.update_layout(
+                    title=f"Mixed Layer Depth ({method_label}, referenced at 10 m)",
+                    xaxis_title="Temperature [ITS90,°C]",
+                    yaxis_title="Depth [m]",
+                    yaxis=dict(autorange="reversed"),
+                    width=600,  # Set the width of the scatter plot
+                    height=520,
+                )
+                return fig_mld
+
+            fig_mld = get_figure(
+                "mld",
+                "profiles",
+                build_mld,
+                **selection,
+                method=mld_method,
+                threshold=mld_threshold,
+                bin_size=bin_size,
             )
-            fig_mld.update_layout(
-                title=f"Mixed Layer Depth (0.5°C Threshold)",
-                xaxis_title="Temperature [ITS90,°C]",
-                yaxis_title="Depth [m]",
-                yaxis=dict(autorange="reversed"),
-                width=600,  # Set the width of the scatter plot
-                height=520,
-            )
-
-            st.plotly_chart(fig_mld, config=config_figure)
+            show_figure(fig_mld, "profiles", config=config_figure)
+
+            # Every method is batch-computed and cached, so comparing them for
+            # the selected profiles is only a join
+            if mld_values:
+                profiles = pd.DataFrame(
+                    [(station, season, int(year)) for station, season, year, _ in mld_values],
+                    columns=["Grid", "season", "year"],
+                )
+                comparison = mld_comparison(
+                    profiles,
+                    {
+                        label: get_mld_table(
+                            method, threshold, selected_season, selected_year, bin_size
+                        )
+                        for method, threshold, label in mld_criteria()
+                    },
+                )
+                st.markdown("**MLD [m] by method**")
+                st.dataframe(comparison.round(1), hide_index=True)
     else:
         st.warning(
             "No data selected. Please select at least one grid to visualize the data."
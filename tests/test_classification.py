@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from iep.classification import DENS_COL, SAL_COL, TEMP_COL, WATER_MASS_PRECEDENCE, classify_water_masses
+
+
+def samples(*points):
+    return pd.DataFrame(points, columns=[TEMP_COL, SAL_COL, DENS_COL])
+
+
+def test_first_listed_water_mass_wins_where_boxes_overlap():
+    data = samples(
+        (10.0, 34.8, 26.9),  # LSCW and HSCW share 34.8 psu
+        (5.5, 34.55, 27.4),  # LSAIW and HSAIW overlap between 5 and 6 °C
+        (12.0, 35.0, 27.2),  # HSCW only
+    )
+    assert list(classify_water_masses(data)) == ["LSCW", "LSAIW", "HSCW"]
+    reversed_order = WATER_MASS_PRECEDENCE[::-1]
+    assert list(classify_water_masses(data, precedence=reversed_order)) == ["HSCW", "HSAIW", "HSCW"]
+
+
+def test_samples_outside_every_box_or_incomplete_are_unlabelled():
+    data = samples((25.0, 30.0, 20.0), (10.0, np.nan, 26.9))
+    labels = classify_water_masses(data)
+    assert labels.isna().all()
+    assert list(labels.cat.categories) == WATER_MASS_PRECEDENCE
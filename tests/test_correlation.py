@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from iep.correlation import CORRELATION_VARIABLES, CorrelationStats, station_matrix
+
+
+def samples():
+    # Two stations in two surveys, sampled down to 300 m with a few gaps
+    rng = np.random.default_rng(0)
+    frames = []
+    for grid in ["A", "B"]:
+        for season, year in [("Winter", 2017), ("Summer", 2018)]:
+            depth = np.arange(1.0, 301.0, 2.0)
+            frame = pd.DataFrame({"Grid": grid, "season": season, "year": year, "Depth [m]": depth})
+            frame["Pressure [db]"] = depth * 1.01
+            frame["Temperature [ITS90,°C]"] = 18 - 0.03 * depth + rng.normal(0, 0.3, len(depth))
+            frame["Salinity [psu]"] = 34.6 + 0.001 * depth + rng.normal(0, 0.02, len(depth))
+            frame["Oxygen [ml/l]"] = 5 - 0.01 * depth + rng.normal(0, 0.2, len(depth))
+            frame["Flourescence [mg/m^3]"] = rng.gamma(2.0, 0.3, len(depth))
+            frames.append(frame)
+    data = pd.concat(frames, ignore_index=True)
+    data.loc[data.index % 7 == 0, "Oxygen [ml/l]"] = np.nan
+    data.loc[data.index % 11 == 0, "Salinity [psu]"] = np.nan
+    return data
+
+
+def test_station_matrix_matches_dataframe_corr():
+    data = samples()
+    stats = CorrelationStats(data)
+    stations, matrices = stats.by_station()
+    matrix = station_matrix(stations, matrices, stats.variables, "A")
+    expected = data.loc[data["Grid"] == "A", CORRELATION_VARIABLES].corr()
+    np.testing.assert_allclose(matrix, expected, atol=1e-6)
+
+
+def test_partial_sums_add_up_to_the_full_set():
+    # The sums of the two surveys combine into the matrix of both
+    data = samples()
+    stats = CorrelationStats(data)
+    both = stats.correlation(grids=["A"])
+    for year in [2017, 2018]:
+        survey = data[(data["Grid"] == "A") & (data["year"] == year)]
+        np.testing.assert_allclose(
+            stats.correlation(grids=["A"], years=[year]), survey[CORRELATION_VARIABLES].corr()
+        )
+    np.testing.assert_allclose(both, data.loc[data["Grid"] == "A", CORRELATION_VARIABLES].corr())
+
+
+def test_layer_without_samples_is_nan():
+    data = samples()
+    stats = CorrelationStats(data[data["Depth [m]"] <= 50])
+    stations, matrices = stats.by_station(layer="Below 200 m")
+    assert np.isnan(station_matrix(stations, matrices, stats.variables, "A").to_numpy()).all()
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from iep.mixed_layer import MLD_COL, MLD_METHODS, mld_table
+from iep.profiles import ProfileIndex, sort_profiles
+
+DEPTH = np.arange(0.0, 101.0)
+
+
+def mixed_profile(surface_layer=False):
+    # Mixed to 40 m, then a sharp pycnocline (0.1 kg/m³ in the first metre)
+    # over a weaker one; with ``surface_layer`` a warm, light layer above 5 m
+    temperature = np.where(DEPTH <= 40, 18.0, 18.0 - 0.1 * (DEPTH - 40))
+    density = np.where(DEPTH <= 40, 25.0, 25.1 + 0.01 * (DEPTH - 41))
+    density[DEPTH == 41] = 25.1
+    if surface_layer:
+        temperature = np.where(DEPTH < 5, 25.0, temperature)
+        density = np.where(DEPTH < 5, 23.0, density)
+    return temperature, density
+
+
+def uniform_profile():
+    # Mixed to the bottom: no threshold is ever crossed
+    return np.full(len(DEPTH), 18.0), np.full(len(DEPTH), 25.0)
+
+
+def casts(*profiles):
+    # One cast per (temperature, density) pair, at grids G0, G1, ...
+    frames = [
+        pd.DataFrame(
+            {
+                "Grid": f"G{number}",
+                "season": "Winter",
+                "datetime": pd.Timestamp("2017-07-10"),
+                "Lat (°S)": -32.0,
+                "Lon (°E)": 18.0,
+                "Depth [m]": DEPTH,
+                "Temperature [ITS90,°C]": temperature,
+                "Density Derived [sigma-theta, kg/m^3]": density,
+            }
+        )
+        for number, (temperature, density) in enumerate(profiles)
+    ]
+    return sort_profiles(pd.concat(frames, ignore_index=True))
+
+
+def starts_of(data):
+    return ProfileIndex(data).table()["start"].to_numpy()
+
+
+# Expected MLD of mixed_profile() per method and threshold
+EXPECTED = [
+    ("Temperature threshold", 0.5, 45.0),
+    ("Temperature threshold", 0.2, 42.0),
+    ("Density threshold", 0.03, 40.3),
+    ("Density threshold", 0.125, 43.5),
+    ("Maximum gradient", None, 40.5),
+    ("Hybrid", 0.03, 40.3),
+    ("Hybrid", 0.125, 40.5),
+]
+
+
+def test_every_method_is_covered():
+    assert {method for method, _, _ in EXPECTED} == set(MLD_METHODS)
+
+
+@pytest.mark.parametrize("method, threshold, expected", EXPECTED)
+def test_known_mld(method, threshold, expected):
+    data = casts(mixed_profile())
+    mld = MLD_METHODS[method](data, starts_of(data), threshold)
+    np.testing.assert_allclose(mld, [expected])
+
+
+@pytest.mark.parametrize("method, threshold, expected", EXPECTED)
+def test_layer_above_reference_depth_is_ignored(method, threshold, expected):
+    # Values are taken relative to 10 m, so a surface layer does not move it
+    data = casts(mixed_profile(surface_layer=True))
+    mld = MLD_METHODS[method](data, starts_of(data), threshold)
+    np.testing.assert_allclose(mld, [expected])
+
+
+@pytest.mark.parametrize(
+    "method, threshold",
+    [("Temperature threshold", 0.5), ("Density threshold", 0.03), ("Hybrid", 0.03)],
+)
+def test_profile_that_never_crosses_is_mixed_to_the_bottom(method, threshold):
+    data = casts(uniform_profile())
+    mld = MLD_METHODS[method](data, starts_of(data), threshold)
+    np.testing.assert_allclose(mld, [DEPTH[-1]])
+
+
+def test_mld_table_computes_every_profile_at_once():
+    data = casts(mixed_profile(), mixed_profile(surface_layer=True), uniform_profile())
+    table = mld_table(ProfileIndex(data), "Temperature threshold", 0.5)
+    assert list(table["Grid"]) == ["G0", "G1", "G2"]
+    np.testing.assert_allclose(table[MLD_COL], [45.0, 45.0, 100.0])
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from iep.mixed_layer import mld_table
+from iep.profiles import ProfileIndex, bin_profiles, sort_profiles
+
+
+def casts_with_undated_block():
+    # Two dated casts at grids A and B, and an undated block inside grid A
+    depth = np.tile(np.arange(1.0, 31.0), 3)
+    return pd.DataFrame(
+        {
+            "Grid": np.repeat(["A", "A", "B"], 30),
+            "season": "Winter",
+            "datetime": pd.to_datetime(np.repeat(["2017-07-10", None, "2017-07-11"], 30)),
+            "Lat (°S)": -32.0,
+            "Lon (°E)": 18.0,
+            "Depth [m]": depth,
+            "Temperature [ITS90,°C]": 18.0 - 0.2 * depth,
+            "Density Derived [sigma-theta, kg/m^3]": 25.0 + 0.05 * depth,
+        }
+    )
+
+
+def test_undated_rows_go_last():
+    data = sort_profiles(casts_with_undated_block())
+    assert data["datetime"].iloc[-30:].isna().all()
+    assert data["datetime"].iloc[:-30].notna().all()
+    assert list(ProfileIndex(data).table()["stop"]) == [30, 60]
+
+
+def test_mld_and_bins_skip_undated_rows():
+    data = sort_profiles(casts_with_undated_block())
+    assert len(mld_table(ProfileIndex(data))) == 2
+    assert len(bin_profiles(data, 5.0)) == 14
+
+
+def test_bins_above_the_surface_stay_in_their_cast():
+    # Cast B starts at -0.6 m, which rounds to the bin above the surface
+    data = sort_profiles(casts_with_undated_block().dropna(subset=["datetime"]))
+    data.loc[data["Grid"] == "B", "Depth [m]"] -= 1.6
+    binned = bin_profiles(data, 1.0)
+    cast_a = binned[binned["Grid"] == "A"]
+    assert len(cast_a) == 30
+    assert cast_a["Temperature [ITS90,°C]"].iloc[-1] == 18.0 - 0.2 * 30
+    assert binned.loc[binned["Grid"] == "B", "Depth [m]"].min() == -1.0
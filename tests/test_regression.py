@@ -0,0 +1,67 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from iep.regression import fit_groups, ols_by_group, predict_with_band
+
+
+def groups():
+    # Three noisy lines, a single point and a group with constant x
+    rng = np.random.default_rng(0)
+    frames = []
+    for name, slope, intercept, n in [("A", 2.0, 1.0, 50), ("B", -0.5, 30.0, 20), ("C", 0.1, -3.0, 5)]:
+        x = rng.uniform(0, 10, n)
+        y = slope * x + intercept + rng.normal(0, 0.5, n)
+        frames.append(pd.DataFrame({"group": name, "x": x, "y": y}))
+    frames.append(pd.DataFrame({"group": "single", "x": [1.0], "y": [2.0]}))
+    frames.append(pd.DataFrame({"group": "constant", "x": [4.0, 4.0, 4.0, 4.0], "y": [1.0, 2.0, 3.0, 4.0]}))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize("name", ["A", "B", "C"])
+def test_fit_matches_statsmodels(name):
+    data = groups()
+    fit = fit_groups(data, "x", "y", "group").loc[name]
+    points = data[data["group"] == name]
+    model = sm.OLS(points["y"], sm.add_constant(points["x"])).fit()
+
+    assert fit["n"] == len(points)
+    np.testing.assert_allclose(fit["intercept"], model.params["const"])
+    np.testing.assert_allclose(fit["slope"], model.params["x"])
+    np.testing.assert_allclose(fit["r_squared"], model.rsquared)
+    np.testing.assert_allclose(fit["intercept_se"], model.bse["const"])
+    np.testing.assert_allclose(fit["slope_se"], model.bse["x"])
+
+    x_pred = np.linspace(points["x"].min(), points["x"].max(), 7)
+    y_pred, lower, upper = predict_with_band(fit, x_pred)
+    band = model.get_prediction(sm.add_constant(x_pred)).conf_int(alpha=0.05)
+    np.testing.assert_allclose(y_pred, model.predict(sm.add_constant(x_pred)))
+    np.testing.assert_allclose(lower, band[:, 0])
+    np.testing.assert_allclose(upper, band[:, 1])
+
+
+@pytest.mark.parametrize("name", ["single", "constant"])
+def test_undefined_fits_are_nan(name):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # no division warnings either
+        fits = fit_groups(groups(), "x", "y", "group")
+        fit = fits.loc[name]
+        y_pred, lower, upper = predict_with_band(fit, [1.0, 2.0])
+    assert np.isnan(fit[["slope", "r_squared", "slope_se"]].astype(float)).all()
+    assert np.isnan(lower).all() and np.isnan(upper).all()
+    assert not np.isnan(fits.loc["A", "slope"])
+
+
+def test_groups_are_fitted_independently():
+    # One call with group numbers gives the same fits as one call per group
+    data = groups()
+    codes, names = pd.factorize(data["group"])
+    together = ols_by_group(data["x"], data["y"], codes, len(names))
+    for number, name in enumerate(names):
+        points = data[data["group"] == name]
+        alone = ols_by_group(points["x"], points["y"], np.zeros(len(points), dtype=int), 1)
+        np.testing.assert_allclose(together["slope"][number], alone["slope"][0])
+        np.testing.assert_allclose(together["intercept"][number], alone["intercept"][0])
@@ -1,13 +1,20 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import numpy as np
-import plotly.io as pio
-import gsw
-
-pio.kaleido.scope.default_format = "svg"
-from functions import config_figure
+from functions import (
+    calculate_isopycnals,
+    cast_hover_data,
+    config_figure,
+    get_cast_table,
+    get_figure,
+    get_selection,
+    show_figure,
+    span,
+)
+from iep.classification import LABEL_COL, WATER_MASSES, water_mass_summary
+from iep.filters import select
+from iep.isopycnals import ISOPYCNAL_RESOLUTIONS, isopycnal_bounds
+from iep.lod import DEFAULT_MAX_POINTS, MAX_POINTS_OPTIONS, density_bin, scatter_trace_type
 
 from css import app_css  # Import CSS as a string
 
@@ -19,32 +26,24 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Access the shared data from session state
-data = st.session_state.get("data")
+# One row per cast in the data store: the grid options, and the map
+casts = get_cast_table()
 
-if data is None:
+if casts.empty:
     st.error(
-        "Data not found in session state. Please load data in the main application."
+        "No CTD casts in the data store. Add the IEP workbooks to the data folder."
     )
 else:
-    # Cache the data transformation
-    @st.cache_data
-    def transform_data(df):
-        df["Lat (°S)"] = df["Lat (°S)"].apply(lambda x: -abs(x))
-        return df
-
-    data = transform_data(data)
-
     # Initialize session state for sidebar filters if not already set
     if "grids_selected" not in st.session_state:
         default_station = (
-            "NML10" if "NML10" in data["Grid"].unique() else data["Grid"].unique()[0]
+            "NML10" if "NML10" in casts["Grid"].unique() else casts["Grid"].unique()[0]
         )
         st.session_state.grids_selected = [default_station]
 
     # Sidebar filters
     st.sidebar.header("Filter data")
-    grid_options = ["All Stations"] + list(data["Grid"].unique())
+    grid_options = ["All Stations"] + list(casts["Grid"].unique())
 
     # Multiselect widget with session state
     grids_selected = st.sidebar.multiselect(
@@ -54,16 +53,44 @@ else:
     # Update session state
     st.session_state.grids_selected = grids_selected
 
-    # Cache the "All Stations" data
-    @st.cache_data
-    def get_all_stations_data(df):
-        return df
+    isopycnal_resolution = st.sidebar.select_slider(
+        "Isopycnal grid resolution",
+        options=list(ISOPYCNAL_RESOLUTIONS),
+        value="Coarse",
+    )
+    sal_step, temp_step = ISOPYCNAL_RESOLUTIONS[isopycnal_resolution]
+
+    color_by = st.sidebar.radio("Colour samples by", ["Pressure", "Water mass"])
+    max_points = st.sidebar.select_slider(
+        "Max points per chart",
+        options=MAX_POINTS_OPTIONS,
+        value=DEFAULT_MAX_POINTS,
+        help="Larger selections are binned in T-S space to this many points",
+    )
+    water_masses_selected = st.sidebar.multiselect(
+        "Show water mass(es)",
+        [wm["abbreviation"] for wm in WATER_MASSES],
+        help="Leave empty to show all samples",
+    )
 
-    # Filter data based on selection
-    if "All Stations" in st.session_state.grids_selected:
-        filtered_data = get_all_stations_data(data)
-    else:
-        filtered_data = data[data["Grid"].isin(st.session_state.grids_selected)]
+    # Only the selected grids are read from the store ("All Stations" reads
+    # every cast); the water mass filter then applies to those samples
+    bin_size = st.session_state.get("bin_size")
+    grids = (
+        None
+        if "All Stations" in st.session_state.grids_selected
+        else st.session_state.grids_selected
+    )
+    with span("load selection"):
+        grid_data = get_selection(grids=grids, bin_size=bin_size)
+        filtered_data = select(grid_data, water_masses=water_masses_selected or None)
+
+    # Figures are cached across sessions under the normalised selection
+
+    def cached_figure(name, build, **options):
+        return get_figure(
+            "watermasses", name, build, grids=st.session_state.grids_selected, **options
+        )
 
     # Layout
     col1, col2 = st.columns(
@@ -72,245 +99,197 @@ else:
 
     if not filtered_data.empty:
         with col1:
-            fig_map = px.scatter_mapbox(
-                filtered_data,
-                lat="Lat (°S)",
-                lon="Lon (°E)",
-                hover_name="Grid",
-                zoom=4.5,
-                height=600,
-            )
-            fig_map.update_layout(
-                mapbox_style="open-street-map",
-                mapbox_center={"lat": -33.0, "lon": 17.0},
-            )
-            fig_map.update_traces(
-                marker=dict(size=4, symbol="circle", opacity=0.7, color="black")
-            )
-            st.plotly_chart(fig_map, use_container_width=True)
-
-        with col2:
-            # Water Mass Classification Plot
-
-            fig_wm = go.Figure()
-
-            if not filtered_data.empty:
-                # Cache the isopycnals calculation
-                @st.cache_data
-                def calculate_isopycnals(filtered_data):
-                    t_min = filtered_data["Temperature [ITS90,°C]"].min() - 1
-                    t_max = filtered_data["Temperature [ITS90,°C]"].max() + 1
-                    s_min = filtered_data["Salinity [psu]"].min() - 1
-                    s_max = filtered_data["Salinity [psu]"].max() + 1
-
-                    xdim = int(np.ceil((s_max - s_min) / 0.1))
-                    ydim = int(np.ceil(t_max - t_min))
-                    dens = np.zeros((ydim, xdim))
-
-                    ti = np.linspace(t_min, t_max, ydim)
-                    si = np.linspace(s_min, s_max, xdim)
-
-                    for j in range(ydim):
-                        for i in range(xdim):
-                            dens[j, i] = gsw.rho(si[i], ti[j], 0)
-
-                    dens = dens - 1000
+            # One marker per cast rather than per CTD scan
+            map_casts = select(casts, grids=grids)
+
+            def build_map():
+                fig_map = px.scatter_mapbox(
+                    map_casts,
+                    lat="Lat (°S)",
+                    lon="Lon (°E)",
+                    hover_name="Grid",
+                    hover_data=cast_hover_data,
+                    zoom=4.5,
+                    height=600,
+                )
+                fig_map.update_layout(
+                    mapbox_style="open-street-map",
+                    mapbox_center={"lat": -33.0, "lon": 17.0},
+                )
+                fig_map.update_traces(
+                    marker=dict(size=4, symbol="circle", opacity=0.7, color="black")
+                )
+                return fig_map
 
-                    return si, ti, dens
+            fig_map = cached_figure("map", build_map)
+            show_figure(fig_map, "map", use_container_width=True)
 
-                si, ti, dens = calculate_isopycnals(filtered_data)
+        with col2:
+            # Water mass labels are computed once at load time, so
+            # annotations and counts are a single groupby
+            with span("water mass summary"):
+                summary = water_mass_summary(filtered_data)
 
-                # Add isopycnals to the plot
-                fig_wm.add_trace(
-                    go.Contour(
-                        x=si,
-                        y=ti,
-                        z=dens,
-                        contours_coloring="lines",
-                        showscale=False,  # Hide the colorbar for isopycnals
-                        contours=dict(
-                            start=dens.min(),
-                            end=dens.max(),
-                            size=0.5,
-                            showlabels=True,  # show labels on contours
-                            labelfont=dict(  # label font properties
-                                size=12,
-                                color="black",
-                            ),
-                        ),
-                        name="Isopycnals",
+            # Water Mass Classification Plot
+            def build_ts():
+                fig_wm = go.Figure()
+
+                if not filtered_data.empty:
+                    si, ti, dens = calculate_isopycnals(
+                        *isopycnal_bounds(filtered_data, sal_step, temp_step),
+                        sal_step=sal_step,
+                        temp_step=temp_step,
                     )
-                )
 
-                # Combine all stations into one trace to use a single colorbar
-                fig_wm.add_trace(
-                    go.Scatter(
-                        x=filtered_data["Salinity [psu]"],
-                        y=filtered_data["Temperature [ITS90,°C]"],
-                        mode="markers",
-                        marker=dict(
-                            color=filtered_data["Pressure [db]"],
-                            colorscale="spectral",  # Use the 'spectral' colormap
-                            colorbar=dict(
-                                title=dict(
-                                    text="Pressure [db]",
-                                    side="bottom",  # Place the title below the colorbar
+                    # Add isopycnals to the plot
+                    fig_wm.add_trace(
+                        go.Contour(
+                            x=si,
+                            y=ti,
+                            z=dens,
+                            contours_coloring="lines",
+                            showscale=False,  # Hide the colorbar for isopycnals
+                            contours=dict(
+                                start=dens.min(),
+                                end=dens.max(),
+                                size=0.5,
+                                showlabels=True,  # show labels on contours
+                                labelfont=dict(  # label font properties
+                                    size=12,
+                                    color="black",
                                 ),
-                                orientation="h",
-                                x=0.5,
-                                y=-0.4,  # Adjust the position to move the colorbar further from the map
                             ),
-                            size=3,
-                        ),
-                        name="Stations",
+                            name="Isopycnals",
+                        )
                     )
-                )
 
-                # Water Mass Classification Annotations
-                box_conditions = [
-                    {
-                        "name": "Antarctic Bottom Water",
-                        "abbreviation": "ABW",
-                        "temp_min": -2,
-                        "temp_max": 2,
-                        "sal_min": 34.6,
-                        "sal_max": 34.8,
-                        "dens_min": 27.9,
-                        "dens_max": np.inf,
-                        "color": "Black",
-                    },
-                    {
-                        "name": "North Atlantic Deep Water",
-                        "abbreviation": "NADW",
-                        "temp_min": 2,
-                        "temp_max": 4,
-                        "sal_min": 34.9,
-                        "sal_max": 35.0,
-                        "dens_min": 27.8,
-                        "dens_max": np.inf,
-                        "color": "Black",
-                    },
-                    {
-                        "name": "Low Salinity Antarctic Intermediate Water",
-                        "abbreviation": "LSAIW",
-                        "temp_min": 3,
-                        "temp_max": 6,
-                        "sal_min": 34.3,
-                        "sal_max": 34.6,
-                        "dens_min": 27.2,
-                        "dens_max": 27.5,
-                        "color": "Black",
-                    },
-                    {
-                        "name": "High Salinity Antarctic Intermediate Water",
-                        "abbreviation": "HSAIW",
-                        "temp_min": 5,
-                        "temp_max": 10,
-                        "sal_min": 34.5,
-                        "sal_max": 35.0,
-                        "dens_min": 27.3,
-                        "dens_max": 27.6,
-                        "color": "Black",
-                    },
-                    {
-                        "name": "Low Salinity Central Water",
-                        "abbreviation": "LSCW",
-                        "temp_min": 8,
-                        "temp_max": 15,
-                        "sal_min": 34.3,
-                        "sal_max": 34.8,
-                        "dens_min": 26.5,
-                        "dens_max": 27.0,
-                        "color": "Black",
-                    },
-                    {
-                        "name": "High Salinity Central Water",
-                        "abbreviation": "HSCW",
-                        "temp_min": 8,
-                        "temp_max": 15,
-                        "sal_min": 34.8,
-                        "sal_max": 35.5,
-                        "dens_min": 26.8,
-                        "dens_max": 27.4,
-                        "color": "Black",
-                    },
-                    {
-                        "name": "Modified Upwelled Water",
-                        "abbreviation": "MUW",
-                        "temp_min": 15,
-                        "temp_max": 20,
-                        "sal_min": 35.0,
-                        "sal_max": 36.0,
-                        "dens_min": 25.8,
-                        "dens_max": 26.5,
-                        "color": "Black",
-                    },
-                    {
-                        "name": "Oceanic Surface Water",
-                        "abbreviation": "OSW",
-                        "temp_min": 20,
-                        "temp_max": 30,
-                        "sal_min": 34.5,
-                        "sal_max": 36.5,
-                        "dens_min": 24.0,
-                        "dens_max": 25.5,
-                        "color": "Black",
-                    },
-                ]
+                    # Large selections are binned in T-S space before they are sent
+                    # to the browser, and drawn with WebGL
+                    labels = filtered_data[LABEL_COL].cat.add_categories(
+                        "Unclassified"
+                    ).fillna("Unclassified")
+                    plot_data = density_bin(
+                        filtered_data.assign(**{LABEL_COL: labels}),
+                        "Salinity [psu]",
+                        "Temperature [ITS90,°C]",
+                        max_points,
+                        mean_cols=["Pressure [db]"],
+                        by=LABEL_COL if color_by == "Water mass" else None,
+                    )
+                    Scatter = scatter_trace_type(len(plot_data))
+                    hovertemplate = (
+                        "S: %{x:.3f}<br>T: %{y:.3f}<br>Samples: %{customdata}"
+                    )
 
-                for condition in box_conditions:
-                    # Filter the data to match the water mass condition
-                    condition_data = filtered_data[
-                        (
-                            filtered_data["Temperature [ITS90,°C]"]
-                            >= condition["temp_min"]
-                        )
-                        & (
-                            filtered_data["Temperature [ITS90,°C]"]
-                            <= condition["temp_max"]
-                        )
-                        & (filtered_data["Salinity [psu]"] >= condition["sal_min"])
-                        & (filtered_data["Salinity [psu]"] <= condition["sal_max"])
-                        & (
-                            filtered_data["Density Derived [sigma-theta, kg/m^3]"]
-                            >= condition["dens_min"]
-                        )
-                        & (
-                            filtered_data["Density Derived [sigma-theta, kg/m^3]"]
-                            <= condition["dens_max"]
+                    if color_by == "Water mass":
+                        # One trace per water mass so each gets a legend entry
+                        for abbrev, wm_data in plot_data.groupby(
+                            LABEL_COL, observed=True, sort=True
+                        ):
+                            fig_wm.add_trace(
+                                Scatter(
+                                    x=wm_data["Salinity [psu]"],
+                                    y=wm_data["Temperature [ITS90,°C]"],
+                                    mode="markers",
+                                    marker=dict(size=3),
+                                    customdata=wm_data["count"],
+                                    hovertemplate=hovertemplate,
+                                    name=abbrev,
+                                )
+                            )
+                    else:
+                        # Combine all stations into one trace to use a single colorbar
+                        fig_wm.add_trace(
+                            Scatter(
+                                x=plot_data["Salinity [psu]"],
+                                y=plot_data["Temperature [ITS90,°C]"],
+                                mode="markers",
+                                customdata=plot_data["count"],
+                                hovertemplate=hovertemplate,
+                                marker=dict(
+                                    color=plot_data["Pressure [db]"],
+                                    colorscale="spectral",  # Use the 'spectral' colormap
+                                    colorbar=dict(
+                                        title=dict(
+                                            text="Pressure [db]",
+                                            side="bottom",  # Place the title below the colorbar
+                                        ),
+                                        orientation="h",
+                                        x=0.5,
+                                        y=-0.4,  # Adjust the position to move the colorbar further from the map
+                                    ),
+                                    size=3,
+                                ),
+                                name="Stations",
+                            )
                         )
-                    ]
-
-                    if not condition_data.empty:
-                        # Calculate the average position for annotation
-                        avg_sal = condition_data["Salinity [psu]"].mean()
-                        avg_temp = condition_data["Temperature [ITS90,°C]"].mean()
 
+                    colors = {wm["abbreviation"]: wm["color"] for wm in WATER_MASSES}
+                    for abbrev, row in summary.iterrows():
                         # Add a single annotation at the average position
                         fig_wm.add_annotation(
-                            x=avg_sal,
-                            y=avg_temp,
-                            text=f"<b>{condition['abbreviation']}</b>",
+                            x=row["mean_sal"],
+                            y=row["mean_temp"],
+                            text=f"<b>{abbrev}</b>",
                             showarrow=False,
-                            font=dict(size=12, color=condition["color"]),
+                            font=dict(size=12, color=colors[abbrev]),
                             xanchor="center",
                             yanchor="bottom",
                         )
 
-            fig_wm.update_layout(
-                title="Water Mass Classification",
-                xaxis_title=dict(text="Salinity [psu]", font=dict(color="black")),
-                yaxis_title=dict(
-                    text="Temperature [ITS90,°C]", font=dict(color="black")
-                ),
-                width=800,  # Set the width of the scatter plot
-                height=600,
-                showlegend=False,  # Ensure legend is displayed for stations
+                fig_wm.update_layout(
+                    title="Water Mass Classification",
+                    xaxis_title=dict(text="Salinity [psu]", font=dict(color="black")),
+                    yaxis_title=dict(
+                        text="Temperature [ITS90,°C]", font=dict(color="black")
+                    ),
+                    width=800,  # Set the width of the scatter plot
+                    height=600,
+                    # Legend only lists water masses when colouring by them
+                    showlegend=color_by == "Water mass",
+                )
+                return fig_wm
+
+            fig_wm = cached_figure(
+                "ts",
+                build_ts,
+                water_masses=water_masses_selected,
+                color_by=color_by,
+                resolution=isopycnal_resolution,
+                max_points=max_points,
+                bin_size=bin_size,
+            )
+            show_figure(fig_wm, "ts")
+            n_markers = sum(
+                len(trace.x)
+                for trace in fig_wm.data
+                if getattr(trace, "mode", None) == "markers"
             )
+            if n_markers < len(filtered_data):
+                st.caption(
+                    f"{len(filtered_data):,} samples shown as {n_markers:,} "
+                    "T-S bins (mean position; hover for sample counts)"
+                )
 
-            st.plotly_chart(fig_wm)
+            # Per water mass counts for the current selection
+            st.dataframe(
+                summary.rename(
+                    columns={
+                        "name": "Water mass",
+                        "samples": "Samples",
+                        "share": "Share of samples [%]",
+                        "mean_sal": "Mean Salinity [psu]",
+                        "mean_temp": "Mean Temperature [ITS90,°C]",
+                    }
+                ),
+                use_container_width=True,
+            )
 
-    else:
+    elif grid_data.empty:
         st.warning(
             "No data selected. Please select at least one grid to visualize the data."
         )
+    else:
+        st.warning(
+            "No samples in the selected water masses. Select other water masses or grids."
+        )